@@ -3,11 +3,14 @@
 backfill_heb_screens.py – מסנכרן נתוני מסכים ל-feature_store_heb.duckdb
 
 שימוש:
-    python backfill_heb_screens.py YYYY-MM YYYY-MM
+    python backfill_heb_screens.py YYYY-MM YYYY-MM [ENTITY ...] [--concurrency 4] [--refresh-metadata]
+            [--storage parquet] [--from-landing | --no-landing]
     (לדוגמה: 2023-01 2023-12)
 
 הסקריפט טוען את מטא-דאטה OData כדי למפות שמות שדות לתיאורים בעברית,
-ולאחר מכן מושך ברצף את הנתונים של המסכים:
+ולאחר מכן מושך את הנתונים של המסכים – כמה (מסך, חודש) במקביל
+(fetch_scheduler), עם כותב יחיד ל-DuckDB. החלונות נקבעים לפי $count
+(time_windows) – חודשים שקטים מתאחדים, חודש עמוס מתפצל לשבועות/ימים:
     • FNCLOG                  (לפי FNCDATE)
     • PURCHASEINVOICEITEMS    (לפי IVDATE)
     • AGENTORDERSWAREA        (לפי CURDATE)
@@ -15,16 +18,37 @@ backfill_heb_screens.py – מסנכרן נתוני מסכים ל-feature_store_
 
 בכל הרצה תימחק התקופה המבוקשת מהטבלה וטעון מידע חדש. אם הטבלה אינה קיימת –
 היא תיווצר אוטומטית עם שמות עמודות בעברית ללא רווחים (קו תחתון מפריד).
+עם --storage parquet כל (מסך, חודש) נכתב כמחיצת Parquet ומוחלף אטומית
+(parquet_store); בקובץ ה-DuckDB נשאר VIEW באותו שם עברי.
+כל עמוד נשמר גם באזור הנחיתה (landing, לפני התרגום לעברית); אחרי שינוי
+מיפוי העמודות --from-landing בונה את הטבלאות מחדש מהקבצים, בלי Priority.
+הכתיבה היא לעותק של feature_store_heb.duckdb שמתפרסם רק בסוף (snapshot.py) –
+השרת לא ננעל וכשל באמצע לא משאיר קובץ חצי-מעודכן.
 """
-import sys, os, pathlib, re, datetime as dt, urllib.parse, time, requests, xml.etree.ElementTree as ET
-import duckdb, pandas as pd, dotenv
+import os, sys, pathlib, argparse, datetime as dt, urllib.parse
+import duckdb, dotenv
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))   # profile_store (SERVER/)
+from priority_client import PriorityClient
+from odata_pager import iter_pages, table_exists
+from odata_metadata import EdmModel, load_metadata, normalize_desc
+from fetch_scheduler import DEFAULT_CONCURRENCY, FetchUnit, month_units, run_units
+from key_ranges import split_units, verify, loading_table, swap_in
+from time_windows import plan_windows, window_filter
+from parquet_store import attach_table, write_window
+from landing import Landing
+from profile_store import narrow_database, widen_to_fit
+import snapshot
+import etl_metrics
+from etl_metrics import span
 
 dotenv.load_dotenv()
 
 FEATURE_DB = pathlib.Path(r"C:\RIT\AIBI\feature_store_heb.duckdb")
 PRIO       = os.environ["PRIORITY_URL"].rstrip("/")
 AUTH       = (os.environ["PRIORITY_USER"], os.environ["PRIORITY_PASS"])
-TZ_OFFSET  = "+02:00"  # Israel
+PRIO_CLIENT = PriorityClient(AUTH)
+PARQUET_ROOT = FEATURE_DB.with_name("heb_parquet")
+LANDING_ROOT = FEATURE_DB.with_name("landing")
 
 # ---------------- mapping: entity → (date_field, hebrew_table_name) ---------
 SCREENS = {
@@ -37,6 +61,11 @@ SCREENS = {
     "TRANSORDER_DN":        ("CURDATE",               "שורות_תעודות_משלוח_החזרה"),
 }
 
+# מסכים בטעינה מלאה – עמודת מפתח לפיצול לטווחים לפי $count (key_ranges)
+SPLIT_KEYS = {
+    "ACCOUNTS_GENERAL":     "ACCNAME",
+}
+
 # ------- helper to build OData URL (similar to odata_to_raw.py) ---------
 SELECT_FIELDS: dict[str, list[str]] = {}
 
@@ -45,7 +74,6 @@ def build_url(entity: str, extra_q: str = "") -> str:
     sel = SELECT_FIELDS.get(entity.upper(), [])
     if sel:
         parts.append(f"$select={','.join(sel)}")
-    parts.append("$top=100000")
     if extra_q:
         parts.append(extra_q.lstrip("&?"))
     return f"{PRIO}/{entity}?{'&'.join(parts)}"
@@ -55,64 +83,12 @@ def build_url(entity: str, extra_q: str = "") -> str:
 # ----------------------------------------------------------------------------
 META_URL = f"{PRIO}/$metadata"
 
-_desc_term = "{Priority.OData.Description}"
-_prop_tag  = "{http://docs.oasis-open.org/odata/ns/edm}Property"
-_entity_tag= "{http://docs.oasis-open.org/odata/ns/edm}EntityType"
-
-
-def normalize_desc(desc: str) -> str:
-    """ממיר תיאור עברי לשם עמודה חוקי: רווחים → _, מוריד גרשיים"""
-    name = re.sub(r"\s+", "_", desc.strip())
-    return name.replace("\"", "").replace("'", "")
-
-
-def fetch_metadata(retries: int = 4, delay: int = 5) -> dict[str, dict[str, str]]:
-    """מחזיר {entity: {orig_col: hebrew_col}} עם retry ל-5xx"""
-    for attempt in range(1, retries + 1):
-        try:
-            print(f"URL {META_URL}  (try {attempt}/{retries})")
-            r = requests.get(META_URL, auth=AUTH, timeout=180)
-            r.raise_for_status()
-            break  # success
-        except requests.exceptions.HTTPError as exc:
-            if 500 <= exc.response.status_code < 600 and attempt < retries:
-                print(f"[WARN] metadata HTTP {exc.response.status_code} – retrying in {delay}s…")
-                time.sleep(delay)
-                continue
-            raise
-    tree = ET.fromstring(r.text)
-
-    mapping: dict[str, dict[str, str]] = {}
-    # חיפוש כל EntityType
-    for et in tree.findall(f".//{_entity_tag}"):
-        entity = et.attrib.get("Name")
-        if entity is None:
-            continue
-        cols: dict[str, str] = {}
-        for prop in et.findall(_prop_tag):
-            orig_name = prop.attrib.get("Name")
-            if orig_name is None:
-                continue
-            hebrew: str | None = None
-            for ann in prop.findall("*[@Term='Priority.OData.Description']"):
-                hebrew = ann.attrib.get("String")
-                if hebrew:
-                    break
-            if not hebrew:
-                continue  # אין תיאור עברי – מדלג
-            norm = normalize_desc(hebrew)
-            # מניעת כפילויות
-            base = norm
-            idx = 1
-            while norm in cols.values():
-                idx += 1
-                norm = f"{base}_{idx}"
-
-            key_name = str(orig_name)
-            cols[key_name] = norm
-        if cols:
-            mapping[entity] = cols
-    return mapping
+METADATA_CACHE = FEATURE_DB.with_name("odata_metadata.json")
+
+
+def fetch_metadata(refresh: bool = False) -> EdmModel:
+    """.hebrew = {entity: {orig_col: hebrew_col}},  .types = טיפוסי EDM (odata_metadata)"""
+    return load_metadata(PRIO_CLIENT, META_URL, METADATA_CACHE, refresh=refresh)
 
 
 # ----------------------------------------------------------------------------
@@ -134,42 +110,69 @@ def months_range(start: str, end: str):
 #                                 שליפה אחת
 # ----------------------------------------------------------------------------
 
-def month_filter(date_col: str, y: int, m: int) -> str:
-    start = dt.date(y, m, 1)
-    nextm = (start + dt.timedelta(days=32)).replace(day=1)
-    s = f"{start}T00:00:00{TZ_OFFSET}"
-    e = f"{nextm}T00:00:00{TZ_OFFSET}"
-    return f"({date_col} ge {s} and {date_col} lt {e})"
-
-
-def fetch_month(entity: str, date_col: str, y: int, m: int) -> pd.DataFrame:
-    filt = urllib.parse.quote_plus(month_filter(date_col, y, m))
-    url = f"{PRIO}/{entity}?$filter={filt}&$top=100000"
-    print("URL", url)
-    r = requests.get(url, auth=AUTH, timeout=180)
-    r.raise_for_status()
-    return pd.DataFrame(r.json().get("value", []))
+def window_pages(entity: str, date_col: str, start: dt.date, end: dt.date,
+                 types: dict[str, str] | None = None, land: Landing | None = None,
+                 keys: list[str] | None = None):
+    """עמודים (pyarrow.Table לכל עמוד) של חלון [start, end) – ראה odata_pager.iter_pages"""
+    filt  = urllib.parse.quote_plus(window_filter(date_col, start, end))
+    url   = build_url(entity, f"$filter={filt}")
+    pages = iter_pages(url, PRIO_CLIENT, types=types, order_by=keys)
+    if land is None:
+        return pages
+    return land.capture(FetchUnit(entity, start, end), url, pages, date_col=date_col,
+                        select=SELECT_FIELDS.get(entity))
 
 
 # ----------------------------------------------------------------------------
 #                               תהליך ראשי
 # ----------------------------------------------------------------------------
 
-def main():
-    if len(sys.argv) < 3:
-        print("usage: python backfill_heb_screens.py YYYY-MM YYYY-MM [ENTITY ...]")
-        sys.exit(1)
-    start, end = sys.argv[1:3]
+def main(argv: list[str] | None = None):
+    ap = argparse.ArgumentParser(description="backfill Priority screens → feature_store_heb.duckdb")
+    ap.add_argument("start", help="YYYY-MM")
+    ap.add_argument("end",   help="YYYY-MM")
+    ap.add_argument("entities", nargs="*", help="optional subset of SCREENS")
+    ap.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                    help="(entity, month) units fetched in parallel")
+    ap.add_argument("--refresh-metadata", action="store_true",
+                    help="ignore the local $metadata cache")
+    ap.add_argument("--storage", choices=["table", "parquet"], default="table",
+                    help="parquet = one Parquet partition per (screen, month) under heb_parquet/")
+    ap.add_argument("--from-landing", action="store_true",
+                    help="rebuild from the landing zone instead of calling Priority")
+    ap.add_argument("--no-landing", action="store_true",
+                    help="do not save fetched pages to the landing zone")
+    etl_metrics.add_cli(ap)
+    args = ap.parse_args(argv)
+
+    # כותבים לעותק (snapshot) – השרת ממשיך לקרוא את הגרסה שפורסמה
+    with snapshot.staging(FEATURE_DB) as db, \
+            etl_metrics.run("backfill_heb_screens", db, profile=args.profile):
+        backfill(args, db)
+    print(PRIO_CLIENT.summary())
+    print("DONE backfill finished ->", FEATURE_DB)
+
 
+def backfill(args: argparse.Namespace, db: pathlib.Path = FEATURE_DB):
     target_entities: set[str] | None = None
-    if len(sys.argv) > 3:
-        target_entities = {e.upper() for e in sys.argv[3:]}
+    if args.entities:
+        target_entities = {e.upper() for e in args.entities}
 
     # 1. מטא-דאטה
-    meta_map = fetch_metadata()
-
-    duck = duckdb.connect(str(FEATURE_DB))
-
+    with span("metadata"):
+        meta = fetch_metadata(refresh=args.refresh_metadata)
+    meta_map = meta.hebrew
+
+    # 2. תכנון: אילו יחידות למשוך ולאן לכתוב כל אחת
+    parquet = args.storage == "parquet"
+    replay = args.from_landing
+    land = None if args.no_landing and not replay else Landing(LANDING_ROOT)
+    months = list(months_range(args.start, args.end))
+    first = dt.date(*months[0], 1) if months else None
+    end = (dt.date(*months[-1], 1) + dt.timedelta(days=32)).replace(day=1) if months else None
+    expected: dict[FetchUnit, int | None] = {}
+    renames: dict[str, dict[str, str]] = {}
+    full_loads: dict[str, tuple[int | None, dict[FetchUnit, int]]] = {}
     for entity, (date_col, hebrew_table) in SCREENS.items():
         if target_entities and entity.upper() not in target_entities:
             continue
@@ -177,61 +180,121 @@ def main():
             print(f"[WARN] metadata for {entity} not found – skipping")
             continue
         col_map = meta_map[entity]
-
-        # אם אין עמודת תאריך → שליפה מלאה一次
-        if date_col is None:
-            url = build_url(entity)
-            print("URL", url)
-            r = requests.get(url, auth=AUTH, timeout=180)
-            r.raise_for_status()
-            df = pd.DataFrame(r.json().get("value", []))
-
-            rename_cols = {c: col_map.get(c, c) for c in df.columns}
-            df = df.rename(columns=rename_cols)
-
-            tbl_quoted = f'"{hebrew_table}"'
-            duck.execute(f"CREATE OR REPLACE TABLE {tbl_quoted} AS SELECT * FROM df")
-            print(f"[OK] {hebrew_table}  ALL  {len(df):,} rows inserted")
-            continue
-
-        # -------- תהליך חודשי למסכים עם פילטר תאריך --------
-
-        if date_col not in col_map:
+        if date_col is not None and date_col not in col_map:
             col_map[date_col] = date_col  # שומר מקור אם אין תרגום
-        date_col_heb = col_map[date_col]
-
-        for y, m in months_range(start, end):
-            df = fetch_month(entity, date_col, y, m)
-            if df.empty:
-                print(f"[INFO] {entity} {y}-{m:02d} – 0 rows (skipped)")
-                continue
-
-            # העתקה ומיפוי שמות עמודות
-            rename_cols = {c: col_map.get(c, c) for c in df.columns}
-            df = df.rename(columns=rename_cols)
-
-            # צטט שם טבלה/שדה כדי לאפשר עברית
-            tbl_quoted = f'"{hebrew_table}"'
-            date_col_q = f'"{date_col_heb}"'
-
-            # אם הטבלה לא קיימת – ליצור
+        renames[entity] = col_map
+
+        # אם אין עמודת תאריך → שליפה מלאה, בטווחי מפתח
+        if date_col is None and replay:
+            full_loads[entity] = (None, {FetchUnit(entity): None})
+            expected.update(full_loads[entity][1])
+        elif date_col is None:
+            with span("split_plan", entity=entity):
+                full_loads[entity] = split_units(PRIO_CLIENT, PRIO, entity, SPLIT_KEYS.get(entity))
+            expected.update(full_loads[entity][1])
+        elif replay:
+            expected.update(dict.fromkeys(month_units(entity, months)))
+        elif months:
+            with span("window_plan", entity=entity):
+                # Parquet – מחיצה לחודש, לכן לא מפצלים מתחת לחודש
+                windows = plan_windows(PRIO_CLIENT, PRIO, entity, date_col, first, end,
+                                       split_months=not parquet)
+            print(f"[OK] {entity}: {len(months)} months -> {len(windows)} windows")
+            expected.update(windows)
+    units = list(expected)
+
+    def pages_for(unit: FetchUnit):
+        col_map = renames[unit.entity]
+        types = meta.types.get(unit.entity)
+        keys = meta.keys.get(unit.entity)
+        date_col = SCREENS[unit.entity][0]
+        if replay:
+            pages = land.replay(unit, date_col, SELECT_FIELDS.get(unit.entity))
+        elif unit.start is None:
+            extra = f"$filter={urllib.parse.quote_plus(unit.where)}" if unit.where else ""
+            url = build_url(unit.entity, extra)
+            pages = iter_pages(url, PRIO_CLIENT, types=types, order_by=keys)
+            if land is not None:
+                pages = land.capture(unit, url, pages, select=SELECT_FIELDS.get(unit.entity))
+        else:
+            pages = window_pages(unit.entity, date_col, unit.start, unit.end, types, land, keys)
+        for tbl in pages:
+            yield tbl.rename_columns([col_map.get(c, c) for c in tbl.column_names])
+
+    def commit(duck, unit: FetchUnit, stage: str | None):
+        date_col, hebrew_table = SCREENS[unit.entity]
+        # צטט שם טבלה/שדה כדי לאפשר עברית
+        tbl_quoted = f'"{hebrew_table}"'
+        if stage is None and unit.start is None:
+            return                                   # טווח מפתח ריק
+        if unit.start is None:
+            # טווח מפתח – ל-__loading; ההחלפה אחרי בדיקת הסכום (למטה)
+            loading = loading_table(hebrew_table)
+            duck.execute(f"CREATE TABLE IF NOT EXISTS {loading} AS SELECT * FROM {stage} WHERE FALSE")
+            with span("duckdb_insert"):
+                duck.execute(f"INSERT INTO {loading} BY NAME SELECT * FROM {stage}")
+            return
+        if parquet:
+            with span("parquet_write"):
+                write_window(duck, PARQUET_ROOT, hebrew_table, renames[unit.entity][date_col],
+                             unit.start, unit.end, stage)
+            return
+        date_col_q = f'"{renames[unit.entity][date_col]}"'
+        if stage is None and not table_exists(duck, hebrew_table):
+            return                                   # חלון ריק ואין עדיין טבלה
+        # אם הטבלה לא קיימת – ליצור
+        if stage is not None:
             duck.execute(f"""
                 CREATE TABLE IF NOT EXISTS {tbl_quoted} AS
-                SELECT * FROM df WHERE FALSE
+                SELECT * FROM {stage} WHERE FALSE
             """)
-
-            first = dt.date(y, m, 1)
-            nextm = (first + dt.timedelta(days=32)).replace(day=1)
+        if stage is not None:
+            # הטבלה אולי צומצמה ע"י profile_store; ALTER לפני ה-DELETE –
+            # DuckDB לא מאפשר ALTER אחרי DELETE באותה טרנזקציה
+            widen_to_fit(duck, hebrew_table, stage)
+        with span("duckdb_delete"):
             duck.execute(f"""
                 DELETE FROM {tbl_quoted}
-                WHERE TRY_CAST({date_col_q} AS DATE) >= DATE '{first}'
-                  AND TRY_CAST({date_col_q} AS DATE) < DATE '{nextm}'
+                WHERE TRY_CAST({date_col_q} AS DATE) >= DATE '{unit.start}'
+                  AND TRY_CAST({date_col_q} AS DATE) < DATE '{unit.end}'
             """)
-            duck.execute(f"INSERT INTO {tbl_quoted} SELECT * FROM df")
-            print(f"[OK] {hebrew_table}  {y}-{m:02d}  {len(df):,} rows inserted")
+        if stage is None:                            # החלון התרוקן במקור – רק מחיקה
+            return
+        with span("duckdb_insert"):
+            duck.execute(f"INSERT INTO {tbl_quoted} BY NAME SELECT * FROM {stage}")
+
+    # 3. שליפה מקבילית, כתיבה מ-thread אחד
+    duck = duckdb.connect(str(db))
+    monthly = {(SCREENS[e][1], renames[e][SCREENS[e][0]]) for e in renames if SCREENS[e][0]}
+    if parquet:
+        for table, date_col_heb in monthly:
+            attach_table(duck, PARQUET_ROOT, table, date_col_heb)
+    full_tables = [SCREENS[e][1] for e in full_loads]
+    for table in full_tables:
+        duck.execute(f"DROP TABLE IF EXISTS {loading_table(table)}")
+    try:
+        fetched = run_units(duck, units, pages_for, commit, concurrency=args.concurrency,
+                            expected=expected, client=PRIO_CLIENT)
+        rows = {e: verify(e, total, exp, fetched) for e, (total, exp) in full_loads.items()}
+    except Exception:
+        for table in full_tables:
+            duck.execute(f"DROP TABLE IF EXISTS {loading_table(table)}")
+        raise
+    for entity, n in rows.items():
+        if n:
+            swap_in(duck, SCREENS[entity][1])
+        if land is not None and not replay:
+            land.seal(entity)
+        print(f"[OK] {entity} ALL  {n:,} rows ({len(full_loads[entity][1])} key ranges)")
+    if parquet:
+        for table, date_col_heb in monthly:
+            attach_table(duck, PARQUET_ROOT, table, date_col_heb)
 
     duck.close()
-    print("DONE backfill finished ->", FEATURE_DB)
+    if land is not None and not replay:
+        land.compact(sorted(renames))
+    with span("narrow"):
+        narrow_database(db)                      # 4. פרופיל + צמצום טיפוסים
 
 
 if __name__ == "__main__":
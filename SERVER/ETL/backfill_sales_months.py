@@ -1,30 +1,60 @@
  #!/usr/bin/env python
 # etl/backfill_sales_months.py
 # ----------------------------------------------------------
-# מושך SALESINVOICEITEMS בטווח חודשים (month-by-month, 100 K in flight)
+# מושך SALESINVOICEITEMS בטווח חודשים (month-by-month, paged – ראה odata_pager)
 #
 # שימוש:
-#   python backfill_sales_months.py 2023-01 2025-05
+#   python backfill_sales_months.py 2023-01 2025-05 [--concurrency 4] [--storage parquet]
+#                                   [--from-landing | --no-landing]
+#
+# כמה חלונות נמשכים במקביל (fetch_scheduler); הכתיבה ל-DuckDB – מ-thread אחד.
+# החלונות לפי $count (time_windows): חודשים שקטים מתאחדים, חודש עמוס
+# מתפצל לשבועות/ימים, וכל חלון נבדק מול ה-$count שלו.
+# כל עמוד נשמר גם באזור הנחיתה (landing); --from-landing בונה מחדש מהקבצים
+# (בלי Priority), --no-landing – בלי שמירה.
+# --storage parquet: כל חודש = מחיצת Parquet (parquet_store), ו-VIEW בשם הטבלה.
 
-import sys, os, pathlib, requests, datetime as dt, urllib.parse
-import duckdb, pandas as pd, dotenv
+import os, pathlib, argparse, functools, datetime as dt, urllib.parse
+import duckdb, dotenv
+from priority_client import PriorityClient
+from odata_pager import iter_pages, table_exists
+from odata_metadata import load_metadata
+from fetch_scheduler import DEFAULT_CONCURRENCY, month_units, run_units
+from parquet_store import attach_table, write_window
+from time_windows import plan_windows, window_filter
+from landing import Landing
+import etl_metrics
+from etl_metrics import span
 dotenv.load_dotenv()
 
 RAW_DB = pathlib.Path(r"C:\RIT\AIBI\raw_best.duckdb")
 PRIO   = os.environ["PRIORITY_URL"].rstrip("/")
 AUTH   = (os.environ["PRIORITY_USER"], os.environ["PRIORITY_PASS"])
+PRIO_CLIENT = PriorityClient(AUTH)
+PARQUET_ROOT = RAW_DB.with_name("raw_parquet")
+META_URL     = f"{PRIO}/$metadata"
+METADATA_CACHE = RAW_DB.with_name("odata_metadata.json")
+LANDING_ROOT = RAW_DB.with_name("landing")
+DST    = "stg_salesinvoiceitems"
+
+@functools.cache
+def sales_model():
+    """$metadata (odata_metadata, מטמון מקומי) – פעם אחת לתהליך"""
+    return load_metadata(PRIO_CLIENT, META_URL, METADATA_CACHE)
 
-def month_filter(year:int, month:int)->str:
-    tz   = "+02:00"
-    start= dt.date(year,month,1)
-    nextm= (start+dt.timedelta(days=32)).replace(day=1)
-    return f"(IVDATE ge {start}T00:00:00{tz} and IVDATE lt {nextm}T00:00:00{tz})"
+def sales_types() -> dict[str,str]:
+    """טיפוסי EDM של SALESINVOICEITEMS"""
+    return sales_model().types.get("SALESINVOICEITEMS", {})
 
-def fetch_month(y,m):
-    url = f"{PRIO}/SALESINVOICEITEMS?$filter={urllib.parse.quote_plus(month_filter(y,m))}&$top=100000"
-    print("🔗", url)
-    r = requests.get(url, auth=AUTH, timeout=180); r.raise_for_status()
-    return pd.DataFrame(r.json()["value"])
+def sales_keys() -> list[str]:
+    """מפתח SALESINVOICEITEMS ל-$orderby של הדפדוף (IVNUM, KLINE אם חסר ב-$metadata)"""
+    return sales_model().keys.get("SALESINVOICEITEMS") or ["IVNUM", "KLINE"]
+
+def window_pages(unit, land=None):
+    filt  = window_filter("IVDATE", unit.start, unit.end)
+    url   = f"{PRIO}/SALESINVOICEITEMS?$filter={urllib.parse.quote_plus(filt)}"
+    pages = iter_pages(url, PRIO_CLIENT, types=sales_types(), order_by=sales_keys())
+    return land.capture(unit, url, pages, date_col="IVDATE") if land else pages
 
 def months_range(start:str,end:str):
     y0,m0 = map(int,start.split('-')); y1,m1 = map(int,end.split('-'))
@@ -33,26 +63,72 @@ def months_range(start:str,end:str):
         yield cur.year, cur.month
         cur = (cur+dt.timedelta(days=32)).replace(day=1)
 
-def main():
-    if len(sys.argv)!=3:
-        print("usage: python backfill_sales_months.py YYYY-MM YYYY-MM"); sys.exit(1)
-    start,end = sys.argv[1:3]
-
-    duck = duckdb.connect(str(RAW_DB))
-    dst  = "stg_salesinvoiceitems"
-
-    for y,m in months_range(start,end):
-        df = fetch_month(y,m)
-        first = dt.date(y,m,1)
-        nextm = (first+dt.timedelta(days=32)).replace(day=1)
+def commit_month(duck, unit, stage:str|None):
+    if stage is None and not table_exists(duck, DST):
+        return                                  # חלון ריק ואין עדיין טבלה
+    if stage is not None:
+        duck.execute(f"CREATE TABLE IF NOT EXISTS {DST} AS SELECT * FROM {stage} WHERE FALSE")
+    with span("duckdb_delete"):
         duck.execute(f"""
-            DELETE FROM {dst}
-            WHERE IVDATE::DATE >= DATE '{first}' AND IVDATE::DATE < DATE '{nextm}'
+            DELETE FROM {DST}
+            WHERE IVDATE::DATE >= DATE '{unit.start}' AND IVDATE::DATE < DATE '{unit.end}'
         """)
-        duck.execute("INSERT INTO stg_salesinvoiceitems SELECT * FROM df")
-        print(f"✓ {y}-{m:02d}  {len(df):,} rows inserted")
+    if stage is None:                           # החלון התרוקן במקור – רק מחיקה
+        return
+    with span("duckdb_insert"):
+        duck.execute(f"INSERT INTO {DST} BY NAME SELECT * FROM {stage}")
+
+def commit_partition(duck, unit, stage:str|None):
+    with span("parquet_write"):
+        write_window(duck, PARQUET_ROOT, DST, "IVDATE", unit.start, unit.end, stage)
+
+def main(argv: list[str] | None = None):
+    ap = argparse.ArgumentParser(description="backfill SALESINVOICEITEMS month-by-month")
+    ap.add_argument("start", help="YYYY-MM")
+    ap.add_argument("end",   help="YYYY-MM")
+    ap.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                    help="months fetched in parallel (requests in flight)")
+    ap.add_argument("--storage", choices=["table", "parquet"], default="table",
+                    help="parquet = one Parquet partition per month under raw_parquet/")
+    ap.add_argument("--from-landing", action="store_true",
+                    help="rebuild from the landing zone instead of calling Priority")
+    ap.add_argument("--no-landing", action="store_true",
+                    help="do not save fetched pages to the landing zone")
+    etl_metrics.add_cli(ap)
+    args = ap.parse_args(argv)
+
+    with etl_metrics.run("backfill_sales_months", RAW_DB, profile=args.profile):
+        duck  = duckdb.connect(str(RAW_DB))
+        parquet = args.storage == "parquet"
+        land = None if args.no_landing and not args.from_landing else Landing(LANDING_ROOT)
+        if parquet:
+            attach_table(duck, PARQUET_ROOT, DST, "IVDATE")
+        months = list(months_range(args.start, args.end))
+        windows = {}
+        pages_for = lambda u: window_pages(u, land)
+        if args.from_landing:
+            # חודש לכל יחידה; בכל חודש – ה-capture העדכני ביותר לכל תאריך
+            windows = dict.fromkeys(month_units("SALESINVOICEITEMS", months))
+            pages_for = lambda u: land.replay(u, "IVDATE")
+        elif months:
+            sales_types()             # $metadata פעם אחת, לפני שה-threads מתחילים
+            first = dt.date(*months[0], 1)
+            end   = (dt.date(*months[-1], 1) + dt.timedelta(days=32)).replace(day=1)
+            with span("window_plan"):
+                # Parquet – מחיצה לחודש, לכן לא מפצלים מתחת לחודש
+                windows = plan_windows(PRIO_CLIENT, PRIO, "SALESINVOICEITEMS", "IVDATE",
+                                       first, end, split_months=not parquet)
+            print(f"ℹ️  {len(months)} months → {len(windows)} windows")
+        run_units(duck, list(windows), pages_for,
+                  commit_partition if parquet else commit_month,
+                  concurrency=args.concurrency, expected=windows, client=PRIO_CLIENT)
+        if land and not args.from_landing:
+            land.compact(["SALESINVOICEITEMS"])
+        if parquet:
+            attach_table(duck, PARQUET_ROOT, DST, "IVDATE")
+        duck.close()
 
-    duck.close()
+    print("ℹ️ ", PRIO_CLIENT.summary())
     print("🏁 backfill done →", RAW_DB)
 
 if __name__ == "__main__":
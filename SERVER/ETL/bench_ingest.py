@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+# etl/bench_ingest.py
+# ----------------------------------------------------------
+# מדידת מסלולי הקליטה מול mock_priority (או כל שרת ב---url) – בלי ייצור.
+#
+# לכל מסלול: שורות, זמן כולל, rows/s, זמן כתיבה ל-DuckDB, אחוזוני זמן-תגובה
+# לבקשה (p50/p95/p99), מספר בקשות ו-peak RSS.  כל הקבצים נכתבים לתיקייה
+# זמנית – raw_best / feature_store_heb האמיתיים לא נפתחים.
+# ה-mock רץ כברירת מחדל באותו תהליך (ה-RSS שלו בבסיס, וה-CPU שלו מתחרה על
+# ה-GIL); למספרים נקיים – להריץ את mock_priority.py בנפרד ולתת --url.
+#
+#   python ETL/bench_ingest.py --scale 50000 --latency-ms 40 --json bench.json
+#   python ETL/bench_ingest.py --baseline bench.json      (exit 1 אם יש רגרסיה)
+#
+# מסלולים:
+#   sales_month     – odata_to_raw.current_month_pages + load_pages (החודש הנוכחי,
+#                     חלונות $count – המסלול של load_sales, בלי landing)
+#   static_dims     – CUSTOMERS + LOGPART, entity_pages + load_pages
+#   heb_month       – backfill_heb_screens.window_pages (FNCLOG, החודש הנוכחי) + load_pages
+#   heb_main        – backfill_heb_screens.main  (FNCLOG, כל החודשים, מקצה לקצה)
+#   sales_backfill  – backfill_sales_months.main (כל החודשים, מקצה לקצה)
+#
+import os, sys, json, time, shutil, tempfile, pathlib, argparse, threading, datetime as dt
+from dataclasses import dataclass, asdict
+import mock_priority
+from etl_metrics import rss_bytes
+
+PATHS = ["sales_month", "static_dims", "heb_month", "heb_main", "sales_backfill"]
+
+
+# ----------------------------------------------------------------------------
+#                               מדידה
+# ----------------------------------------------------------------------------
+class RssSampler:
+    """דוגם RSS כל 20ms ב-thread רקע; .peak אחרי היציאה מה-with"""
+
+    def __init__(self, interval: float = 0.02):
+        self.interval, self.peak = interval, 0
+        self._stop = threading.Event()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, rss_bytes() or 0)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.base = self.peak = rss_bytes() or 0
+        self._t = threading.Thread(target=self._run, daemon=True)
+        self._t.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._t.join()
+        self.peak = max(self.peak, rss_bytes() or 0)
+
+
+class Latencies:
+    """עוטף client.get של PriorityClient ורושם את זמן כל בקשה"""
+
+    def __init__(self):
+        self.samples: list[float] = []
+        self._lock = threading.Lock()
+
+    def wrap(self, client) -> None:
+        get = client.get
+
+        def timed(url, **kw):
+            t0 = time.perf_counter()
+            try:
+                return get(url, **kw)
+            finally:
+                with self._lock:
+                    self.samples.append(time.perf_counter() - t0)
+        client.get = timed
+
+    def take(self) -> list[float]:
+        with self._lock:
+            out, self.samples = sorted(self.samples), []
+        return out
+
+
+def pct(sorted_vals: list[float], p: float) -> float | None:
+    if not sorted_vals:
+        return None
+    return sorted_vals[min(len(sorted_vals) - 1, int(p / 100 * len(sorted_vals)))]
+
+
+class FetchTimer:
+    """זמן שבילה ה-generator בהבאת עמודים (רשת + פענוח); השאר = כתיבה"""
+
+    def __init__(self):
+        self.seconds = 0.0
+
+    def wrap(self, pages):
+        it = iter(pages)
+        while True:
+            t0 = time.perf_counter()
+            try:
+                page = next(it)
+            except StopIteration:
+                self.seconds += time.perf_counter() - t0
+                return
+            self.seconds += time.perf_counter() - t0
+            yield page
+
+
+@dataclass
+class Result:
+    path:        str
+    rows:        int
+    seconds:     float
+    rows_per_s:  float
+    write_s:     float | None
+    requests:    int
+    p50_ms:      float | None
+    p95_ms:      float | None
+    p99_ms:      float | None
+    peak_rss_mb: float
+    rss_delta_mb: float
+
+
+# ----------------------------------------------------------------------------
+#                               מסלולים
+# ----------------------------------------------------------------------------
+def build_paths(work: pathlib.Path, months: list[tuple[int, int]], concurrency: int):
+    import duckdb
+    import odata_to_raw as otr, backfill_heb_screens as heb, backfill_sales_months as bsm
+    from odata_pager import load_pages
+
+    y, m = months[-1]
+    start = dt.date(y, m, 1)
+    nextm = (start + dt.timedelta(days=32)).replace(day=1)
+    bench_db = work / "bench.duckdb"
+
+    def streamed(pages, table: str) -> tuple[int, float]:
+        timer = FetchTimer()
+        duck = duckdb.connect(str(bench_db))
+        t0 = time.perf_counter()
+        n = load_pages(duck, table, timer.wrap(pages), replace=True)
+        duck.close()
+        return n, time.perf_counter() - t0 - timer.seconds
+
+    def sales_month():
+        # months[-1] הוא החודש הנוכחי – אותו חודש ש-load_sales מרענן
+        return streamed(otr.current_month_pages(landing="off"), "b_sales")
+
+    def static_dims():
+        rows = write = 0
+        for entity in ("CUSTOMERS", "LOGPART"):
+            n, w = streamed(otr.entity_pages(entity, otr.build_url(entity)), f"b_{entity.lower()}")
+            rows, write = rows + n, write + w
+        return rows, write
+
+    def heb_month():
+        meta = heb.fetch_metadata()
+        return streamed(heb.window_pages("FNCLOG", "BALDATE", start, nextm, meta.types.get("FNCLOG"),
+                                         keys=meta.keys.get("FNCLOG")), "b_fnclog")
+
+    def count(db: pathlib.Path, table: str) -> int:
+        duck = duckdb.connect(str(db), read_only=True)
+        n = duck.execute(f'SELECT count(*) FROM "{table}"').fetchone()[0]
+        duck.close()
+        return n
+
+    first, last = (f"{a:04d}-{b:02d}" for a, b in (months[0], months[-1]))
+
+    def heb_main():
+        heb.main([first, last, "FNCLOG", "--concurrency", str(concurrency)])
+        return count(heb.FEATURE_DB, heb.SCREENS["FNCLOG"][1]), None
+
+    def sales_backfill():
+        bsm.main([first, last, "--concurrency", str(concurrency)])
+        return count(bsm.RAW_DB, bsm.DST), None
+
+    return {"sales_month": sales_month,
+            "static_dims": static_dims, "heb_month": heb_month,
+            "heb_main": heb_main, "sales_backfill": sales_backfill}
+
+
+def redirect(work: pathlib.Path) -> list:
+    """כל מסלולי הקבצים של מודולי ה-ETL → תיקיית העבודה הזמנית; מחזיר את ה-clients"""
+    import odata_to_raw as otr, backfill_heb_screens as heb, backfill_sales_months as bsm
+    for mod, db in ((otr, "raw.duckdb"), (bsm, "raw.duckdb"), (heb, "feature_heb.duckdb")):
+        if hasattr(mod, "RAW_DB"):
+            mod.RAW_DB = work / db
+        if hasattr(mod, "FEATURE_DB"):
+            mod.FEATURE_DB = work / db
+        mod.PARQUET_ROOT = work / f"{pathlib.Path(db).stem}_parquet"
+        mod.METADATA_CACHE = work / "odata_metadata.json"
+        mod.LANDING_ROOT = work / "landing"
+    return [otr.PRIO_CLIENT, heb.PRIO_CLIENT, bsm.PRIO_CLIENT]
+
+
+# ----------------------------------------------------------------------------
+#                               תהליך ראשי
+# ----------------------------------------------------------------------------
+def report(results: list[Result]) -> None:
+    def f(v, spec):
+        return format(v, spec) if v is not None else "–"
+    print(f"\n{'path':<16}{'rows':>10}{'sec':>8}{'rows/s':>10}{'write s':>9}{'req':>6}"
+          f"{'p50 ms':>8}{'p95 ms':>8}{'p99 ms':>8}{'peak MB':>9}{'ΔMB':>7}")
+    for r in results:
+        print(f"{r.path:<16}{r.rows:>10,}{r.seconds:>8.2f}{r.rows_per_s:>10,.0f}"
+              f"{f(r.write_s, '.2f'):>9}{r.requests:>6}{f(r.p50_ms, '.0f'):>8}"
+              f"{f(r.p95_ms, '.0f'):>8}{f(r.p99_ms, '.0f'):>8}"
+              f"{r.peak_rss_mb:>9.0f}{r.rss_delta_mb:>7.0f}")
+
+
+def regressions(results: list[Result], baseline: dict, tol: float) -> list[str]:
+    out = []
+    for r in results:
+        b = baseline.get(r.path)
+        if not b:
+            continue
+        if r.rows_per_s < b["rows_per_s"] * (1 - tol):
+            out.append(f"{r.path}: rows/s {r.rows_per_s:,.0f} < baseline {b['rows_per_s']:,.0f}")
+        if r.rss_delta_mb > max(b["rss_delta_mb"], 1) * (1 + tol):
+            out.append(f"{r.path}: RSS Δ {r.rss_delta_mb:.0f} MB > baseline {b['rss_delta_mb']:.0f} MB")
+        if r.write_s and b.get("write_s") and r.write_s > b["write_s"] * (1 + tol):
+            out.append(f"{r.path}: write {r.write_s:.2f}s > baseline {b['write_s']:.2f}s")
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description="benchmark the Priority ingestion paths")
+    ap.add_argument("paths", nargs="*", help=f"subset of {', '.join(PATHS)} (default: all)")
+    ap.add_argument("--url", help="existing OData root (default: start mock_priority in-process)")
+    ap.add_argument("--scale", type=int, default=20_000, help="mock: sales rows per month")
+    ap.add_argument("--months", type=int, default=3)
+    ap.add_argument("--max-page", type=int, default=mock_priority.DEFAULT_MAX_PAGE)
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--jitter-ms", type=float, default=0.0)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--concurrency", type=int, default=4)
+    ap.add_argument("--json", type=pathlib.Path, help="write results here")
+    ap.add_argument("--baseline", type=pathlib.Path, help="compare against an earlier --json")
+    ap.add_argument("--tolerance", type=float, default=0.2, help="allowed regression (0.2 = 20%%)")
+    ap.add_argument("--keep", action="store_true", help="keep the temp work directory")
+    args = ap.parse_args()
+    unknown = set(args.paths) - set(PATHS)
+    if unknown:
+        ap.error(f"unknown path(s): {', '.join(sorted(unknown))}")
+
+    if args.url:
+        url = args.url.rstrip("/")
+    else:
+        t0 = time.perf_counter()
+        data = mock_priority.generate(args.scale, args.months)
+        mock = mock_priority.MockPriority(data, max_page=args.max_page, latency_ms=args.latency_ms,
+                                          jitter_ms=args.jitter_ms, error_rate=args.error_rate)
+        server = mock.serve(0)
+        url = f"http://127.0.0.1:{server.server_port}/odata/Priority/tabula.ini/bench"
+        print(f"✓ mock_priority on {url}  ({time.perf_counter() - t0:.1f}s to generate)")
+
+    # לפני import של מודולי ה-ETL – הם קוראים את ה-env בזמן import
+    os.environ["PRIORITY_URL"] = url
+    os.environ.setdefault("PRIORITY_USER", "bench")
+    os.environ.setdefault("PRIORITY_PASS", "bench")
+
+    work = pathlib.Path(tempfile.mkdtemp(prefix="aibi_bench_"))
+    lat = Latencies()
+    for client in redirect(work):
+        lat.wrap(client)
+
+    first = dt.date.today().replace(day=1)
+    months = []
+    for _ in range(args.months):
+        months.append((first.year, first.month))
+        first = (first - dt.timedelta(days=1)).replace(day=1)
+    months.reverse()
+
+    runners = build_paths(work, months, args.concurrency)
+    import odata_to_raw, backfill_sales_months, backfill_heb_screens
+    odata_to_raw.edm_model(); backfill_sales_months.sales_types()   # $metadata – מחוץ למדידה
+    backfill_heb_screens.fetch_metadata()
+    lat.take()
+
+    results = []
+    for name in args.paths or PATHS:
+        print(f"\n▶ {name}")
+        with RssSampler() as rss:
+            t0 = time.perf_counter()
+            rows, write_s = runners[name]()
+            secs = time.perf_counter() - t0
+        samples = lat.take()
+        ms = lambda p: None if pct(samples, p) is None else pct(samples, p) * 1000
+        results.append(Result(name, rows, secs, rows / secs if secs else 0.0, write_s, len(samples),
+                              ms(50), ms(95), ms(99), rss.peak / 2**20, (rss.peak - rss.base) / 2**20))
+
+    report(results)
+    if args.json:
+        args.json.write_text(json.dumps({r.path: asdict(r) for r in results}, indent=2),
+                             encoding="utf-8")
+    if not args.keep:
+        shutil.rmtree(work, ignore_errors=True)
+    if args.baseline:
+        bad = regressions(results, json.loads(args.baseline.read_text(encoding="utf-8")),
+                          args.tolerance)
+        for line in bad:
+            print("[WARN] regression –", line)
+        if bad:
+            sys.exit(1)
+        print("[OK] no regressions vs", args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# etl/dim_sync.py
+# ----------------------------------------------------------
+# סנכרון דלתא לטבלאות המלאות (TABLES_STATIC) – במקום swap_in שכותב הכל מחדש.
+#
+#   • <dst>__loading (אחרי verify) מושווה ליעד לפי מפתח עסקי (DIM_KEYS אצל
+#     הקורא) ו-hash של כל העמודות: רק השורות שנוספו / השתנו / נמחקו נכתבות,
+#     בטרנזקציה אחת. שאר הטבלה לא נוגעת – פחות כתיבה, וטביעות האצבע של
+#     ה-RAW (gpt_modeler.raw_version) לא משתנות כשאין שינוי אמיתי.
+#   • history=True (SCD2): גם _hist_<dst> עם VALID_FROM / VALID_TO – כל גרסה
+#     של שורה נשמרת (הסוכן הקודם של לקוח …); VALID_TO NULL = הגרסה הנוכחית.
+#     ההשוואה להיסטוריה היא מול השורות הנוכחיות שבה (לא מול היעד), כך שריצה
+#     בלי history לא שוברת אותה – רק גרסאות ביניים לא נרשמות.
+#     בהפעלה הראשונה ההיסטוריה מתחילה מהמצב שנטען עכשיו.
+#     קידומת _ כמו שאר הטבלאות הפנימיות – קוראי הסכמה (stg_*) לא רואים אותה.
+#   • אין דלתא (swap_in כמו קודם) אם: אין יעד, העמודות / הטיפוסים השתנו,
+#     או שהמפתח לא ייחודי ב-loading.
+#
+import datetime as dt
+from key_ranges import loading_table, swap_in
+from etl_metrics import span
+
+HIST_PREFIX = "_hist_"
+VALID_FROM  = "VALID_FROM"
+VALID_TO    = "VALID_TO"
+
+
+def _q(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def columns(duck, table: str) -> dict[str, str]:
+    """{עמודה: טיפוס};  table – שם מצוטט"""
+    return {c[1]: c[2] for c in duck.execute(f"PRAGMA table_info({table})").fetchall()}
+
+
+def exists(duck, table: str) -> bool:
+    return duck.execute("""
+        SELECT 1 FROM information_schema.tables
+        WHERE table_catalog = current_database() AND table_schema = 'main' AND table_name = ?
+    """, [table]).fetchone() is not None
+
+
+def history_table(table: str) -> str:
+    return HIST_PREFIX + table
+
+
+def duplicate_keys(duck, table: str, keys: list[str]) -> int:
+    k = ", ".join(map(_q, keys))
+    return duck.execute(
+        f"SELECT count(*) FROM (SELECT {k} FROM {table} GROUP BY ALL HAVING count(*) > 1)"
+    ).fetchone()[0]
+
+
+def _match(keys: list[str], a: str, b: str) -> str:
+    # IS NOT DISTINCT FROM – שורה עם מפתח NULL מתאימה לעצמה
+    return " AND ".join(f"{a}.{_q(k)} IS NOT DISTINCT FROM {b}.{_q(k)}" for k in keys)
+
+
+def diff(duck, new: str, old: str, keys: list[str], cols: list[str], where: str = "TRUE") -> dict[str, int]:
+    """
+    _dim_delta (מפתח…, op):  I – שורה חדשה, U – השתנתה, D – נמחקה.
+    מחזיר {op: מספר שורות}.
+    """
+    k = ", ".join(map(_q, keys))
+    h = f"hash({', '.join(map(_q, cols))})"
+    duck.execute(f"""
+        CREATE OR REPLACE TEMP TABLE _dim_delta AS
+        SELECT {", ".join(f"coalesce(n.{_q(c)}, o.{_q(c)}) AS {_q(c)}" for c in keys)},
+               CASE WHEN o._h IS NULL THEN 'I' WHEN n._h IS NULL THEN 'D' ELSE 'U' END AS op
+        FROM (SELECT {k}, {h} AS _h FROM {new}) n
+        FULL JOIN (SELECT {k}, {h} AS _h FROM {old} WHERE {where}) o
+          ON {_match(keys, "n", "o")}
+        WHERE n._h IS DISTINCT FROM o._h
+    """)
+    counts = dict(duck.execute("SELECT op, count(*) FROM _dim_delta GROUP BY op").fetchall())
+    return {op: counts.get(op, 0) for op in "IUD"}
+
+
+def _changed(keys: list[str], alias: str, ops: str) -> str:
+    in_ops = ", ".join(f"'{op}'" for op in ops)
+    return f"EXISTS (SELECT 1 FROM _dim_delta d WHERE d.op IN ({in_ops}) AND {_match(keys, 'd', alias)})"
+
+
+def _prepare_history(duck, hist: str, new: str, new_cols: dict[str, str], ts: dt.datetime) -> bool:
+    """יוצר / מרחיב את _hist_<dst> (DDL – לפני הטרנזקציה). False ⇒ נוצרה עכשיו."""
+    if not exists(duck, hist):
+        duck.execute(f"""
+            CREATE TABLE {_q(hist)} AS
+            SELECT *, ?::TIMESTAMP AS {VALID_FROM}, NULL::TIMESTAMP AS {VALID_TO} FROM {new}
+        """, [ts])
+        return False
+    have = columns(duck, _q(hist))
+    for c, t in new_cols.items():                  # עמודה חדשה במקור – גרסאות קודמות NULL
+        if c not in have:
+            duck.execute(f"ALTER TABLE {_q(hist)} ADD COLUMN {_q(c)} {t}")
+    return True
+
+
+def sync(duck, table: str, keys: list[str], history: bool = False) -> dict[str, int] | None:
+    """
+    <table>__loading → table כדלתא.  מחזיר {I, U, D}; None ⇒ הוחלפה כולה (swap_in).
+    loading נמחקת בכל מקרה.
+    """
+    new = loading_table(table)
+    new_cols = columns(duck, new)
+    ts = dt.datetime.now().replace(microsecond=0)
+
+    dups = duplicate_keys(duck, new, keys)
+    reason = None
+    if not exists(duck, table):
+        reason = "new table"
+    elif columns(duck, _q(table)) != new_cols:
+        reason = "columns changed"
+    elif dups:
+        reason = f"key {keys} not unique ({dups:,} duplicated)"
+    if history and dups:
+        print(f"[WARN] {table}: key {keys} not unique – history not updated")
+    has_hist = history and not dups and _prepare_history(duck, history_table(table), new, new_cols, ts)
+
+    if reason:
+        if has_hist:
+            with span("dim_history"):
+                _apply_history(duck, history_table(table), new, keys, list(new_cols), ts)
+        print(f"ℹ️  {table}: {reason} – full replace")
+        swap_in(duck, table)
+        return None
+
+    duck.begin()
+    try:
+        with span("dim_delta") as sp:
+            counts = diff(duck, new, _q(table), keys, list(new_cols))
+            duck.execute(f"DELETE FROM {_q(table)} WHERE {_changed(keys, _q(table), 'UD')}")
+            duck.execute(f"INSERT INTO {_q(table)} BY NAME SELECT n.* FROM {new} n WHERE {_changed(keys, 'n', 'IU')}")
+            sp.add(rows=counts["I"] + counts["U"])
+        if has_hist:
+            with span("dim_history"):
+                _apply_history(duck, history_table(table), new, keys, list(new_cols), ts)
+        duck.execute(f"DROP TABLE {new}")
+        duck.execute("DROP TABLE IF EXISTS _dim_delta")
+        duck.commit()
+    except Exception:
+        duck.rollback()
+        raise
+    return counts
+
+
+def _apply_history(duck, hist: str, new: str, keys: list[str], cols: list[str], ts: dt.datetime) -> None:
+    """גרסה נוכחית שהשתנתה / נמחקה נסגרת (VALID_TO); גרסה חדשה נפתחת"""
+    h = _q(hist)
+    diff(duck, new, h, keys, cols, where=f"{VALID_TO} IS NULL")
+    duck.execute(f"UPDATE {h} SET {VALID_TO} = ? WHERE {VALID_TO} IS NULL AND {_changed(keys, h, 'UD')}", [ts])
+    duck.execute(f"""
+        INSERT INTO {h} BY NAME
+        SELECT n.*, ?::TIMESTAMP AS {VALID_FROM} FROM {new} n WHERE {_changed(keys, 'n', 'IU')}
+    """, [ts])
@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+# etl/etl_metrics.py
+# ----------------------------------------------------------
+# מדידה מובנית לכל ריצת ETL – במקום רק שורות print.
+#
+#   with etl_metrics.run("odata_to_raw", RAW_DB, profile=args.profile):
+#       with etl_metrics.tagged(entity="SALESINVOICEITEMS", month="2025-05"):
+#           with etl_metrics.span("http") as s:
+#               ...
+#               s.add(rows=len(rows), nbytes=len(body))
+#
+#   • span(phase) – זמן + שורות + bytes; מצטבר לפי (phase, entity, month), כך
+#     שריצה של אלפי עמודים נשארת כמה עשרות שורות.
+#   • tagged(...) – entity / month ל-thread הנוכחי (עובדי fetch_scheduler).
+#   • peak RSS – נדגם ברקע לאורך הריצה, ובסוף כל span.
+#   • בסוף הריצה נכתבות etl_runs / etl_spans לקובץ ה-DuckDB של היעד.
+#   • run() בתוך run() (pipeline → שלב) – לא ריצה חדשה, אלא span בשם הסקריפט.
+#   • --profile cprofile|pyinstrument – פרופיל של כל הריצה ליד ה-DB
+#     (profiles/<script>-<run_id>.prof / .html).
+#   • בלי run() פעיל – span/tagged הם no-op זולים.
+#
+import sys, time, uuid, json, pathlib, threading, contextlib, datetime as dt
+
+RUNS_TABLE  = "etl_runs"
+SPANS_TABLE = "etl_spans"
+RSS_INTERVAL = 0.5            # שניות בין דגימות RSS
+
+
+def rss_bytes() -> int | None:
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        try:
+            import resource                               # לינוקס: KB, שיא מצטבר
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        except ImportError:
+            return None
+
+
+class Span:
+    """מה שה-with מקבל: s.add(rows=…, nbytes=…)"""
+    __slots__ = ("rows", "nbytes")
+
+    def __init__(self):
+        self.rows = self.nbytes = 0
+
+    def add(self, rows: int = 0, nbytes: int = 0) -> None:
+        self.rows += rows
+        self.nbytes += nbytes
+
+
+class Run:
+    def __init__(self, script: str, target_db: pathlib.Path, argv: list[str]):
+        self.script, self.target_db, self.argv = script, pathlib.Path(target_db), argv
+        self.run_id = uuid.uuid4().hex[:12]
+        self.started = dt.datetime.now()
+        self.t0 = time.perf_counter()
+        self.peak_rss = rss_bytes() or 0
+        # (phase, entity, month) → [calls, seconds, rows, bytes, first_start, peak_rss]
+        self.spans: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+
+    def _sample(self) -> None:
+        while not self._stop.wait(RSS_INTERVAL):
+            rss = rss_bytes()
+            if rss and rss > self.peak_rss:
+                self.peak_rss = rss
+
+    def record(self, phase: str, tags: dict, start: dt.datetime, seconds: float, s: Span) -> None:
+        rss = rss_bytes() or 0
+        key = (phase, tags.get("entity"), tags.get("month"))
+        with self._lock:
+            agg = self.spans.get(key)
+            if agg is None:
+                self.spans[key] = [1, seconds, s.rows, s.nbytes, start, rss]
+            else:
+                agg[0] += 1
+                agg[1] += seconds
+                agg[2] += s.rows
+                agg[3] += s.nbytes
+                agg[5] = max(agg[5], rss)
+            self.peak_rss = max(self.peak_rss, rss)
+
+    def write(self, status: str, error: str | None) -> None:
+        import duckdb
+        self._stop.set()
+        seconds = time.perf_counter() - self.t0
+        with self._lock:
+            spans = [(self.run_id, phase, entity, month, start, calls, secs, rows, nbytes, rss / 2**20)
+                     for (phase, entity, month), (calls, secs, rows, nbytes, start, rss)
+                     in self.spans.items()]
+        top = [s for s in spans if s[1] == "http"]
+        con = duckdb.connect(str(self.target_db))
+        con.execute(f"""
+            CREATE TABLE IF NOT EXISTS {RUNS_TABLE} (
+                run_id      VARCHAR PRIMARY KEY,
+                script      VARCHAR,
+                args        VARCHAR,
+                started_at  TIMESTAMP,
+                seconds     DOUBLE,
+                status      VARCHAR,
+                error       VARCHAR,
+                peak_rss_mb DOUBLE,
+                http_rows   BIGINT,
+                http_bytes  BIGINT
+            )""")
+        con.execute(f"""
+            CREATE TABLE IF NOT EXISTS {SPANS_TABLE} (
+                run_id      VARCHAR,
+                phase       VARCHAR,
+                entity      VARCHAR,
+                month       VARCHAR,
+                started_at  TIMESTAMP,          -- הקריאה הראשונה
+                calls       BIGINT,
+                seconds     DOUBLE,             -- סכום (גם על פני threads)
+                rows        BIGINT,
+                bytes       BIGINT,
+                rss_mb      DOUBLE              -- מקסימום בסוף קריאה
+            )""")
+        con.execute(f"INSERT INTO {RUNS_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", [
+            self.run_id, self.script, json.dumps(self.argv, ensure_ascii=False), self.started,
+            seconds, status, error, self.peak_rss / 2**20,
+            sum(s[7] for s in top), sum(s[8] for s in top)])
+        if spans:
+            con.executemany(f"INSERT INTO {SPANS_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", spans)
+        con.close()
+        print(f"ℹ️  metrics: run {self.run_id} {status} in {seconds:,.1f}s, "
+              f"peak RSS {self.peak_rss / 2**20:,.0f} MB → {self.target_db.name}:{RUNS_TABLE}")
+
+
+_current: Run | None = None
+_local = threading.local()
+
+
+def _tags() -> dict:
+    return getattr(_local, "tags", {})
+
+
+@contextlib.contextmanager
+def tagged(**tags):
+    """entity / month לכל span שנפתח ב-thread הזה בתוך ה-with"""
+    old = _tags()
+    _local.tags = {**old, **{k: (None if v is None else str(v)) for k, v in tags.items()}}
+    try:
+        yield
+    finally:
+        _local.tags = old
+
+
+@contextlib.contextmanager
+def span(phase: str, **tags):
+    s = Span()
+    run_ = _current
+    if run_ is None:
+        yield s
+        return
+    start, t0 = dt.datetime.now(), time.perf_counter()
+    try:
+        yield s
+    finally:
+        merged = {**_tags(), **{k: (None if v is None else str(v)) for k, v in tags.items()}}
+        run_.record(phase, merged, start, time.perf_counter() - t0, s)
+
+
+def add_cli(ap) -> None:
+    """--profile לכל סקריפט"""
+    ap.add_argument("--profile", choices=["cprofile", "pyinstrument"],
+                    help="profile the whole run (written next to the target DB)")
+
+
+@contextlib.contextmanager
+def _profiler(kind: str | None, out_stem: pathlib.Path):
+    if not kind:
+        yield
+        return
+    out_stem.parent.mkdir(parents=True, exist_ok=True)
+    if kind == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            print("[WARN] pyinstrument not installed – using cProfile")
+            kind = "cprofile"
+        else:
+            prof = Profiler()
+            prof.start()
+            try:
+                yield
+            finally:
+                prof.stop()
+                out = out_stem.with_suffix(".html")
+                out.write_text(prof.output_html(), encoding="utf-8")
+                print(f"ℹ️  profile → {out}")
+            return
+    import cProfile
+    prof = cProfile.Profile()
+    prof.enable()
+    try:
+        yield
+    finally:
+        prof.disable()
+        out = out_stem.with_suffix(".prof")
+        prof.dump_stats(str(out))
+        print(f"ℹ️  profile → {out}   (python -m pstats {out.name})")
+
+
+@contextlib.contextmanager
+def run(script: str, target_db: pathlib.Path, *, profile: str | None = None):
+    """ריצה אחת; בסוף (גם בכשל) נכתבת ל-etl_runs / etl_spans ב-target_db"""
+    global _current
+    if _current is not None:                 # ריצה מקוננת – span בלבד
+        with span(f"script:{script}"):
+            yield _current
+        return
+    r = _current = Run(script, target_db, sys.argv[1:])
+    status, error = "ok", None
+    try:
+        with _profiler(profile, pathlib.Path(target_db).parent / "profiles" / f"{script}-{r.run_id}"):
+            yield r
+    except BaseException as exc:
+        status, error = "failed", repr(exc)
+        raise
+    finally:
+        _current = None
+        try:
+            r.write(status, error)
+        except Exception as exc:             # מדידה לעולם לא מפילה את ה-ETL
+            print(f"[WARN] metrics not written: {exc}")
@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# etl/fetch_scheduler.py
+# ----------------------------------------------------------
+# מתזמן שליפות מקבילי ל-backfill:  כמה יחידות (entity, חודש) במקביל,
+# כותב יחיד ל-DuckDB.
+#
+#   • ThreadPool עם `concurrency` עובדים  ⇒  זה גם הגבול לבקשות in-flight.
+#   • 429 / 5xx / timeout  ⇒  השהייה משותפת לכל העובדים (Throttle)
+#     עם backoff אקספוננציאלי, והיחידה נשלחת שוב.  client= (PriorityClient)
+#     – העובדים מושכים בתוך client.single_attempt(), כך שזו שכבת ה-retry
+#     היחידה ליחידות (בלי retry נוסף של הלקוח לכל בקשה).
+#   • העובדים רק מושכים עמודים; ה-thread הראשי הוא הכותב היחיד:
+#     כל יחידה נטענת לטבלת staging זמנית, ורק כשהיא הושלמה –
+#     commit(duck, unit, stage) מחליף את החודש בטבלת היעד בטרנזקציה אחת.
+#   • expected={unit: $count} – יחידה שהחזירה פחות שורות נחשבת כשל
+#     (IncompleteFetch) ונשלחת שוב, במקום commit חלקי.
+#   • כשל בכתיבת עמוד ל-staging (טיפוס עמודה שלא מתאים …) מסמן את היחידה
+#     ככושלת; הכותב ממשיך לרוקן את התור עד שכל העובדים סיימו, ורק אז מעלה –
+#     אחרת עובדים נשארים חסומים על התור המלא וה-pool לא נסגר לעולם.
+#
+import time, queue, random, threading, itertools, contextlib, datetime as dt, requests, pyarrow as pa
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Iterator
+from etl_metrics import span, tagged
+
+DEFAULT_CONCURRENCY = 4
+MAX_ATTEMPTS        = 5
+BACKOFF_BASE        = 5.0     # שניות
+BACKOFF_MAX         = 300.0
+
+
+@dataclass(frozen=True)
+class FetchUnit:
+    """
+    יחידת עבודה: ישות + חלון תאריכים [start, end). start=None ⇒ טעינה מלאה.
+    where – פילטר OData נוסף (טווח מפתח מ-key_ranges), None ⇒ בלי.
+    """
+    entity: str
+    start: dt.date | None = None
+    end: dt.date | None = None
+    where: str | None = None
+
+    @property
+    def label(self) -> str:
+        suffix = f" [{self.where}]" if self.where else ""
+        if self.start is None:
+            return f"{self.entity} ALL{suffix}"
+        if self.start.day == 1 and self.end == (self.start + dt.timedelta(days=32)).replace(day=1):
+            return f"{self.entity} {self.start:%Y-%m}{suffix}"
+        return f"{self.entity} {self.start}..{self.end}{suffix}"
+
+
+def month_units(entity: str, months) -> list[FetchUnit]:
+    """(year, month) → FetchUnit של חודש שלם"""
+    units = []
+    for y, m in months:
+        first = dt.date(y, m, 1)
+        nextm = (first + dt.timedelta(days=32)).replace(day=1)
+        units.append(FetchUnit(entity, first, nextm))
+    return units
+
+
+class IncompleteFetch(Exception):
+    """נמשכו פחות שורות מה-$count של היחידה (דף שנחתך / cap של השרת)"""
+
+
+def is_retriable(exc: BaseException) -> bool:
+    if isinstance(exc, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                        IncompleteFetch)):
+        return True
+    if isinstance(exc, requests.exceptions.HTTPError) and exc.response is not None:
+        code = exc.response.status_code
+        return code == 429 or 500 <= code < 600
+    return False
+
+
+class Throttle:
+    """השהייה משותפת: שגיאת 429/5xx אחת עוצרת את כל העובדים לזמן ה-backoff."""
+
+    def __init__(self, base: float = BACKOFF_BASE, cap: float = BACKOFF_MAX):
+        self.base, self.cap = base, cap
+        self._until = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        while True:
+            with self._lock:
+                left = self._until - time.monotonic()
+            if left <= 0:
+                return
+            time.sleep(left)
+
+    def penalize(self, attempt: int, exc: BaseException | None = None) -> float:
+        delay = min(self.cap, self.base * 2 ** (attempt - 1))
+        delay *= random.uniform(0.5, 1.0)
+        resp = getattr(exc, "response", None)
+        if resp is not None and resp.headers.get("Retry-After", "").isdigit():
+            delay = max(delay, float(resp.headers["Retry-After"]))
+        with self._lock:
+            self._until = max(self._until, time.monotonic() + delay)
+        return delay
+
+
+def run_units(duck, units: list[FetchUnit],
+              pages_for: Callable[[FetchUnit], Iterator[pa.Table]],
+              commit: Callable[[object, FetchUnit, str], None], *,
+              concurrency: int = DEFAULT_CONCURRENCY,
+              max_attempts: int = MAX_ATTEMPTS,
+              expected: dict[FetchUnit, int | None] | None = None,
+              client=None) -> dict[FetchUnit, int]:
+    """
+    מריץ את כל היחידות; מחזיר {unit: rows}.  יחידה שנכשלה סופית – מועלית
+    החריגה הראשונה בסוף הריצה (אחרי שכל השאר נכתבו).
+
+    pages_for(unit)            – מחזיר iterator של pyarrow.Table (ראה odata_pager).
+    commit(duck, unit, stage)  – רץ בטרנזקציה; מעביר את staging לטבלת היעד.
+                                 stage=None כשלא התקבלו שורות – היחידה ריקה במקור,
+                                 ה-commit מוחק את הטווח שלה (או לא עושה כלום).
+    expected                   – {unit: $count}; פחות שורות ⇒ IncompleteFetch (retry).
+    client                     – הלקוח ש-pages_for משתמש בו; בעובדים – בלי retry משלו.
+    """
+    throttle = Throttle()
+    stage_ids = itertools.count(1)
+    inbox: queue.Queue = queue.Queue(maxsize=concurrency * 2)   # גבול זיכרון
+    attempts: dict[FetchUnit, int] = {}
+    stages: dict[FetchUnit, str] = {}
+    rows: dict[FetchUnit, int] = {}
+    failed: list[tuple[FetchUnit, BaseException]] = []
+    broken: dict[FetchUnit, BaseException] = {}                 # כשל כתיבה – שאר העמודים נזרקים
+    pending = 0
+
+    def tags(unit: FetchUnit):
+        return tagged(entity=unit.entity, month=unit.start and f"{unit.start:%Y-%m}")
+
+    def worker(unit: FetchUnit) -> None:
+        try:
+            with tags(unit), (client.single_attempt() if client else contextlib.nullcontext()):
+                pages = pages_for(unit)
+                while True:
+                    with span("throttle_wait"):
+                        throttle.wait()
+                    df = next(pages, None)
+                    if df is None:
+                        break
+                    with span("queue_wait"):
+                        inbox.put(("page", unit, df))
+            inbox.put(("done", unit, None))
+        except BaseException as exc:            # מועבר לכותב
+            inbox.put(("error", unit, exc))
+
+    def drop_stage(unit: FetchUnit) -> None:
+        stage = stages.pop(unit, None)
+        if stage:
+            duck.execute(f"DROP TABLE IF EXISTS {stage}")
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        def submit(unit: FetchUnit) -> None:
+            nonlocal pending
+            attempts[unit] = attempts.get(unit, 0) + 1
+            rows[unit] = 0
+            broken.pop(unit, None)
+            pending += 1
+            pool.submit(worker, unit)
+
+        for u in units:
+            submit(u)
+
+        while pending:
+            kind, unit, payload = inbox.get()
+            if kind == "page":
+                if unit in broken:
+                    continue
+                df = payload
+                stage = stages.get(unit)
+                try:
+                    with tags(unit), span("stage_insert") as sp:
+                        if stage is None:
+                            stage = stages[unit] = f"_stage_{next(stage_ids)}"
+                            duck.execute(f"CREATE TEMP TABLE {stage} AS SELECT * FROM df")
+                        else:
+                            duck.execute(f"INSERT INTO {stage} BY NAME SELECT * FROM df")
+                        sp.add(rows=len(df))
+                except Exception as exc:
+                    # לא מעלים כאן – העובד ממשיך לשלוח עמודים לתור
+                    broken[unit] = exc
+                    drop_stage(unit)
+                    continue
+                rows[unit] += len(df)
+                continue
+
+            pending -= 1
+            if unit in broken:
+                kind, payload = "error", broken.pop(unit)
+            want = (expected or {}).get(unit)
+            if kind == "done" and want is not None and rows[unit] < want:
+                kind, payload = "error", IncompleteFetch(f"{rows[unit]:,} of {want:,} rows")
+            if kind == "done":
+                duck.begin()
+                try:
+                    with tags(unit), span("commit") as sp:
+                        commit(duck, unit, stages.get(unit))
+                        duck.commit()
+                        sp.add(rows=rows[unit])
+                except Exception as exc:
+                    # לא מעלים כאן – עובדים אחרים עדיין ממתינים על התור
+                    duck.rollback()
+                    print(f"[ERR] {unit.label} – write failed: {exc}")
+                    failed.append((unit, exc))
+                    continue
+                finally:
+                    drop_stage(unit)
+                print(f"[OK] {unit.label}  {rows[unit]:,} rows")
+                continue
+
+            # kind == "error"
+            drop_stage(unit)
+            exc = payload
+            if is_retriable(exc) and attempts[unit] < max_attempts:
+                delay = throttle.penalize(attempts[unit], exc)
+                print(f"[WARN] {unit.label} – {exc} – retry {attempts[unit] + 1}/{max_attempts} in ~{delay:.0f}s")
+                submit(unit)
+            else:
+                print(f"[ERR] {unit.label} – {exc}")
+                failed.append((unit, exc))
+
+    if failed:
+        raise failed[0][1]
+    return rows
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# etl/key_ranges.py
+# ----------------------------------------------------------
+# פיצול אוטומטי של ישות "מלאה" (בלי עמודת תאריך) לטווחי מפתח – במקום
+# המסננים הידניים של LOGPART (FAMILYNAME le '05' / gt '05').
+#
+#   • $count עם $filter על עמודת מפתח מוצהרת (SPLIT_KEYS אצל הקורא).
+#   • טווח גדול מ-target  ⇒  נקודת חציון ($orderby=KEY&$skip=n/2&$top=1)
+#     ושני תת-טווחים [lo, mid) / [mid, hi) – רקורסיבית עד שכל טווח קטן דיו.
+#   • שורות עם מפתח null לא נכנסות לאף טווח ⇒ טווח נוסף "KEY eq null".
+#   • כל טווח = FetchUnit עם where ⇒ fetch_scheduler מושך אותם במקביל,
+#     כל אחד נכתב לטבלת <table>__loading, ורק אחרי ש-verify() מאשר
+#     שסכום השורות שנמשכו = ה-$count הכולל – swap_in() מחליף את היעד.
+#
+import urllib.parse, requests
+from dataclasses import dataclass
+from fetch_scheduler import FetchUnit
+from etl_metrics import span
+
+TARGET_ROWS = 50_000     # שורות לטווח (≈ בקשה אחת-שתיים של odata_pager)
+MAX_DEPTH   = 8          # עד 256 טווחים לישות
+
+
+@dataclass(frozen=True)
+class KeyRange:
+    """[lo, hi) על עמודת המפתח; None ⇒ פתוח. nulls ⇒ רק השורות עם מפתח null."""
+    lo: object = None
+    hi: object = None
+    rows: int = 0
+    nulls: bool = False
+
+    def where(self, key: str) -> str | None:
+        if self.nulls:
+            return f"{key} eq null"
+        cond = []
+        if self.lo is not None:
+            cond.append(f"{key} ge {lit(self.lo)}")
+        if self.hi is not None:
+            cond.append(f"{key} lt {lit(self.hi)}")
+        return " and ".join(cond) or None
+
+
+def lit(v) -> str:
+    if isinstance(v, (int, float)) and not isinstance(v, bool):
+        return str(v)
+    return "'" + str(v).replace("'", "''") + "'"
+
+
+def _and(*conds: str | None) -> str | None:
+    conds = [c for c in conds if c]
+    if len(conds) <= 1:
+        return conds[0] if conds else None
+    return " and ".join(f"({c})" for c in conds)
+
+
+def _query(filt: str | None, **params) -> str:
+    q = [f"${k}={v}" for k, v in params.items()]
+    if filt:
+        q.insert(0, f"$filter={urllib.parse.quote_plus(filt)}")
+    return "?" + "&".join(q) if q else ""
+
+
+def count(client, entity_url: str, filt: str | None = None) -> int | None:
+    """
+    מספר השורות שעונות על filt. /ENTITY/$count, ואם השרת לא תומך –
+    $count=true&$top=0.  None ⇒ השרת לא מחזיר ספירה בכלל.
+    """
+    with span("count_probe"):
+        try:
+            r = client.get(f"{entity_url}/$count{_query(filt)}")
+            return int(r.text.strip().lstrip("\ufeff"))
+        except (requests.exceptions.HTTPError, ValueError):
+            pass
+        try:
+            r = client.get(f"{entity_url}{_query(filt, count='true', top=0)}")
+            n = r.json().get("@odata.count")
+            return None if n is None else int(n)
+        except (requests.exceptions.HTTPError, ValueError):
+            return None
+
+
+def key_at(client, entity_url: str, key: str, filt: str | None, skip: int):
+    """ערך המפתח בשורה ה-skip (לפי $orderby=KEY) בתוך filt"""
+    with span("count_probe"):
+        r = client.get(f"{entity_url}{_query(filt, select=key, orderby=key, skip=skip, top=1)}")
+        rows = r.json().get("value", [])
+    return rows[0].get(key) if rows else None
+
+
+def plan_ranges(client, entity_url: str, key: str, *, where: str | None = None,
+                target: int = TARGET_ROWS) -> tuple[int | None, list[KeyRange]]:
+    """
+    (סה"כ לפי $count, טווחים).  entity_url – {PRIO}/{ENTITY} בלי query.
+    בלי $count – טווח אחד פתוח (ואין בדיקת סכום).
+    """
+    total = count(client, entity_url, where)
+    if total is None:
+        return None, [KeyRange()]
+
+    def split(lo, hi, n: int, depth: int) -> list[KeyRange]:
+        whole = KeyRange(lo, hi, n)
+        if n <= target or depth >= MAX_DEPTH:
+            return [whole]
+        mid = key_at(client, entity_url, key, _and(where, whole.where(key)), n // 2)
+        if mid is None or mid == lo:
+            return [whole]                        # מפתח חוזר – אי אפשר לחתוך כאן
+        left = count(client, entity_url, _and(where, KeyRange(lo, mid).where(key)))
+        right = count(client, entity_url, _and(where, KeyRange(mid, hi).where(key)))
+        if not left or not right:
+            return [whole]
+        return split(lo, mid, left, depth + 1) + split(mid, hi, right, depth + 1)
+
+    keyed = count(client, entity_url, _and(where, f"{key} ne null"))
+    ranges = split(None, None, keyed, 0) if keyed else []
+    nulls = total - (keyed or 0)
+    if nulls > 0:
+        ranges.append(KeyRange(rows=nulls, nulls=True))
+    if sum(r.rows for r in ranges) != total:
+        print(f"[WARN] {entity_url.rsplit('/', 1)[-1]}: range counts "
+              f"{sum(r.rows for r in ranges):,} != $count {total:,} (data changed while probing?)")
+    return total, ranges or [KeyRange()]
+
+
+def split_units(client, prio: str, entity: str, key: str | None, *,
+                where: str | None = None, target: int = TARGET_ROWS
+                ) -> tuple[int | None, dict[FetchUnit, int]]:
+    """(סה"כ, {FetchUnit(where=טווח): שורות צפויות}) – key=None ⇒ יחידה אחת"""
+    url = f"{prio}/{entity}"
+    if key is None:
+        total = count(client, url, where)
+        return total, {FetchUnit(entity, where=where): total or 0}
+    total, ranges = plan_ranges(client, url, key, where=where, target=target)
+    return total, {FetchUnit(entity, where=_and(where, r.where(key))): r.rows for r in ranges}
+
+
+def verify(entity: str, total: int | None, expected: dict[FetchUnit, int],
+           fetched: dict[FetchUnit, int]) -> int:
+    """
+    סכום השורות שנמשכו מול ה-$count.  חסרות שורות ⇒ RuntimeError (היעד לא
+    מוחלף); עודף (נוספו שורות בזמן הטעינה) או טווח בודד שזז ⇒ אזהרה בלבד.
+    """
+    got = sum(fetched.get(u, 0) for u in expected)
+    if total is None:
+        return got
+    for u, n in expected.items():
+        if len(expected) > 1 and fetched.get(u, 0) != n:
+            print(f"[WARN] {u.label}: fetched {fetched.get(u, 0):,}, $count said {n:,}")
+    if got < total:
+        raise RuntimeError(f"{entity}: fetched {got:,} rows across {len(expected)} ranges, "
+                           f"$count said {total:,} – target table left unchanged")
+    if got > total:
+        print(f"[WARN] {entity}: fetched {got:,} rows, $count said {total:,} (rows added during load)")
+    return got
+
+
+def loading_table(table: str) -> str:
+    """שם (מצוטט) של טבלת הטעינה של table"""
+    return f'"{table}__loading"'
+
+
+def swap_in(duck, table: str) -> None:
+    """<table>__loading → table, בטרנזקציה אחת"""
+    duck.begin()
+    try:
+        duck.execute(f'DROP TABLE IF EXISTS "{table}"')
+        duck.execute(f'ALTER TABLE {loading_table(table)} RENAME TO "{table}"')
+        duck.commit()
+    except Exception:
+        duck.rollback()
+        raise
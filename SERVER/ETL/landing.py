@@ -0,0 +1,329 @@
+#!/usr/bin/env python
+# etl/landing.py
+# ----------------------------------------------------------
+# אזור נחיתה: כל עמוד שנמשך מ-Priority נשמר גם כקובץ Parquet (zstd),
+# כך שבנייה מחדש (שינוי מיפוי עמודות / מודל) לא צריכה לפנות ל-ERP.
+#
+#   <root>/<ENTITY>/<yyyy-mm | all>/<capture>/part-00000.parquet …
+#   <root>/<ENTITY>/manifest.jsonl     – שורה לכל capture שהושלם:
+#       URL, חלון [start, end) + עמודת התאריך / טווח מפתח, $select, זמן שליפה, שורות,
+#       ולכל קובץ – שורות + sha256.
+#
+#   • capture = יחידת שליפה אחת (FetchUnit). נכתב ל-<capture>.tmp ומקבל את
+#     שמו הסופי + שורה ב-manifest רק אחרי שכל העמודים נקראו – שליפה
+#     שנקטעה לא נשארת.
+#   • replay(unit) – העמודים מהדיסק במקום מ-Priority (--from-landing):
+#       חלון תאריכים – לכל תאריך ה-capture העדכני ביותר שמכסה אותו;
+#       טעינה מלאה   – ה-load האחרון שנחתם (seal) אחרי בדיקת $count.
+#   • compact() – מוחק captures שכוסו כולם ע"י חדשים יותר, מאחד captures
+#     של אותו חודש לקובץ אחד, שומר KEEP_FULL_LOADS טעינות מלאות ומנקה
+#     .tmp ישנים – גודל העץ ≈ גודל הנתונים פעם אחת.
+#
+#   העמודים נשמרים לפני rename לעברית – הם בדיוק מה ש-odata_pager מחזיר.
+#
+#   python landing.py [--root DIR] [ENTITY ...]     – compact + סיכום
+#
+import sys, json, uuid, shutil, hashlib, pathlib, argparse, threading, datetime as dt
+import pyarrow as pa, pyarrow.parquet as pq, pyarrow.compute as pc
+from typing import Iterator
+from fetch_scheduler import FetchUnit
+from etl_metrics import span
+
+LANDING_ROOT    = pathlib.Path(r"C:\RIT\AIBI\landing")
+MANIFEST        = "manifest.jsonl"
+KEEP_FULL_LOADS = 2            # טעינות מלאות חתומות לכל ישות
+STALE_TMP_HOURS = 24           # .tmp ותיקי captures יתומים
+
+
+def _iso(d) -> str | None:
+    return d.isoformat() if d is not None else None
+
+
+def _day(s: str | None) -> dt.date | None:
+    return dt.date.fromisoformat(s) if s else None
+
+
+def _subtract(intervals: list[tuple], covered: list[tuple]) -> list[tuple]:
+    """intervals פחות covered (שניהם רשימות [a, b))"""
+    out = intervals
+    for c0, c1 in covered:
+        nxt = []
+        for a, b in out:
+            if c1 <= a or c0 >= b:
+                nxt.append((a, b))
+                continue
+            if a < c0:
+                nxt.append((a, c0))
+            if c1 < b:
+                nxt.append((c1, b))
+        out = nxt
+    return out
+
+
+def _as_date(col: pa.ChunkedArray) -> pa.ChunkedArray:
+    if pa.types.is_string(col.type) or pa.types.is_large_string(col.type):
+        col = pc.utf8_slice_codeunits(col, 0, 10)
+    return pc.cast(col, pa.date32(), safe=False)
+
+
+class Landing:
+    """captures של ריצה אחת (load); בטוח לשימוש מכמה threads"""
+
+    def __init__(self, root: pathlib.Path = LANDING_ROOT, load_id: str | None = None):
+        self.root = pathlib.Path(root)
+        self.load = load_id or uuid.uuid4().hex[:12]
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------ manifest
+    def _manifest(self, entity: str) -> pathlib.Path:
+        return self.root / entity / MANIFEST
+
+    def records(self, entity: str) -> list[dict]:
+        try:
+            lines = self._manifest(entity).read_text(encoding="utf-8").splitlines()
+        except FileNotFoundError:
+            return []
+        return [json.loads(l) for l in lines if l.strip()]
+
+    def _append(self, entity: str, rec: dict) -> None:
+        with self._lock:
+            path = self._manifest(entity)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with path.open("a", encoding="utf-8") as f:
+                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+
+    def _rewrite(self, entity: str, recs: list[dict]) -> None:
+        with self._lock:
+            path = self._manifest(entity)
+            tmp = path.with_suffix(".tmp")
+            tmp.write_text("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in recs),
+                           encoding="utf-8")
+            tmp.replace(path)
+
+    # ------------------------------------------------------------------ write
+    def capture(self, unit: FetchUnit, url: str, pages: Iterator[pa.Table], *,
+                date_col: str | None = None,
+                select: list[str] | None = None) -> Iterator[pa.Table]:
+        """מעביר את העמודים הלאה כמו שהם, ושומר כל אחד לדיסק בדרך"""
+        name = f"{dt.datetime.now():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:6]}"
+        final = self.root / unit.entity / (f"{unit.start:%Y-%m}" if unit.start else "all") / name
+        tmp = final.with_name(name + ".tmp")
+        tmp.mkdir(parents=True)
+        fetched_at = dt.datetime.now()
+        files = []
+        try:
+            for tbl in pages:
+                with span("landing_write") as sp:
+                    buf = pa.BufferOutputStream()
+                    pq.write_table(tbl, buf, compression="zstd")
+                    data = buf.getvalue()
+                    fname = f"part-{len(files):05d}.parquet"
+                    (tmp / fname).write_bytes(data)
+                    files.append({"file": fname, "rows": tbl.num_rows,
+                                  "sha256": hashlib.sha256(data).hexdigest()})
+                    sp.add(rows=tbl.num_rows, nbytes=data.size)
+                yield tbl
+        except BaseException:                   # כולל GeneratorExit – capture חלקי נמחק
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        tmp.rename(final)
+        self._append(unit.entity, {
+            "capture": name, "path": final.relative_to(self.root).as_posix(),
+            "entity": unit.entity, "start": _iso(unit.start), "end": _iso(unit.end),
+            "date_col": date_col, "where": unit.where,
+            "select": sorted(select) if select else None, "url": url,
+            "fetched_at": fetched_at.isoformat(), "load": self.load,
+            "rows": sum(f["rows"] for f in files), "files": files,
+        })
+
+    def seal(self, entity: str) -> None:
+        """טעינה מלאה של ה-load הזה עברה את בדיקת ה-$count – זמינה ל-replay"""
+        self._append(entity, {"sealed": self.load, "entity": entity,
+                              "at": dt.datetime.now().isoformat(timespec="seconds")})
+
+    # ------------------------------------------------------------------ read
+    def _pages(self, rec: dict) -> Iterator[pa.Table]:
+        base = self.root / rec["path"]
+        for f in rec["files"]:
+            with span("landing_read") as sp:
+                tbl = pq.read_table(base / f["file"])
+                sp.add(rows=tbl.num_rows)
+            yield tbl
+
+    def replay(self, unit: FetchUnit, date_col: str | None = None,
+               select: list[str] | None = None) -> Iterator[pa.Table]:
+        """העמודים של unit מהדיסק (ראה למעלה); חלק שלא נמצא – אזהרה ודילוג"""
+        select = sorted(select) if select else None
+        recs = [r for r in self.records(unit.entity) if "capture" in r and r["select"] == select]
+        if unit.start is None:
+            sealed = [r["sealed"] for r in self.records(unit.entity) if "sealed" in r]
+            load = next((l for l in reversed(sealed)
+                         if any(r["load"] == l and r["start"] is None for r in recs)), None)
+            if load is None:
+                raise FileNotFoundError(f"{unit.entity}: no sealed full load under {self.root}")
+            # יחידה שנשלחה שוב (IncompleteFetch) – רק ה-capture האחרון של כל טווח
+            latest = {r["where"]: r for r in recs if r["load"] == load and r["start"] is None}
+            for rec in latest.values():
+                yield from self._pages(rec)
+            return
+
+        missing = yield from self._replay_window([r for r in recs if r["start"]], unit, date_col)
+        for a, b in missing:
+            print(f"[WARN] {unit.entity} {a}..{b} not in landing – skipped")
+
+    def _replay_window(self, recs: list[dict], unit: FetchUnit, date_col: str):
+        """
+        לכל תאריך ב-[unit.start, unit.end) – השורות מה-capture העדכני ביותר
+        שמכסה אותו. מחזיר (return) את הקטעים שלא כוסו.
+        """
+        covered: list[tuple] = []
+        for rec in sorted(recs, key=lambda r: r["fetched_at"], reverse=True):
+            mine = _subtract([(max(unit.start, _day(rec["start"])), min(unit.end, _day(rec["end"])))],
+                             covered)
+            mine = [(a, b) for a, b in mine if a < b]
+            if not mine:
+                continue
+            covered.append((_day(rec["start"]), _day(rec["end"])))
+            for tbl in self._pages(rec):
+                d = _as_date(tbl[date_col])
+                keep = None
+                for a, b in mine:
+                    m = pc.and_(pc.greater_equal(d, pa.scalar(a, pa.date32())),
+                                pc.less(d, pa.scalar(b, pa.date32())))
+                    keep = m if keep is None else pc.or_(keep, m)
+                tbl = tbl.filter(keep)
+                if tbl.num_rows:
+                    yield tbl
+        return _subtract([(unit.start, unit.end)], covered)
+
+    # ------------------------------------------------------------------ retention
+    def _drop(self, rec: dict) -> None:
+        shutil.rmtree(self.root / rec["path"], ignore_errors=True)
+
+    def compact(self, entities: list[str] | None = None) -> None:
+        """captures מכוסים / טעינות מלאות ישנות / .tmp יתומים; איחוד לחודש"""
+        if entities is None:
+            entities = sorted(p.name for p in self.root.iterdir() if p.is_dir()) if self.root.exists() else []
+        for entity in entities:
+            with span("landing_compact", entity=entity):
+                self._compact_entity(entity)
+
+    def _compact_entity(self, entity: str) -> None:
+        recs = self.records(entity)
+        caps = [r for r in recs if "capture" in r]
+        seals = [r for r in recs if "sealed" in r]
+        keep: list[dict] = []
+        dropped = 0
+
+        # טעינות מלאות: KEEP_FULL_LOADS האחרונות שנחתמו (+ ה-load הנוכחי, אולי לפני seal)
+        kept_loads = {s["sealed"] for s in seals[-KEEP_FULL_LOADS:]} | {self.load}
+        for r in caps:
+            if r["start"] is None and r["load"] not in kept_loads:
+                self._drop(r)
+                dropped += 1
+            elif r["start"] is None:
+                keep.append(r)
+        seals = [s for s in seals if s["sealed"] in kept_loads]
+
+        # חלונות תאריך: capture שכל החלון שלו מכוסה ע"י חדשים יותר – נמחק
+        dated = sorted((r for r in caps if r["start"]), key=lambda r: r["fetched_at"], reverse=True)
+        live: list[dict] = []
+        covered: dict[tuple, list[tuple]] = {}
+        for r in dated:
+            sel = tuple(r["select"] or ())
+            win = (_day(r["start"]), _day(r["end"]))
+            if not _subtract([win], covered.get(sel, [])):
+                self._drop(r)
+                dropped += 1
+                continue
+            covered.setdefault(sel, []).append(win)
+            live.append(r)
+
+        # איחוד: כמה captures בתוך אותו חודש קלנדרי ⇒ capture אחד (דרך replay)
+        groups: dict[tuple, list[dict]] = {}
+        for r in live:
+            s, e = _day(r["start"]), _day(r["end"])
+            month = s.replace(day=1)
+            if e <= (month + dt.timedelta(days=32)).replace(day=1):
+                groups.setdefault((month, tuple(r["select"] or ())), []).append(r)
+        merged: list[dict] = []
+        for (month, sel), rs in groups.items():
+            spans_ = sorted((_day(r["start"]), _day(r["end"])) for r in rs)
+            lo, hi = spans_[0][0], spans_[0][1]
+            contiguous = True
+            for a, b in spans_[1:]:
+                if a > hi:
+                    contiguous = False
+                    break
+                hi = max(hi, b)
+            date_col = rs[0].get("date_col")
+            if len(rs) < 2 or not contiguous or date_col is None:
+                continue
+            rec = self._rewrite_capture(FetchUnit(entity, lo, hi), rs, date_col)
+            for r in rs:
+                live.remove(r)
+                self._drop(r)
+            merged.append(rec)
+            dropped += len(rs)
+
+        self._rewrite(entity, keep + sorted(live + merged, key=lambda r: r["fetched_at"]) + seals)
+        self._clean_tmp(entity)
+        if dropped:
+            print(f"[OK] landing {entity}: {dropped} captures compacted/removed")
+
+    def _rewrite_capture(self, unit: FetchUnit, rs: list[dict], date_col: str) -> dict:
+        """capture אחד מ-rs (לפי כללי replay); מחזיר את רשומת ה-manifest שלו"""
+        tables = list(self._replay_window(rs, unit, date_col))
+        name = f"{max(r['fetched_at'] for r in rs).replace(':', '').replace('-', '')}-c{uuid.uuid4().hex[:5]}"
+        final = self.root / unit.entity / f"{unit.start:%Y-%m}" / name
+        tmp = final.with_name(name + ".tmp")
+        tmp.mkdir(parents=True)
+        files = []
+        if tables:
+            tbl = pa.concat_tables(tables, promote_options="default")
+            buf = pa.BufferOutputStream()
+            pq.write_table(tbl, buf, compression="zstd")
+            data = buf.getvalue()
+            (tmp / "part-00000.parquet").write_bytes(data)
+            files.append({"file": "part-00000.parquet", "rows": tbl.num_rows,
+                          "sha256": hashlib.sha256(data).hexdigest()})
+        tmp.rename(final)
+        return {"capture": name, "path": final.relative_to(self.root).as_posix(),
+                "entity": unit.entity, "start": _iso(unit.start), "end": _iso(unit.end),
+                "date_col": date_col, "where": None, "select": rs[0]["select"], "url": rs[0]["url"],
+                "fetched_at": max(r["fetched_at"] for r in rs), "load": "compacted",
+                "rows": sum(f["rows"] for f in files), "files": files,
+                "compacted_from": [r["capture"] for r in rs]}
+
+    def _clean_tmp(self, entity: str) -> None:
+        cutoff = dt.datetime.now().timestamp() - STALE_TMP_HOURS * 3600
+        for p in (self.root / entity).glob("*/*.tmp"):
+            if p.stat().st_mtime < cutoff:
+                shutil.rmtree(p, ignore_errors=True)
+
+    def summary(self) -> list[tuple[str, int, int, int]]:
+        """(entity, captures, rows, bytes) לכל ישות"""
+        out = []
+        if not self.root.exists():
+            return out
+        for ent in sorted(p for p in self.root.iterdir() if p.is_dir()):
+            caps = [r for r in self.records(ent.name) if "capture" in r]
+            size = sum(f.stat().st_size for f in ent.rglob("*.parquet"))
+            out.append((ent.name, len(caps), sum(r["rows"] for r in caps), size))
+        return out
+
+
+def main(argv: list[str] | None = None):
+    ap = argparse.ArgumentParser(description="compact the Priority landing zone")
+    ap.add_argument("entities", nargs="*", help="default: every entity under --root")
+    ap.add_argument("--root", type=pathlib.Path, default=LANDING_ROOT)
+    args = ap.parse_args(argv)
+
+    land = Landing(args.root)
+    land.compact(args.entities or None)
+    for ent, caps, rows, size in land.summary():
+        print(f"{ent:<25} {caps:5,d} captures {rows:12,d} rows {size / 2**20:10,.1f} MB")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,425 @@
+#!/usr/bin/env python
+# etl/mock_priority.py
+# ----------------------------------------------------------
+# שרת OData מקומי שמחקה את Priority – למדידת ה-ETL בלי לגעת בייצור.
+#
+#   ישויות (נתונים סינתטיים, דטרמיניסטיים לפי --seed):
+#       SALESINVOICEITEMS  ‎--scale שורות לחודש
+#       LOGPART / CUSTOMERS  ‎(scale/10, scale/20)
+#       FNCLOG             ‎scale/2 שורות לחודש
+#
+#   נתמך:  $filter (eq ne gt ge lt le / and or / סוגריים, תאריכים, מחרוזות, null),
+#          $select, $orderby, $top/$skip, @odata.nextLink (עמוד מקסימלי --max-page),
+#          $count=true ו-/ENTITY/$count, $metadata עם תיאורים בעברית + ETag/304,
+#          gzip, השהיה מלאכותית (--latency-ms ± --jitter-ms) ושגיאות
+#          (--error-rate: 503 / 429 עם Retry-After).
+#
+#   python ETL/mock_priority.py --port 8765 --scale 20000
+#   PRIORITY_URL=http://127.0.0.1:8765/odata/Priority/tabula.ini/demo
+#
+import re, json, gzip, time, random, hashlib, argparse, threading, urllib.parse, datetime as dt
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time_windows import local_midnight
+
+DEFAULT_MAX_PAGE = 2_000
+
+# entity → [(property, Edm type, תיאור עברי)]
+ENTITIES: dict[str, list[tuple[str, str, str]]] = {
+    "SALESINVOICEITEMS": [
+        ("IVNUM",      "Edm.String",         "חשבונית"),
+        ("KLINE",      "Edm.Int64",          "שורה"),
+        ("IVDATE",     "Edm.DateTimeOffset", "תאריך חשבונית"),
+        ("UDATE",      "Edm.DateTimeOffset", "תאריך עדכון"),
+        ("CUSTNAME",   "Edm.String",         "מס' לקוח"),
+        ("PARTNAME",   "Edm.String",         "מק\"ט"),
+        ("AGENTNAME",  "Edm.String",         "סוכן"),
+        ("TQUANT",     "Edm.Decimal",        "כמות"),
+        ("PRICE",      "Edm.Decimal",        "מחיר"),
+        ("QPRICE",     "Edm.Decimal",        "סה\"כ"),
+        ("COST",       "Edm.Decimal",        "עלות"),
+    ],
+    "LOGPART": [
+        ("PARTNAME",   "Edm.String",         "מק\"ט"),
+        ("PARTDES",    "Edm.String",         "תאור מוצר"),
+        ("FAMILYNAME", "Edm.String",         "משפחה"),
+        ("FAMILYDES",  "Edm.String",         "תאור משפחה"),
+        ("COST",       "Edm.Decimal",        "מחיר עלות"),
+        ("STATDES",    "Edm.String",         "סטטוס"),
+        ("PUNITNAME",  "Edm.String",         "יח' רכש"),
+        ("UNITNAME",   "Edm.String",         "יח' מכירה"),
+        ("SPEC13",     "Edm.String",         "דרגה"),
+    ],
+    "CUSTOMERS": [
+        ("CUSTNAME",   "Edm.String",         "מס' לקוח"),
+        ("CUSTDES",    "Edm.String",         "שם לקוח"),
+        ("CTYPECODE",  "Edm.String",         "סוג לקוח"),
+        ("CTYPENAME",  "Edm.String",         "תאור סוג לקוח"),
+        ("AGENTCODE",  "Edm.String",         "קוד סוכן"),
+        ("AGENTNAME",  "Edm.String",         "שם סוכן"),
+    ],
+    "FNCLOG": [
+        ("FNCNUM",     "Edm.String",         "מס' פקודה"),
+        ("KLINE",      "Edm.Int64",          "שורה"),
+        ("BALDATE",    "Edm.DateTimeOffset", "תאריך למאזן"),
+        ("ACCNAME",    "Edm.String",         "חשבון"),
+        ("DEBIT",      "Edm.Decimal",        "חובה"),
+        ("CREDIT",     "Edm.Decimal",        "זכות"),
+        ("DETAILS",    "Edm.String",         "פרטים"),
+    ],
+}
+KEYS = {"SALESINVOICEITEMS": ["IVNUM", "KLINE"], "LOGPART": ["PARTNAME"],
+        "CUSTOMERS": ["CUSTNAME"], "FNCLOG": ["FNCNUM", "KLINE"]}
+
+_WORDS = ["אלומיניום", "פרופיל", "זכוכית", "ידית", "ציר", "בורג", "אטם", "מסגרת",
+          "חלון", "דלת", "תריס", "מנעול", "לבן", "שחור", "כסף", "ארוך", "קצר"]
+
+
+# ----------------------------------------------------------------------------
+#                               נתונים סינתטיים
+# ----------------------------------------------------------------------------
+def _tz(d: dt.date) -> str:
+    return local_midnight(d)[-6:]              # offset ישראל האמיתי של התאריך
+
+
+def _ts(d: dt.datetime) -> str:
+    return d.strftime("%Y-%m-%dT%H:%M:%S") + _tz(d.date())
+
+
+def _months(n: int) -> list[dt.date]:
+    first = dt.date.today().replace(day=1)
+    out = []
+    for _ in range(n):
+        out.append(first)
+        first = (first - dt.timedelta(days=1)).replace(day=1)
+    return out[::-1]
+
+
+def generate(scale: int = 20_000, months: int = 12, seed: int = 7) -> dict[str, list[dict]]:
+    rnd = random.Random(seed)
+    n_parts, n_cust = max(scale // 10, 10), max(scale // 20, 10)
+    agents = [(f"A{i:02d}", f"סוכן {i}") for i in range(1, 13)]
+
+    parts = []
+    for i in range(n_parts):
+        family = rnd.randint(1, 12)
+        parts.append({
+            "PARTNAME":   f"P{i:06d}",
+            "PARTDES":    " ".join(rnd.sample(_WORDS, 3)),
+            "FAMILYNAME": f"{family:02d}",
+            "FAMILYDES":  f"משפחה {family}",
+            "COST":       round(rnd.uniform(1, 500), 2),
+            "STATDES":    rnd.choice(["פעיל", "פעיל", "פעיל", "לא פעיל"]),
+            "PUNITNAME":  rnd.choice(["יח'", "מטר", "ק\"ג"]),
+            "UNITNAME":   rnd.choice(["יח'", "מטר", "ק\"ג"]),
+            "SPEC13":     rnd.choice(["A", "B", "C", None]),
+        })
+
+    customers = []
+    for i in range(n_cust):
+        code, name = rnd.choice(agents)
+        ctype = rnd.randint(1, 5)
+        customers.append({
+            "CUSTNAME": f"C{i:05d}", "CUSTDES": f"לקוח {' '.join(rnd.sample(_WORDS, 2))} {i}",
+            "CTYPECODE": str(ctype), "CTYPENAME": f"סוג {ctype}",
+            "AGENTCODE": code, "AGENTNAME": name,
+        })
+
+    sales, fnclog = [], []
+    for m0 in _months(months):
+        days = ((m0 + dt.timedelta(days=32)).replace(day=1) - m0).days
+        iv, line = 0, 0
+        for _ in range(scale):
+            if line == 0 or rnd.random() < 0.2:
+                iv, line = iv + 1, 0
+                when = dt.datetime.combine(m0, dt.time()) + dt.timedelta(
+                    days=rnd.randrange(days), seconds=rnd.randrange(8 * 3600, 18 * 3600))
+                cust = rnd.choice(customers)
+            line += 1
+            part = rnd.choice(parts)
+            qty = rnd.randint(1, 50)
+            price = round(part["COST"] * rnd.uniform(1.1, 1.8), 2)
+            sales.append({
+                "IVNUM": f"IV{m0:%y%m}{iv:05d}", "KLINE": line,
+                "IVDATE": _ts(when.replace(hour=0, minute=0, second=0)),
+                "UDATE": _ts(when + dt.timedelta(minutes=rnd.randrange(0, 600))),
+                "CUSTNAME": cust["CUSTNAME"], "PARTNAME": part["PARTNAME"],
+                "AGENTNAME": cust["AGENTNAME"], "TQUANT": float(qty), "PRICE": price,
+                "QPRICE": round(qty * price, 2), "COST": round(qty * part["COST"], 2),
+            })
+        for j in range(scale // 2):
+            amount = round(rnd.uniform(10, 20_000), 2)
+            debit = rnd.random() < 0.5
+            fnclog.append({
+                "FNCNUM": f"F{m0:%y%m}{j // 4:05d}", "KLINE": j % 4 + 1,
+                "BALDATE": _ts(dt.datetime.combine(m0 + dt.timedelta(days=rnd.randrange(days)), dt.time())),
+                "ACCNAME": f"{rnd.randint(1000, 9999)}",
+                "DEBIT": amount if debit else 0.0, "CREDIT": 0.0 if debit else amount,
+                "DETAILS": " ".join(rnd.sample(_WORDS, 2)),
+            })
+
+    return {"SALESINVOICEITEMS": sales, "LOGPART": parts, "CUSTOMERS": customers, "FNCLOG": fnclog}
+
+
+def metadata_xml() -> bytes:
+    ann = '<Annotation Term="Priority.OData.Description" String="{}"/>'
+    facets = {"Edm.Decimal": ' Precision="18" Scale="2"'}        # הסכומים מעוגלים לאגורות
+    types = []
+    for entity, props in ENTITIES.items():
+        keys = "".join(f'<PropertyRef Name="{k}"/>' for k in KEYS[entity])
+        body = "".join(
+            f'<Property Name="{n}" Type="{t}"{facets.get(t, "")}>{ann.format(h.replace(chr(34), "&quot;"))}</Property>'
+            for n, t, h in props)
+        types.append(f'<EntityType Name="{entity}"><Key>{keys}</Key>{body}</EntityType>')
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>'
+        '<edmx:Edmx Version="4.0" xmlns:edmx="http://docs.oasis-open.org/odata/ns/edmx">'
+        '<edmx:DataServices><Schema Namespace="Priority.OData" '
+        'xmlns="http://docs.oasis-open.org/odata/ns/edm">'
+        + "".join(types) +
+        '</Schema></edmx:DataServices></edmx:Edmx>'
+    ).encode("utf-8")
+
+
+# ----------------------------------------------------------------------------
+#                               $filter
+# ----------------------------------------------------------------------------
+_TOKEN = re.compile(r"""\s*(?:
+      (?P<lp>\() | (?P<rp>\))
+    | (?P<str>'(?:[^']|'')*')
+    | (?P<ts>\d{4}-\d{2}-\d{2}T[\d:.]+(?:Z|[+-]\d{2}:\d{2})?)
+    | (?P<num>-?\d+(?:\.\d+)?)
+    | (?P<word>[A-Za-z_$][\w$]*)
+)""", re.X)
+
+_OPS = {
+    "eq": lambda a, b: a == b, "ne": lambda a, b: a != b,
+    "gt": lambda a, b: a is not None and a > b, "ge": lambda a, b: a is not None and a >= b,
+    "lt": lambda a, b: a is not None and a < b, "le": lambda a, b: a is not None and a <= b,
+}
+
+
+def _datetime(v: str) -> dt.datetime:
+    d = dt.datetime.fromisoformat(v.replace("Z", "+00:00"))
+    return d if d.tzinfo else d.replace(tzinfo=dt.timezone.utc)
+
+
+def parse_filter(text: str):
+    """$filter → פונקציה row → bool  (תת-קבוצה של OData שה-ETL שולח)"""
+    toks = []
+    pos = 0
+    while pos < len(text):
+        m = _TOKEN.match(text, pos)
+        if not m or m.end() == pos:
+            if text[pos:].strip() == "":
+                break
+            raise ValueError(f"bad $filter near {text[pos:pos + 20]!r}")
+        pos = m.end()
+        toks.append((m.lastgroup, m.group(m.lastgroup)))
+    i = 0
+
+    def peek():
+        return toks[i] if i < len(toks) else (None, None)
+
+    def take():
+        nonlocal i
+        i += 1
+        return toks[i - 1]
+
+    def value():
+        kind, v = take()
+        if kind == "str":
+            return v[1:-1].replace("''", "'"), False
+        if kind == "ts":
+            return _datetime(v), True
+        if kind == "num":
+            return (float(v) if "." in v else int(v)), False
+        if (kind, v) == ("word", "null"):
+            return None, False
+        raise ValueError(f"bad literal {v!r}")
+
+    def primary():
+        kind, v = peek()
+        if kind == "lp":
+            take()
+            f = disjunction()
+            if take()[0] != "rp":
+                raise ValueError("missing )")
+            return f
+        field = take()[1]
+        op = _OPS[take()[1].lower()]
+        lit, is_ts = value()
+        if is_ts:
+            return lambda r: op(_datetime(r[field]) if r.get(field) else None, lit)
+        return lambda r: op(r.get(field), lit)
+
+    def conjunction():
+        fs = [primary()]
+        while peek() == ("word", "and"):
+            take()
+            fs.append(primary())
+        return fs[0] if len(fs) == 1 else (lambda r: all(f(r) for f in fs))
+
+    def disjunction():
+        fs = [conjunction()]
+        while peek() == ("word", "or"):
+            take()
+            fs.append(conjunction())
+        return fs[0] if len(fs) == 1 else (lambda r: any(f(r) for f in fs))
+
+    f = disjunction()
+    if i != len(toks):
+        raise ValueError(f"trailing tokens in $filter: {toks[i:]}")
+    return f
+
+
+# ----------------------------------------------------------------------------
+#                               השרת
+# ----------------------------------------------------------------------------
+class MockPriority:
+    def __init__(self, data: dict[str, list[dict]], *, max_page: int = DEFAULT_MAX_PAGE,
+                 latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0,
+                 seed: int = 7):
+        self.data, self.max_page = data, max_page
+        self.latency_ms, self.jitter_ms, self.error_rate = latency_ms, jitter_ms, error_rate
+        self.meta = metadata_xml()
+        self.etag = '"' + hashlib.sha1(self.meta).hexdigest()[:16] + '"'
+        self._rnd = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = self.errors = self.rows_served = 0
+        self._filtered = lru_cache(maxsize=64)(self._filter_rows)
+
+    def _filter_rows(self, entity: str, filt: str, orderby: str = "") -> list[dict]:
+        rows = self.data[entity]
+        if filt:
+            keep = parse_filter(filt)
+            rows = [r for r in rows if keep(r)]
+        # $orderby=A,B desc – מיון יציב מהמפתח האחרון לראשון; null ראשון (כמו SQL Server)
+        for term in reversed([t.split() for t in orderby.split(",") if t.strip()]):
+            col, desc = term[0], len(term) > 1 and term[1].lower() == "desc"
+            rows = sorted(rows, key=lambda r: (r.get(col) is not None, r.get(col) or ""),
+                          reverse=desc)
+        return rows
+
+    def _chaos(self) -> int | None:
+        """השהיה + שגיאה אקראית; מחזיר קוד שגיאה או None"""
+        with self._lock:
+            delay = max(0.0, self.latency_ms + self._rnd.uniform(-1, 1) * self.jitter_ms)
+            fail = self._rnd.random() < self.error_rate
+            code = self._rnd.choice([503, 503, 429]) if fail else None
+        time.sleep(delay / 1000)
+        return code
+
+    def handle(self, path: str, query: str, base: str) -> tuple[int, dict, bytes]:
+        """(status, headers, body) לבקשת GET אחת"""
+        with self._lock:
+            self.requests += 1
+        code = self._chaos()
+        if code:
+            with self._lock:
+                self.errors += 1
+            return code, {"Retry-After": "1"}, b'{"error":"injected"}'
+
+        parts = [p for p in path.split("/") if p]
+        if parts and parts[-1] == "$metadata":
+            return 200, {"Content-Type": "application/xml", "ETag": self.etag}, self.meta
+
+        count_only = parts and parts[-1] == "$count"
+        entity = parts[-2] if count_only else (parts[-1] if parts else "")
+        if entity not in self.data:
+            return 404, {}, json.dumps({"error": f"no entity {entity}"}).encode()
+
+        q = {k: v[-1] for k, v in urllib.parse.parse_qs(query, keep_blank_values=True).items()}
+        try:
+            rows = self._filtered(entity, q.get("$filter", ""), q.get("$orderby", ""))
+        except (ValueError, KeyError) as exc:
+            return 400, {}, json.dumps({"error": str(exc)}).encode()
+        if count_only:
+            return 200, {"Content-Type": "text/plain"}, str(len(rows)).encode()
+
+        skip = int(q.get("$skip", 0))
+        top = int(q.get("$top", len(rows)))
+        n = min(top, self.max_page)
+        page = rows[skip:skip + n]
+        if "$select" in q:
+            cols = q["$select"].split(",")
+            page = [{c: r.get(c) for c in cols} for r in page]
+        body = {"@odata.context": f"{base}/$metadata#{entity}", "value": page}
+        if q.get("$count") == "true":
+            body["@odata.count"] = len(rows)
+        if top > n and len(page) == n:
+            nq = dict(q, **{"$skip": str(skip + n), "$top": str(top - n)})
+            body["@odata.nextLink"] = f"{base}/{entity}?{urllib.parse.urlencode(nq, safe='$,')}"
+        with self._lock:
+            self.rows_served += len(page)
+        return 200, {"Content-Type": "application/json; charset=utf-8"}, \
+            json.dumps(body, ensure_ascii=False).encode("utf-8")
+
+    def handler(self) -> type[BaseHTTPRequestHandler]:
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                url = urllib.parse.urlsplit(self.path)
+                host = self.headers.get("Host", "127.0.0.1")
+                base = f"http://{host}{url.path.rsplit('/', 2 if url.path.endswith('$count') else 1)[0]}"
+                status, headers, body = mock.handle(url.path, url.query, base)
+                if status == 200 and headers.get("ETag") and \
+                        self.headers.get("If-None-Match") == headers["ETag"]:
+                    status, body = 304, b""
+                if body and "gzip" in self.headers.get("Accept-Encoding", ""):
+                    body = gzip.compress(body, compresslevel=1)
+                    headers["Content-Encoding"] = "gzip"
+                self.send_response(status)
+                for k, v in headers.items():
+                    self.send_header(k, v)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def serve(self, port: int = 0, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """מפעיל את השרת ב-thread רקע; port=0 ⇒ פורט פנוי (server.server_port)"""
+        server = ThreadingHTTPServer((host, port), self.handler())
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+def main():
+    ap = argparse.ArgumentParser(description="local Priority OData stand-in")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--scale", type=int, default=20_000, help="sales rows per month")
+    ap.add_argument("--months", type=int, default=12)
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--max-page", type=int, default=DEFAULT_MAX_PAGE,
+                    help="server-side page cap (larger $top ⇒ nextLink)")
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--jitter-ms", type=float, default=0.0)
+    ap.add_argument("--error-rate", type=float, default=0.0, help="fraction of 503/429 replies")
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    data = generate(args.scale, args.months, args.seed)
+    print(f"✓ data generated in {time.perf_counter() - t0:.1f}s: "
+          + ", ".join(f"{e}={len(r):,}" for e, r in data.items()))
+    mock = MockPriority(data, max_page=args.max_page, latency_ms=args.latency_ms,
+                        jitter_ms=args.jitter_ms, error_rate=args.error_rate, seed=args.seed)
+    server = mock.serve(args.port)
+    print(f"🔗 PRIORITY_URL=http://127.0.0.1:{server.server_port}/odata/Priority/tabula.ini/demo")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print(f"🏁 {mock.requests:,} requests, {mock.errors:,} injected errors, "
+              f"{mock.rows_served:,} rows served")
+
+
+if __name__ == "__main__":
+    main()
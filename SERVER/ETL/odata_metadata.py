@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# etl/odata_metadata.py
+# ----------------------------------------------------------
+# $metadata של Priority  →  EdmModel:
+#     hebrew  – {entity: {orig_col: hebrew_col}}
+#     types   – {entity: {orig_col: "Edm.*"}}   (ראה odata_types)
+#               Edm.Decimal עם Precision / Scale ⇒ "Edm.Decimal(p,s)"
+#     keys    – {entity: [orig_col …]}          (<Key> – $orderby של הדפדוף)
+#
+#   • פירוק אינקרמנטלי (iterparse) – כל EntityType מעובד ומשוחרר מיד,
+#     בלי לבנות עץ XML מלא; מניעת כפילויות בשמות ב-O(1) לכל שדה.
+#   • התוצאה נשמרת בקובץ JSON מקומי. בריצה הבאה:
+#       - בתוך ה-TTL              → נטען מהדיסק בלי לגשת לרשת.
+#       - אחרי ה-TTL              → GET מותנה (ETag / Last-Modified); 304 ⇒ מהדיסק.
+#       - refresh=True             → טעינה מחדש בכל מקרה (--refresh-metadata).
+#   • load_metadata מוגן ב-lock: כמה threads / שלבים במקביל עם מטמון קר –
+#     GET אחד, והשאר קוראים את המטמון שנכתב. הכתיבה – לקובץ זמני ייחודי
+#     ואז os.replace, כך ששני כותבים לא מתנגשים על אותו .tmp.
+#
+import io, os, re, json, time, pathlib, tempfile, threading, xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+
+CACHE_VERSION = 4
+CACHE_TTL     = 24 * 3600     # שניות
+_LOAD_LOCK    = threading.Lock()
+
+_edm        = "{http://docs.oasis-open.org/odata/ns/edm}"
+_prop_tag   = f"{_edm}Property"
+_entity_tag = f"{_edm}EntityType"
+_keyref_tag = f"{_edm}PropertyRef"
+_desc_term  = "Priority.OData.Description"
+
+
+def _edm_type(attrib: dict) -> str:
+    """Type של Property; Decimal עם Precision (ו-Scale מספרי, ברירת מחדל 0) – עם הפאסטות"""
+    typ = attrib["Type"]
+    prec, scale = attrib.get("Precision", ""), attrib.get("Scale", "0")
+    if typ == "Edm.Decimal" and prec.isdigit() and scale.isdigit():
+        return f"{typ}({prec},{scale})"
+    return typ
+
+
+def normalize_desc(desc: str) -> str:
+    """ממיר תיאור עברי לשם עמודה חוקי: רווחים → _, מוריד גרשיים"""
+    name = re.sub(r"\s+", "_", desc.strip())
+    return name.replace("\"", "").replace("'", "")
+
+
+@dataclass
+class EdmModel:
+    hebrew: dict[str, dict[str, str]] = field(default_factory=dict)
+    types:  dict[str, dict[str, str]] = field(default_factory=dict)
+    keys:   dict[str, list[str]]      = field(default_factory=dict)
+
+    @classmethod
+    def from_cache(cls, cached: dict) -> "EdmModel":
+        return cls(cached["hebrew"], cached["types"], cached.get("keys", {}))
+
+
+def parse_metadata(source) -> EdmModel:
+    """
+    source – bytes או file-like של ה-XML.
+    hebrew: שדה בלי תיאור עברי – לא נכלל.  types: כל ה-Property.
+    keys: ה-PropertyRef של <Key>, לפי הסדר.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+
+    model = EdmModel()
+    entity: str | None = None
+    cols: dict[str, str] = {}
+    types: dict[str, str] = {}
+    keys: list[str] = []
+    used: set[str] = set()            # שמות עבריים שכבר נתפסו ב-entity הנוכחית
+    next_idx: dict[str, int] = {}     # base → הסיומת האחרונה שניתנה
+    depth = 0                         # עומק בתוך ה-EntityType הנוכחי
+
+    for event, elem in ET.iterparse(source, events=("start", "end")):
+        if event == "start":
+            if elem.tag == _entity_tag:
+                entity = elem.attrib.get("Name")
+                cols, types, keys, used, next_idx, depth = {}, {}, [], set(), {}, 0
+            elif entity is not None:
+                depth += 1
+            continue
+
+        # ---- end ----
+        if elem.tag == _entity_tag:
+            if entity is not None and cols:
+                model.hebrew[entity] = cols
+            if entity is not None and types:
+                model.types[entity] = types
+            if entity is not None and keys:
+                model.keys[entity] = keys
+            entity = None
+            elem.clear()
+            continue
+        if entity is None:
+            continue
+        depth -= 1
+        if elem.tag == _keyref_tag and elem.attrib.get("Name"):
+            keys.append(elem.attrib["Name"])
+            continue
+        if elem.tag != _prop_tag or depth != 0:
+            continue
+
+        orig_name = elem.attrib.get("Name")
+        if orig_name is not None and elem.attrib.get("Type"):
+            types[str(orig_name)] = _edm_type(elem.attrib)
+        hebrew = None
+        for ann in elem:
+            if ann.attrib.get("Term") == _desc_term and ann.attrib.get("String"):
+                hebrew = ann.attrib["String"]
+                break
+        elem.clear()
+        if orig_name is None or not hebrew:
+            continue  # אין תיאור עברי – מדלג
+
+        # מניעת כפילויות: base, base_2, base_3 …
+        base = norm = normalize_desc(hebrew)
+        if norm in used:
+            idx = next_idx.get(base, 1)
+            while norm in used:
+                idx += 1
+                norm = f"{base}_{idx}"
+            next_idx[base] = idx
+        used.add(norm)
+        cols[str(orig_name)] = norm
+
+    return model
+
+
+def load_metadata(client, url: str, cache_path: pathlib.Path, *,
+                  refresh: bool = False, ttl: float = CACHE_TTL) -> EdmModel:
+    """המודל מהמטמון המקומי, או מ-Priority כשצריך (ראה הערה בראש הקובץ)."""
+    with _LOAD_LOCK:
+        return _load_metadata(client, url, cache_path, refresh, ttl)
+
+
+def _load_metadata(client, url: str, cache_path: pathlib.Path, refresh: bool, ttl: float) -> EdmModel:
+    cached = None
+    if cache_path.exists() and not refresh:
+        try:
+            cached = json.loads(cache_path.read_text(encoding="utf-8"))
+            if cached.get("version") != CACHE_VERSION or cached.get("url") != url:
+                cached = None
+        except (OSError, ValueError):
+            cached = None
+
+    if cached and time.time() - cached["fetched_at"] < ttl:
+        print(f"metadata: cache hit ({cache_path.name})")
+        return EdmModel.from_cache(cached)
+
+    headers = {"Accept": "application/xml"}
+    if cached:
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+    print(f"URL {url}")
+    r = client.get(url, headers=headers)
+    if r.status_code == 304 and cached:
+        print("metadata: not modified (304)")
+        cached["fetched_at"] = time.time()
+        _write_cache(cache_path, cached)
+        return EdmModel.from_cache(cached)
+
+    model = parse_metadata(r.content)
+    _write_cache(cache_path, {
+        "version":       CACHE_VERSION,
+        "url":           url,
+        "etag":          r.headers.get("ETag"),
+        "last_modified": r.headers.get("Last-Modified"),
+        "fetched_at":    time.time(),
+        "hebrew":        model.hebrew,
+        "types":         model.types,
+        "keys":          model.keys,
+    })
+    return model
+
+
+def read_cache(cache_path: pathlib.Path) -> EdmModel | None:
+    """המודל מהמטמון בלבד (בלי רשת ובלי TTL) – לקוראים שלא מושכים מ-Priority"""
+    try:
+        cached = json.loads(cache_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if cached.get("version") != CACHE_VERSION:
+        return None
+    return EdmModel.from_cache(cached)
+
+
+def _write_cache(path: pathlib.Path, doc: dict) -> None:
+    # כתיבה לקובץ זמני ייחודי + rename – ריצה שנקטעה לא משאירה JSON שבור,
+    # ושני תהליכים לא כותבים לאותו .tmp
+    with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=path.parent, prefix=path.name,
+                                     suffix=".tmp", delete=False) as f:
+        f.write(json.dumps(doc, ensure_ascii=False))
+    try:
+        os.replace(f.name, path)
+    except OSError:
+        os.unlink(f.name)
+        raise
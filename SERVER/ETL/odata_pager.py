@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+# etl/odata_pager.py
+# ----------------------------------------------------------
+# שליפה מדורגת (paged) מ-Priority OData במקום בקשה אחת עם $top=100000.
+#
+#   • עוקב אחרי @odata.nextLink כשהשרת מחזיר אותו (server-driven paging).
+#   • אחרת – מתקדם עם $skip/$top עד שמתקבל עמוד חלקי. $skip בלי סדר קבוע
+#     עלול לדלג על שורות / להחזיר אותן פעמיים, לכן order_by (מפתח הישות,
+#     EdmModel.keys) מתווסף כ-$orderby לכל בקשה – אלא אם ה-URL כבר ממיין.
+#   • גודל העמוד מותאם לפי זמן התגובה שנמדד (PageSizer).
+#   • כל עמוד נכתב ל-DuckDB מיד עם הגעתו (load_pages) – הזיכרון
+#     תלוי בגודל העמוד ולא בגודל החודש.
+#   • כל עמוד הוא pyarrow.Table מטופס לפי EDM (odata_types) – DuckDB סורק
+#     אותו ישירות, בלי DataFrame של object.
+#   • http / json_decode / arrow_build / duckdb_insert נמדדים (etl_metrics).
+#   • התשובה מפוענחת תוך כדי הזרמה (ijson) – שורות ה-`value` נאספות
+#     ל-batch-ים של BATCH_ROWS ונשלחות מיד; בזיכרון אין את גוף התשובה,
+#     את רשימת ה-dict המלאה ואת ה-DataFrame יחד – רק batch אחד.
+#     בלי ijson – r.json() של העמוד, ואז חיתוך ל-batch-ים (כמו קודם).
+#
+import time, requests, urllib3, pyarrow as pa
+from typing import Callable, Iterator
+from odata_types import rows_to_arrow
+from etl_metrics import span
+
+try:
+    import ijson
+    from ijson.common import ObjectBuilder
+except ImportError:                   # אופציונלי – pip install ijson
+    ijson = None
+
+DEFAULT_PAGE   = 5_000
+MIN_PAGE       = 500
+MAX_PAGE       = 50_000
+TARGET_SECONDS = 15.0      # זמן יעד לבקשה אחת
+BATCH_ROWS     = 10_000    # שורות ל-pyarrow.Table אחד (גבול הזיכרון)
+
+
+class PageSizer:
+    """מחשב את גודל העמוד הבא לפי קצב השורות/שנייה שנמדד בעמוד הקודם."""
+
+    def __init__(self, size: int = DEFAULT_PAGE, target: float = TARGET_SECONDS,
+                 lo: int = MIN_PAGE, hi: int = MAX_PAGE):
+        self.size, self.target, self.lo, self.hi = size, target, lo, hi
+
+    def observe(self, rows: int, seconds: float) -> int:
+        if rows and seconds > 0:
+            want = int(rows / seconds * self.target)
+            # לא יותר מפי 2 (או חצי) בכל צעד – מונע קפיצות בגלל עמוד חריג
+            want = max(self.size // 2, min(want, self.size * 2))
+            self.size = max(self.lo, min(want, self.hi))
+        return self.size
+
+
+def _with_order(url: str, order_by: list[str] | None) -> str:
+    if not order_by or "$orderby=" in url:
+        return url
+    sep = "&" if "?" in url else "?"
+    return f"{url}{sep}$orderby={','.join(order_by)}"
+
+
+def _with_paging(url: str, top: int, skip: int) -> str:
+    sep = "&" if "?" in url else "?"
+    return f"{url}{sep}$top={top}&$skip={skip}"
+
+
+class _Counting:
+    """file-like מעל resp.raw – סופר bytes אחרי פריסת gzip"""
+
+    def __init__(self, raw):
+        self.raw, self.n = raw, 0
+
+    def read(self, size: int = -1) -> bytes:
+        b = self.raw.read(size)
+        self.n += len(b)
+        return b
+
+
+def _stream_rows(resp, meta: dict) -> Iterator[dict]:
+    """
+    שורות `value` אחת-אחת מתוך גוף התשובה, בלי לטעון אותו כולו.
+    שדות ברמה העליונה (@odata.nextLink …) נשמרים ב-`meta`.
+    """
+    resp.raw.decode_content = True
+    body = _Counting(resp.raw)
+    builder = None
+    try:
+        for prefix, event, value in ijson.parse(body, use_float=True):
+            if builder is not None:
+                builder.event(event, value)
+                if prefix == "value.item" and event == "end_map":
+                    yield builder.value
+                    builder = None
+            elif prefix == "value.item" and event == "start_map":
+                builder = ObjectBuilder()
+                builder.event(event, value)
+            elif prefix.startswith("@odata.") and event in ("string", "number"):
+                meta[prefix] = value
+    except urllib3.exceptions.HTTPError as exc:
+        # ניתוק באמצע הגוף – כמו ניתוק לפני התשובה (fetch_scheduler יחזור)
+        raise requests.exceptions.ConnectionError(str(exc)) from exc
+    finally:
+        meta["body_bytes"] = body.n
+        meta["wire_bytes"] = resp.raw.tell()
+        resp.close()
+
+
+def _page_batches(client, url: str, types: dict[str, str] | None, meta: dict,
+                  batch_rows: int) -> Iterator[pa.Table]:
+    """עמוד אחד (בקשת GET אחת) → pyarrow.Table-ים של עד batch_rows שורות"""
+    if ijson is None:
+        with span("http") as sp:
+            r = client.get(url)
+            sp.add(nbytes=len(r.content))
+        with span("json_decode") as sp:
+            body = r.json()
+            rows = body.pop("value", [])
+            sp.add(rows=len(rows))
+        meta.update(body)
+        del r, body
+        for i in range(0, len(rows), batch_rows):
+            with span("arrow_build") as sp:
+                tbl = rows_to_arrow(rows[i:i + batch_rows], types)
+                sp.add(rows=tbl.num_rows)
+            yield tbl
+        return
+
+    with span("http"):
+        r = client.get(url, stream=True)
+    rows_it = _stream_rows(r, meta)
+    while True:
+        with span("json_decode") as sp:
+            batch = [row for _, row in zip(range(batch_rows), rows_it)]
+            sp.add(rows=len(batch))
+        if not batch:
+            break
+        with span("arrow_build") as sp:
+            tbl = rows_to_arrow(batch, types)
+            sp.add(rows=len(batch))
+        del batch
+        yield tbl
+    client.add_bytes(meta.get("wire_bytes", 0), meta.get("body_bytes", 0))
+
+
+def iter_pages(url: str, client, *, types: dict[str, str] | None = None,
+               order_by: list[str] | None = None, sizer: PageSizer | None = None,
+               batch_rows: int = BATCH_ROWS) -> Iterator[pa.Table]:
+    """
+    מחזיר pyarrow.Table לכל batch (עד batch_rows שורות; עמוד גדול ⇒ כמה batch-ים).
+    `url`    – כתובת הישות כולל $select/$filter אבל *בלי* $top/$skip.
+    `client` – PriorityClient (session משותף + retry).
+    `types`  – {property: "Edm.*"} של הישות (EdmModel.types[entity]).
+    `order_by` – מפתח הישות (EdmModel.keys[entity]) ל-$orderby; בלעדיו – $skip
+                 על סדר השרת (אזהרה כשמגיעים לשם).
+    """
+    sizer = sizer or PageSizer()
+    url = _with_order(url, order_by)
+    skip = 0
+    while True:
+        top = sizer.size
+        next_url: str | None = _with_paging(url, top, skip)
+        window = 0
+        # בתוך חלון $top – השרת עשוי לפצל בעצמו ולהחזיר nextLink
+        while next_url:
+            print("URL", next_url)
+            meta: dict = {}
+            rows = 0
+            busy = 0.0            # זמן בתוך השליפה בלבד – בלי זמן הכתיבה של הצרכן
+            t0 = time.perf_counter()
+            for tbl in _page_batches(client, next_url, types, meta, batch_rows):
+                busy += time.perf_counter() - t0
+                rows += tbl.num_rows
+                yield tbl
+                t0 = time.perf_counter()
+            busy += time.perf_counter() - t0
+            sizer.observe(rows, busy)
+            window += rows
+            next_url = meta.get("@odata.nextLink")
+        if window < top:
+            return
+        if skip == 0 and "$orderby=" not in url:
+            print(f"[WARN] $skip paging without $orderby – rows may be skipped or repeated: {url}")
+        skip += window
+
+
+def table_exists(duck, table: str) -> bool:
+    """table – שם רגיל או מצוטט"""
+    name = table[1:-1].replace('""', '"') if table.startswith('"') else table
+    return duck.execute("""
+        SELECT 1 FROM information_schema.tables
+        WHERE table_catalog = current_database() AND table_schema = 'main' AND table_name = ?
+    """, [name]).fetchone() is not None
+
+
+def load_pages(duck, table: str, pages: Iterator[pa.Table], *,
+               replace: bool = False, before_first: str | None = None,
+               transform: Callable[[pa.Table], pa.Table] | None = None) -> int:
+    """
+    כותב עמודים לטבלה `table` (שם מצוטט אם צריך) בטרנזקציה אחת.
+
+    replace       – CREATE OR REPLACE מהעמוד הראשון (טעינה מלאה).
+    before_first  – SQL שירוץ לפני העמוד הראשון (למשל DELETE של החודש).
+                    רץ גם כשלא התקבלה אף שורה (אם הטבלה קיימת) – חודש
+                    שהתרוקן במקור לא משאיר שורות ישנות.
+    transform     – פונקציה על כל עמוד (למשל rename לעברית).
+
+    replace בלי אף שורה – הטבלה לא נוגעת.
+    """
+    total = 0
+    duck.begin()
+    try:
+        for df in pages:
+            if transform:
+                df = transform(df)
+            if total == 0:
+                with span("duckdb_create"):
+                    if replace:
+                        duck.execute(f"CREATE OR REPLACE TABLE {table} AS SELECT * FROM df WHERE FALSE")
+                    else:
+                        duck.execute(f"CREATE TABLE IF NOT EXISTS {table} AS SELECT * FROM df WHERE FALSE")
+                if before_first:
+                    with span("duckdb_delete"):
+                        duck.execute(before_first)
+            with span("duckdb_insert") as sp:
+                duck.execute(f"INSERT INTO {table} BY NAME SELECT * FROM df")
+                sp.add(rows=len(df))
+            total += len(df)
+        if total == 0 and before_first and table_exists(duck, table):
+            with span("duckdb_delete"):
+                duck.execute(before_first)
+        duck.commit()
+    except Exception:
+        duck.rollback()
+        raise
+    return total
@@ -7,21 +7,50 @@
 # חדש:
 #   • אפשר להגדיר אילו שדות להביא מכל ישות OData – ב-SELECT_FIELDS למטה.
 #   • אם ישות אינה מופיעה ב-SELECT_FIELDS **או** שהרשימה ריקה ⇒ יישלפו כל השדות.
-#   • LOGPART יטען בשתי קריאות עם שני מסננים, ויתאחד לטבלה אחת.
+#   • הטבלאות הסטטיות מפוצלות לטווחי מפתח לפי $count (key_ranges, SPLIT_KEYS),
+#     נמשכות במקביל (fetch_scheduler) ומוחלפות רק אם סכום השורות = $count.
+#   • השליפה מדורגת (odata_pager) – כל עמוד נכתב ל-DuckDB עם הגעתו.
+#   • --sales-mode incremental: במקום DELETE+טעינה של כל החודש – רק שורות
+#     שהשתנו מאז ה-watermark (טבלת etl_watermarks), ו-upsert לפי מפתח.
+#   • --storage parquet: החודש הנוכחי נכתב כמחיצת Parquet (parquet_store).
+#   • החודש הנוכחי נמשך בחלונות לפי $count (time_windows) – חודש עמוס
+#     בשבועות/ימים, וכל חלון נבדק מול ה-$count שלו לפני ה-commit.
+#   • כל עמוד נשמר גם באזור הנחיתה (landing); --from-landing בונה את
+#     הטבלאות מחדש מהקבצים בלי לפנות ל-Priority, --no-landing – בלי שמירה.
+#     (--sales-mode incremental לא נשמר – delta לפי watermark אינו חלון.)
+#   • --dim-mode delta (ברירת מחדל): הטבלאות המלאות לא מוחלפות – רק שורות
+#     שנוספו / השתנו / נמחקו לפי מפתח עסקי (DIM_KEYS) ו-hash שורה (dim_sync);
+#     scd2 – וגם _hist_<dst> עם VALID_FROM / VALID_TO;  replace – החלפה מלאה.
 #
-import os, requests, pathlib, datetime as dt, urllib.parse, duckdb, pandas as pd, dotenv
+import os, json, pathlib, argparse, functools, datetime as dt, urllib.parse, duckdb, dotenv
+from priority_client import PriorityClient
+from odata_pager import iter_pages, load_pages
+from fetch_scheduler import DEFAULT_CONCURRENCY, FetchUnit, run_units
+from key_ranges import split_units, verify, loading_table, swap_in
+from dim_sync import sync as sync_dim
+from time_windows import plan_windows, window_filter, checked_pages
+from landing import Landing
+from odata_metadata import EdmModel, load_metadata
+from parquet_store import attach_table, write_partition, drop_partition
+import etl_metrics
+from etl_metrics import span, tagged
 dotenv.load_dotenv()
 
 RAW_DB = pathlib.Path(r"C:\RIT\AIBI\raw_best.duckdb")
 PRIO   = os.environ["PRIORITY_URL"].rstrip("/")
 AUTH   = (os.environ["PRIORITY_USER"], os.environ["PRIORITY_PASS"])
+PRIO_CLIENT = PriorityClient(AUTH)
+PARQUET_ROOT = RAW_DB.with_name("raw_parquet")
+META_URL       = f"{PRIO}/$metadata"
+METADATA_CACHE = RAW_DB.with_name("odata_metadata.json")
+LANDING_ROOT   = RAW_DB.with_name("landing")
 
 # ------------------------------------------------------------
 #      מיפוי:  טבלה ב-DuckDB  →  ישות ב-Priority (OData)
 # ------------------------------------------------------------
 TABLES_STATIC = {
     "stg_customers":     "CUSTOMERS",
-    "stg_parts":         "LOGPART",           # כאן נטפל באופן מיוחד
+    "stg_parts":         "LOGPART",
     "stg_partarc":       "ROTL_PARTARCFLAT",
 }
 
@@ -36,79 +65,346 @@ SELECT_FIELDS = {
      "ROTL_PARTARCFLAT"  : ["PARTNAME", "PARTDES", "GPARTNAME"]
 }
 
+# ------------------------------------------------------------
+#      טעינה מלאה בטווחי מפתח  (key_ranges)
+#      • מפתח – ישות;  ערך – עמודה עם סדר יציב ($orderby), כמעט ייחודית.
+#      • ישות שלא מופיעה כאן – יחידה אחת (עדיין עם בדיקת $count).
+# ------------------------------------------------------------
+SPLIT_KEYS = {
+    "CUSTOMERS":         "CUSTNAME",
+    "LOGPART":           "PARTNAME",
+    "ROTL_PARTARCFLAT":  "PARTNAME",
+}
+
+# ------------------------------------------------------------
+#      סנכרון דלתא של הטבלאות המלאות  (dim_sync)
+#      • מפתח – טבלה ב-DuckDB;  ערך – המפתח העסקי של שורה.
+#      • טבלה שלא מופיעה כאן – מוחלפת כולה (swap_in).
+# ------------------------------------------------------------
+DIM_KEYS = {
+    "stg_customers":     ["CUSTNAME"],
+    "stg_parts":         ["PARTNAME"],
+    "stg_partarc":       ["PARTNAME", "GPARTNAME"],
+}
+
+# ------------------------------------------------------------
+#      סנכרון אינקרמנטלי של SALESINVOICEITEMS
+#      • UPDATE_COL – חותמת עדכון אחרון של השורה ב-Priority.
+#      • KEY_COLS   – מפתח עסקי של שורת חשבונית (חשבונית + שורה).
+#      • שניהם נבדקים מול ה-$metadata בתחילת load_sales (incremental_problem);
+#        שדה חסר ⇒ טעינה מחדש של החודש במקום upsert.
+# ------------------------------------------------------------
+SALES_ENTITY     = "SALESINVOICEITEMS"
+SALES_TABLE      = "stg_salesinvoiceitems"
+SALES_UPDATE_COL = "UDATE"
+SALES_KEY_COLS   = ["IVNUM", "KLINE"]
+WATERMARK_TABLE  = "etl_watermarks"
+# חותמות הזמן נשמרות כשעון-קיר (odata_types); ה-offset הגבוה של ישראל (קיץ)
+# הופך את ה-watermark למוקדם-או-שווה לאמיתי – לכל היותר שליפה חוזרת, לא החמצה.
+WATERMARK_TZ     = "+03:00"
+
 # ------------------------------------------------------------
 def build_url(entity: str, extra_q: str = "") -> str:
     """
-    מרכיב URL  עם $top ו-$select (אם הוגדר בתחילת הקובץ).
+    מרכיב URL  עם $select (אם הוגדר בתחילת הקובץ).
     `extra_q` – טקסט שאולי כבר מכיל $filter / $orderby וכו'.
+    $top/$skip מתווספים ע"י odata_pager.iter_pages.
     """
     parts = []
     sel = SELECT_FIELDS.get(entity.upper(), [])
     if sel:
         parts.append(f"$select={','.join(sel)}")
-    parts.append("$top=100000")
     if extra_q:
         parts.append(extra_q.lstrip("&?"))
     return f"{PRIO}/{entity}?{'&'.join(parts)}"
 
-def fetch(url: str) -> pd.DataFrame:
-    print("🔗", url)
-    r = requests.get(url, auth=AUTH, timeout=180)
-    r.raise_for_status()
-    return pd.DataFrame(r.json().get("value", []))
+@functools.cache
+def edm_model() -> EdmModel:
+    """טיפוסי EDM מ-$metadata (מטמון מקומי – ראה odata_metadata)"""
+    return load_metadata(PRIO_CLIENT, META_URL, METADATA_CACHE)
 
-def month_filter(year: int, month: int) -> str:
-    tz = "+02:00"  # Jerusalem
-    start = dt.date(year, month, 1)
-    nextm = (start + dt.timedelta(days=32)).replace(day=1)
-    s = f"{start}T00:00:00{tz}"
-    e = f"{nextm}T00:00:00{tz}"
-    return f"(IVDATE ge {s} and IVDATE lt {e})"
+def entity_pages(entity: str, url: str):
+    """עמודי Arrow מטופסים לפי ה-EDM של הישות, ממוינים לפי המפתח שלה ($skip יציב)"""
+    model = edm_model()
+    return iter_pages(url, PRIO_CLIENT, types=model.types.get(entity), order_by=model.keys.get(entity))
+
+def landed(land: Landing | None, unit, url: str, pages, date_col: str | None = None):
+    """pages דרך אזור הנחיתה (אם פעיל)"""
+    if land is None:
+        return pages
+    return land.capture(unit, url, pages, date_col=date_col, select=SELECT_FIELDS.get(unit.entity))
 
-def fetch_sales_month(year: int, month: int) -> pd.DataFrame:
-    filt = urllib.parse.quote_plus(month_filter(year, month))
-    extra = f"$filter={filt}"
-    url = build_url("SALESINVOICEITEMS", extra)
-    return fetch(url)
+def sales_window_pages(unit, land: Landing | None = None):
+    filt = urllib.parse.quote_plus(window_filter("IVDATE", unit.start, unit.end))
+    url  = build_url(SALES_ENTITY, f"$filter={filt}")
+    return landed(land, unit, url, entity_pages(SALES_ENTITY, url), "IVDATE")
+
+def current_month_pages(landing: str = "save"):
+    """
+    החודש הנוכחי בחלונות לפי $count; חלון חסר ⇒ IncompleteFetch (rollback).
+    landing="replay" – מאזור הנחיתה במקום מ-Priority.
+    """
+    start = dt.date.today().replace(day=1)
+    nextm = (start + dt.timedelta(days=32)).replace(day=1)
+    if landing == "replay":
+        return Landing(LANDING_ROOT).replay(FetchUnit(SALES_ENTITY, start, nextm), "IVDATE",
+                                            SELECT_FIELDS.get(SALES_ENTITY))
+    land = Landing(LANDING_ROOT) if landing == "save" else None
+    with span("window_plan"):
+        windows = plan_windows(PRIO_CLIENT, PRIO, SALES_ENTITY, "IVDATE", start, nextm)
+    return checked_pages(windows, lambda u: sales_window_pages(u, land))
 
 # ------------------------------------------------------------
-def main() -> None:
-    duck = duckdb.connect(str(RAW_DB))
+#      watermark:  (last_update, last_key)  לכל ישות
+# ------------------------------------------------------------
+def _odata_lit(v) -> str:
+    if isinstance(v, (int, float)) and not isinstance(v, bool):
+        return str(v)
+    return "'" + str(v).replace("'", "''") + "'"
 
-    # ----------- טבלאות קטנות (שלמות) -----------
-    for dst, entity in TABLES_STATIC.items():
-        if entity.upper() == "LOGPART":
-            # קריאה ראשונה: FAMILYNAME <= '05'
-            df1 = fetch(build_url(entity, "$filter=FAMILYNAME le '05'"))
-            # קריאה שנייה: FAMILYNAME > '05'
-            df2 = fetch(build_url(entity, "$filter=FAMILYNAME gt '05'"))
-            # מאחדים
-            df = pd.concat([df1, df2], ignore_index=True)
-            # כותבים לטבלה
-            duck.execute(f"CREATE OR REPLACE TABLE {dst} AS SELECT * FROM df")
-            print(f"✓ {dst:<25} {len(df):7,d} rows (LOGPART split load)")
-        else:
-            df = fetch(build_url(entity))
-            duck.execute(f"CREATE OR REPLACE TABLE {dst} AS SELECT * FROM df")
-            print(f"✓ {dst:<25} {len(df):7,d} rows")
+def read_watermark(duck, entity: str) -> tuple[str, list] | None:
+    duck.execute(f"""
+        CREATE TABLE IF NOT EXISTS {WATERMARK_TABLE} (
+            entity      VARCHAR PRIMARY KEY,
+            last_update VARCHAR,          -- ISO-8601 שעון-קיר (בלי offset)
+            last_key    VARCHAR,          -- JSON list לפי KEY_COLS
+            synced_at   TIMESTAMP
+        )""")
+    row = duck.execute(
+        f"SELECT last_update, last_key FROM {WATERMARK_TABLE} WHERE entity = ?", [entity]
+    ).fetchone()
+    return (row[0], json.loads(row[1])) if row else None
+
+def save_watermark(duck, entity: str, table: str) -> None:
+    """ה-watermark = השורה עם ה-UPDATE_COL המאוחר ביותר (ושובר שוויון לפי המפתח)."""
+    keys = ", ".join(SALES_KEY_COLS)
+    row = duck.execute(f"""
+        SELECT strftime(ts, '%Y-%m-%dT%H:%M:%S'), {keys}
+        FROM (SELECT TRY_CAST({SALES_UPDATE_COL} AS TIMESTAMP) AS ts, {keys} FROM {table})
+        WHERE ts IS NOT NULL
+        ORDER BY ts DESC, {", ".join(f"{k} DESC" for k in SALES_KEY_COLS)}
+        LIMIT 1
+    """).fetchone()
+    if row is None:
+        return
+    duck.execute(f"""
+        INSERT OR REPLACE INTO {WATERMARK_TABLE}
+        VALUES (?, ?, ?, now()::TIMESTAMP)
+    """, [entity, row[0], json.dumps(list(row[1:]), default=str)])
+
+def changed_since_filter(last_update: str, last_key: list) -> str:
+    """
+    (UDATE > T) OR (UDATE = T AND key > last_key)  – keyset על (UDATE, IVNUM, KLINE)
+    כך ששורות עם אותה חותמת לא נשלפות שוב וגם לא הולכות לאיבוד.
+    """
+    ts = last_update + WATERMARK_TZ
+    tie, prefix = [], []
+    for col, val in zip(SALES_KEY_COLS, last_key):
+        tie.append(" and ".join(prefix + [f"{col} gt {_odata_lit(val)}"]))
+        prefix.append(f"{col} eq {_odata_lit(val)}")
+    key_gt = " or ".join(f"({t})" for t in tie)
+    return f"({SALES_UPDATE_COL} gt {ts} or ({SALES_UPDATE_COL} eq {ts} and ({key_gt})))"
+
+def incremental_problem() -> str | None:
+    """למה אי אפשר upsert לפי watermark (שדה חסר ב-$metadata / ב-$select); None ⇒ אפשר"""
+    model = edm_model()
+    fields = model.types.get(SALES_ENTITY)
+    if not fields:
+        return f"{SALES_ENTITY} not in $metadata"
+    need = [SALES_UPDATE_COL, *SALES_KEY_COLS]
+    missing = [c for c in need if c not in fields]
+    if missing:
+        return f"{SALES_ENTITY} has no {', '.join(missing)} in $metadata"
+    sel = SELECT_FIELDS.get(SALES_ENTITY)
+    if sel and (dropped := [c for c in need if c not in sel]):
+        return f"SELECT_FIELDS[{SALES_ENTITY}] omits {', '.join(dropped)}"
+    key = model.keys.get(SALES_ENTITY)
+    if key and set(key) != set(SALES_KEY_COLS):
+        print(f"[WARN] {SALES_ENTITY} key in $metadata is {key}, upsert uses {SALES_KEY_COLS}")
+    return None
+
+def sync_sales_incremental(duck) -> None:
+    wm = read_watermark(duck, SALES_ENTITY)
+    if wm is None:
+        # ריצה ראשונה – הטבלה כבר מלאה מה-backfill; ה-watermark נגזר ממנה
+        save_watermark(duck, SALES_ENTITY, SALES_TABLE)
+        wm = read_watermark(duck, SALES_ENTITY)
+        if wm is None:
+            raise RuntimeError(f"{SALES_TABLE} has no {SALES_UPDATE_COL} values – run a month load first")
+        print(f"ℹ️  watermark initialised from {SALES_TABLE}: {wm[0]} {wm[1]}")
 
-    # ----------- SALESINVOICEITEMS – חודש נוכחי -----------
+    filt  = urllib.parse.quote_plus(changed_since_filter(*wm))
+    order = ",".join([SALES_UPDATE_COL, *SALES_KEY_COLS])
+    url   = build_url(SALES_ENTITY, f"$filter={filt}&$orderby={order}")
+    n = load_pages(duck, "_sales_delta", entity_pages(SALES_ENTITY, url), replace=True)
+    if n == 0:
+        print(f"✓ {SALES_TABLE:<25} {0:7,d} rows (no changes since {wm[0]})")
+        return
+
+    on = " AND ".join(f"d.{k} = {SALES_TABLE}.{k}" for k in SALES_KEY_COLS)
+    duck.begin()
+    try:
+        with span("duckdb_delete"):
+            duck.execute(f"""
+                DELETE FROM {SALES_TABLE}
+                WHERE EXISTS (SELECT 1 FROM _sales_delta d WHERE {on})
+            """)
+        with span("duckdb_insert") as sp:
+            duck.execute(f"INSERT INTO {SALES_TABLE} BY NAME SELECT * FROM _sales_delta")
+            sp.add(rows=n)
+        save_watermark(duck, SALES_ENTITY, "_sales_delta")
+        duck.execute("DROP TABLE _sales_delta")
+        duck.commit()
+    except Exception:
+        duck.rollback()
+        raise
+    print(f"✓ {SALES_TABLE:<25} {n:7,d} rows (upserted since {wm[0]})")
+
+def refresh_sales_month(duck, parquet: bool = False, landing: str = "save") -> None:
     today = dt.date.today()
-    df_cur = fetch_sales_month(today.year, today.month)
-    dst = "stg_salesinvoiceitems"
+    dst = SALES_TABLE
+
+    if parquet:
+        attach_table(duck, PARQUET_ROOT, dst, "IVDATE")
+        if load_pages(duck, "_sales_month", current_month_pages(landing), replace=True):
+            with span("parquet_write") as sp:
+                n = write_partition(duck, PARQUET_ROOT, dst, today.year, today.month,
+                                    "SELECT * FROM _sales_month")
+                sp.add(rows=n)
+            duck.execute("DROP TABLE _sales_month")
+            attach_table(duck, PARQUET_ROOT, dst, "IVDATE")
+            print(f"✓ {dst:<25} {n:7,d} rows (current month partition swapped)")
+        else:                                   # החודש ריק במקור – המחיצה הישנה נמחקת
+            drop_partition(PARQUET_ROOT, dst, today.year, today.month)
+            attach_table(duck, PARQUET_ROOT, dst, "IVDATE")
+            print(f"✓ {dst:<25} {0:7,d} rows (current month empty – partition dropped)")
+        return
 
     start = dt.date(today.year, today.month, 1)
     nextm = (start + dt.timedelta(days=32)).replace(day=1)
-    duck.execute(f"""
-        DELETE FROM {dst}
-        WHERE IVDATE::DATE >= DATE '{start}' AND IVDATE::DATE < DATE '{nextm}'
-    """)
-    duck.execute(f"INSERT INTO {dst} SELECT * FROM df_cur")
-    print(f"✓ {dst:<25} {len(df_cur):7,d} rows (refreshed current month)")
+    n = load_pages(
+        duck, dst, current_month_pages(landing),
+        before_first=f"""
+            DELETE FROM {dst}
+            WHERE IVDATE::DATE >= DATE '{start}' AND IVDATE::DATE < DATE '{nextm}'
+        """)
+    print(f"✓ {dst:<25} {n:7,d} rows (refreshed current month)")
 
+# ------------------------------------------------------------
+def load_static(concurrency: int = DEFAULT_CONCURRENCY, landing: str = "save",
+                dim_mode: str = "delta") -> None:
+    """
+    טעינה מלאה של כל TABLES_STATIC: כל ישות מפוצלת לטווחי מפתח, כל הטווחים
+    נמשכים במקביל ל-<dst>__loading, ורק אחרי בדיקת הסכום מול $count – עדכון היעד.
+    landing: save – גם לאזור הנחיתה;  replay – מהטעינה החתומה האחרונה שם;  off.
+    dim_mode: delta – רק השורות שהשתנו;  scd2 – וגם _hist_<dst>;  replace – החלפה מלאה.
+    """
+    duck = duckdb.connect(str(RAW_DB))
+    land = Landing(LANDING_ROOT) if landing != "off" else None
+    plans, table_of = {}, {}
+    if landing != "replay":
+        edm_model()                   # $metadata פעם אחת, לפני שה-threads מתחילים
+    for dst, entity in TABLES_STATIC.items():
+        if landing == "replay":
+            total, expected = None, {FetchUnit(entity): None}
+        else:
+            with tagged(entity=entity):
+                total, expected = split_units(PRIO_CLIENT, PRIO, entity, SPLIT_KEYS.get(entity))
+        plans[dst] = (entity, total, expected)
+        table_of.update(dict.fromkeys(expected, dst))
+        duck.execute(f"DROP TABLE IF EXISTS {loading_table(dst)}")   # שארית מריצה שנכשלה
+
+    def pages_for(unit):
+        if landing == "replay":
+            return land.replay(unit, select=SELECT_FIELDS.get(unit.entity))
+        extra = f"$filter={urllib.parse.quote_plus(unit.where)}" if unit.where else ""
+        url = build_url(unit.entity, extra)
+        return landed(land, unit, url, entity_pages(unit.entity, url))
+
+    def commit(duck, unit, stage: str | None):
+        if stage is None:                       # טווח מפתח ריק
+            return
+        tbl = loading_table(table_of[unit])
+        duck.execute(f"CREATE TABLE IF NOT EXISTS {tbl} AS SELECT * FROM {stage} WHERE FALSE")
+        with span("duckdb_insert"):
+            duck.execute(f"INSERT INTO {tbl} BY NAME SELECT * FROM {stage}")
+
+    try:
+        fetched = run_units(duck, list(table_of), pages_for, commit, concurrency=concurrency,
+                            expected={u: n for _, _, exp in plans.values() for u, n in exp.items()},
+                            client=PRIO_CLIENT)
+        # קודם כל הבדיקות, אחר כך ההחלפות – כשל באחת לא משאיר חצי מהטבלאות מוחלפות
+        rows = {dst: verify(entity, total, expected, fetched)
+                for dst, (entity, total, expected) in plans.items()}
+    except Exception:
+        for dst in plans:
+            duck.execute(f"DROP TABLE IF EXISTS {loading_table(dst)}")
+        raise
+    for dst, n in rows.items():
+        delta = None
+        if n and dim_mode != "replace" and dst in DIM_KEYS:
+            delta = sync_dim(duck, dst, DIM_KEYS[dst], history=dim_mode == "scd2")
+        elif n:                                 # לא התקבלה אף שורה – היעד לא נוגע
+            swap_in(duck, dst)
+        if landing == "save":
+            land.seal(plans[dst][0])
+        changes = f", +{delta['I']:,} ~{delta['U']:,} -{delta['D']:,}" if delta else ""
+        print(f"✓ {dst:<25} {n:7,d} rows ({len(plans[dst][2])} key ranges{changes})")
+    duck.close()
+    if landing == "save":
+        land.compact(list(TABLES_STATIC.values()))
+
+
+def load_sales(sales_mode: str = "month", storage: str = "table", landing: str = "save") -> None:
+    """SALESINVOICEITEMS – החודש הנוכחי, או upsert לפי watermark"""
+    if sales_mode == "incremental" and storage == "parquet":
+        raise SystemExit("--sales-mode incremental requires --storage table (keyed upsert)")
+    if sales_mode == "incremental" and landing == "replay":
+        raise SystemExit("--from-landing replays month windows – use --sales-mode month")
+    if sales_mode == "incremental" and (problem := incremental_problem()):
+        print(f"[WARN] incremental sales disabled: {problem} – reloading the month instead")
+        sales_mode = "month"
+    duck = duckdb.connect(str(RAW_DB))
+    if sales_mode == "incremental":
+        with tagged(entity=SALES_ENTITY, month="incremental"):
+            sync_sales_incremental(duck)
+    else:
+        with tagged(entity=SALES_ENTITY, month=f"{dt.date.today():%Y-%m}"):
+            refresh_sales_month(duck, parquet=storage == "parquet", landing=landing)
+        # ה-watermark ממשיך מנקודת הטעינה המלאה (אם קיים כבר)
+        if read_watermark(duck, SALES_ENTITY) is not None:
+            save_watermark(duck, SALES_ENTITY, SALES_TABLE)
+        if landing == "save":
+            Landing(LANDING_ROOT).compact([SALES_ENTITY])
     duck.close()
+
+
+def main(sales_mode: str = "month", storage: str = "table", profile: str | None = None,
+         landing: str = "save", dim_mode: str = "delta") -> None:
+    with etl_metrics.run("odata_to_raw", RAW_DB, profile=profile):
+        # ----------- טבלאות קטנות (שלמות) -----------
+        load_static(landing=landing, dim_mode=dim_mode)
+
+        # ----------- SALESINVOICEITEMS -----------
+        load_sales(sales_mode, storage, landing)
+
+    print("ℹ️ ", PRIO_CLIENT.summary())
     print("🏁 RAW updated →", RAW_DB)
 
 
 if __name__ == "__main__":
-    main()
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sales-mode", choices=["month", "incremental"], default="month",
+                    help="month = delete+reload current month; incremental = watermark upsert")
+    ap.add_argument("--storage", choices=["table", "parquet"], default="table",
+                    help="parquet = month partitions under raw_parquet/ behind a view")
+    ap.add_argument("--from-landing", action="store_true",
+                    help="rebuild from the landing zone instead of calling Priority")
+    ap.add_argument("--no-landing", action="store_true",
+                    help="do not save fetched pages to the landing zone")
+    ap.add_argument("--dim-mode", choices=["delta", "scd2", "replace"], default="delta",
+                    help="delta = apply changed rows only; scd2 = also keep _hist_<table> validity ranges")
+    etl_metrics.add_cli(ap)
+    args = ap.parse_args()
+    landing = "replay" if args.from_landing else "off" if args.no_landing else "save"
+    main(args.sales_mode, args.storage, args.profile, landing, args.dim_mode)
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# etl/odata_types.py
+# ----------------------------------------------------------
+# טיפוסי EDM מ-$metadata  →  טיפוסי Arrow / DuckDB, ופענוח עמוד JSON
+# ישירות ל-pyarrow.Table עם עמודות מטופסות (בלי object של pandas).
+#
+#   • Edm.DateTimeOffset  → TIMESTAMP לפי שעון-קיר (ה-offset מושמט):
+#     Priority עובד באזור זמן אחד, וכל הקוד במורד הזרם (IVDATE::DATE,
+#     TRY_CAST(… AS DATE)) מתייחס לתאריך המקומי. TIMESTAMPTZ היה מזיז
+#     חצות מקומית ליום הקודם בכל session שאינו באזור ישראל.
+#   • Edm.Decimal(p,s)    → DECIMAL(p,s) לפי Precision / Scale מה-$metadata
+#     (סכומים מדויקים – בלי שגיאת עיגול של float). בלי פאסטות / p > 38 –
+#     DOUBLE.
+#   • הטיפוס של כל עמודה נקבע פעם אחת לישות, מה-$metadata – לא לכל עמוד:
+#       - שדה בלי טיפוס ידוע  → תמיד מחרוזת (לא הסקה מהעמוד הנוכחי);
+#       - ערך שלא מתאים לטיפוס (גלישה / מבנה מקונן …) → NULL + אזהרה.
+#     כך כל העמודים של ישות מגיעים באותה סכמה, ו-INSERT ל-staging לא נכשל
+#     בעמוד השני (עמודה שהייתה DOUBLE ופתאום VARCHAR).
+#
+import re, json, decimal, datetime as dt, pyarrow as pa, pyarrow.compute as pc
+
+EDM_ARROW: dict[str, pa.DataType] = {
+    "Edm.String":         pa.string(),
+    "Edm.Guid":           pa.string(),
+    "Edm.Boolean":        pa.bool_(),
+    "Edm.Byte":           pa.int16(),
+    "Edm.SByte":          pa.int16(),
+    "Edm.Int16":          pa.int16(),
+    "Edm.Int32":          pa.int32(),
+    "Edm.Int64":          pa.int64(),
+    "Edm.Decimal":        pa.float64(),
+    "Edm.Double":         pa.float64(),
+    "Edm.Single":         pa.float32(),
+    "Edm.DateTimeOffset": pa.timestamp("us"),
+    "Edm.Date":           pa.date32(),
+    "Edm.TimeOfDay":      pa.time64("us"),
+}
+
+_DECIMAL = re.compile(r"Edm\.Decimal\((\d+),(\d+)\)$")
+MAX_DECIMAL_PRECISION = 38
+
+EDM_DUCKDB: dict[str, str] = {
+    "Edm.String": "VARCHAR",   "Edm.Guid": "VARCHAR",     "Edm.Boolean": "BOOLEAN",
+    "Edm.Byte": "SMALLINT",    "Edm.SByte": "SMALLINT",   "Edm.Int16": "SMALLINT",
+    "Edm.Int32": "INTEGER",    "Edm.Int64": "BIGINT",     "Edm.Decimal": "DOUBLE",
+    "Edm.Double": "DOUBLE",    "Edm.Single": "FLOAT",     "Edm.DateTimeOffset": "TIMESTAMP",
+    "Edm.Date": "DATE",        "Edm.TimeOfDay": "TIME",
+}
+
+
+def _decimal_facets(edm: str | None) -> tuple[int, int] | None:
+    m = _DECIMAL.match(edm or "")
+    if not m:
+        return None
+    prec, scale = int(m[1]), int(m[2])
+    return (prec, scale) if 0 < prec <= MAX_DECIMAL_PRECISION and scale <= prec else None
+
+
+def arrow_type(edm: str | None) -> pa.DataType:
+    """טיפוס Arrow של שדה EDM; לא ידוע ⇒ מחרוזת"""
+    facets = _decimal_facets(edm)
+    if facets:
+        return pa.decimal128(*facets)
+    if edm and edm.startswith("Edm.Decimal"):
+        return pa.float64()
+    return EDM_ARROW.get(edm, pa.string())
+
+
+def duckdb_type(edm: str | None) -> str:
+    facets = _decimal_facets(edm)
+    if facets:
+        return "DECIMAL({},{})".format(*facets)
+    if edm and edm.startswith("Edm.Decimal"):
+        return "DOUBLE"
+    return EDM_DUCKDB.get(edm, "VARCHAR")
+
+
+def _wall_clock(v: str) -> dt.datetime | None:
+    try:
+        return dt.datetime.fromisoformat(v).replace(tzinfo=None)
+    except ValueError:
+        return None
+
+
+def _date(v: str) -> dt.date | None:
+    try:
+        return dt.date.fromisoformat(v[:10])
+    except ValueError:
+        return None
+
+
+def _time(v: str) -> dt.time | None:
+    try:
+        return dt.time.fromisoformat(v)
+    except ValueError:
+        return None
+
+
+_PARSERS = {
+    "Edm.DateTimeOffset": _wall_clock,
+    "Edm.Date":           _date,
+    "Edm.TimeOfDay":      _time,
+}
+
+_BAD_VALUE = (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError, ValueError, TypeError)
+
+
+def _to_decimal(v, quantum: decimal.Decimal):
+    """ערך JSON (float מ-ijson / מחרוזת / int) → Decimal בקנה המידה של העמודה"""
+    if v is None:
+        return None
+    try:
+        d = decimal.Decimal(repr(v) if isinstance(v, float) else v)
+        return d.quantize(quantum, rounding=decimal.ROUND_HALF_UP)
+    except (decimal.InvalidOperation, TypeError, ValueError):
+        return v                          # ייפסל בהמרה – NULL + אזהרה
+
+
+def _text(v) -> str | None:
+    if v is None or isinstance(v, str):
+        return v
+    return json.dumps(v, ensure_ascii=False, default=str)
+
+
+def _coerce(v, typ: pa.DataType):
+    """ערך אחד לטיפוס העמודה; לא מתאים ⇒ None"""
+    try:
+        return pa.scalar(v, type=typ).as_py()
+    except _BAD_VALUE:
+        pass
+    if isinstance(v, str):                # "12" בעמודת Int64 (IEEE754Compatible …)
+        try:
+            return pa.array([v]).cast(typ)[0].as_py()
+        except _BAD_VALUE:
+            pass
+    return None
+
+
+def column_array(values: list, edm: str | None, name: str = "") -> pa.Array:
+    """רשימת ערכי JSON של עמודה אחת → מערך Arrow בטיפוס של השדה (arrow_type)"""
+    typ = arrow_type(edm)
+    if pa.types.is_string(typ):
+        return pa.array([_text(v) for v in values], type=typ)
+    parse = _PARSERS.get(edm)
+    if parse:
+        values = [parse(v) if isinstance(v, str) else None for v in values]
+    elif pa.types.is_decimal(typ):
+        try:                              # המקרה הרגיל – float מה-JSON, וקטורי
+            return pc.round(pa.array(values, type=pa.float64()), typ.scale).cast(typ)
+        except _BAD_VALUE:
+            quantum = decimal.Decimal(1).scaleb(-typ.scale)
+            values = [_to_decimal(v, quantum) for v in values]
+    try:
+        return pa.array(values, type=typ)
+    except _BAD_VALUE:
+        # ערך חריג – רק הוא נפסל; הטיפוס של העמודה לא משתנה באמצע הישות
+        fixed = [_coerce(v, typ) for v in values]
+        bad = sum(1 for v, f in zip(values, fixed) if v is not None and f is None)
+        if bad:
+            print(f"[WARN] {name or 'column'} ({edm}): {bad:,} value(s) do not fit {typ} – stored as NULL")
+        return pa.array(fixed, type=typ)
+
+
+def rows_to_arrow(rows: list[dict], types: dict[str, str] | None = None) -> pa.Table:
+    """
+    rows  – ה-`value` של עמוד OData (רשימת dict).
+    types – {property: "Edm.*"} של הישות (ראה odata_metadata); שדה בלי טיפוס ⇒ מחרוזת.
+    """
+    types = types or {}
+    names = [k for k in rows[0] if not k.startswith("@")] if rows else []
+    return pa.table({n: column_array([r.get(n) for r in rows], types.get(n), n) for n in names})
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# etl/parquet_store.py
+# ----------------------------------------------------------
+# מצב אחסון אופציונלי (--storage parquet) לטבלאות עובדה חודשיות:
+#
+#   <root>/<table>/year=YYYY/month=MM/data_0.parquet
+#
+#   • כל (טבלה, חודש) = קובץ Parquet אחד. רענון חודש = כתיבת קובץ זמני
+#     + os.replace – החלפה אטומית, בלי DELETE ובלי row-groups מתים.
+#   • בקובץ ה-DuckDB נשאר VIEW באותו שם מעל read_parquet, עם העמודות של
+#     הטבלה המקורית בלבד (hive_partitioning = false – year / month של שמות
+#     התיקיות לא נוספים, אחרת SELECT * במורד הזרם ו-profile / schema רואים
+#     עמודות שלא קיימות ב-Priority). פילטר על עמודת התאריך עדיין מדלג על
+#     קבצים לפי הסטטיסטיקות של ה-Parquet.
+#   • טבלה רגילה שכבר קיימת בשם הזה מפוצלת פעם אחת לתיקיות (migrate).
+#
+import os, pathlib, datetime
+
+PART_FILE = "data_0.parquet"      # אותו שם ש-COPY … PARTITION_BY כותב
+
+
+def _q(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _lit(path: pathlib.Path) -> str:
+    return "'" + path.as_posix().replace("'", "''") + "'"
+
+
+def partition_dir(root: pathlib.Path, table: str, year: int, month: int) -> pathlib.Path:
+    return root / table / f"year={year}" / f"month={month}"
+
+
+def write_partition(duck, root: pathlib.Path, table: str, year: int, month: int,
+                    select_sql: str) -> int:
+    """
+    כותב את תוצאת `select_sql` כמחיצה (table, year, month) ומחליף אותה אטומית.
+    מחזיר מספר שורות.
+    """
+    part = partition_dir(root, table, year, month)
+    part.mkdir(parents=True, exist_ok=True)
+    final = part / PART_FILE
+    tmp   = part / (PART_FILE + ".tmp")          # לא תואם ל-*.parquet בזמן הכתיבה
+
+    n = duck.execute(f"SELECT count(*) FROM ({select_sql})").fetchone()[0]
+    duck.execute(f"COPY ({select_sql}) TO {_lit(tmp)} (FORMAT parquet, COMPRESSION zstd)")
+    os.replace(tmp, final)
+    # שאריות מ-COPY PARTITION_BY (data_1.parquet …) – כבר כלולות בקובץ החדש
+    for extra in part.glob("*.parquet"):
+        if extra.name != PART_FILE:
+            extra.unlink()
+    return n
+
+
+def drop_partition(root: pathlib.Path, table: str, year: int, month: int) -> None:
+    """חודש שהתרוקן במקור – המחיצה שלו נמחקת"""
+    part = partition_dir(root, table, year, month)
+    for f in part.glob("*.parquet"):
+        f.unlink()
+
+
+def write_window(duck, root: pathlib.Path, table: str, date_col: str,
+                 start: datetime.date, end: datetime.date, stage: str | None) -> int:
+    """
+    חלון של חודשים שלמים [start, end) מטבלת staging → מחיצה לכל חודש.
+    חודש בלי שורות (או stage=None – החלון ריק במקור) – המחיצה שלו נמחקת.
+    """
+    if start.day != 1 or end.day != 1:
+        raise ValueError(f"{table}: parquet partitions need whole-month windows, got {start}..{end}")
+    months = []
+    cur = start
+    while cur < end:
+        months.append((cur, (cur + datetime.timedelta(days=32)).replace(day=1)))
+        cur = months[-1][1]
+    if stage is None:
+        for first, _ in months:
+            drop_partition(root, table, first.year, first.month)
+        return 0
+    if len(months) == 1:
+        return write_partition(duck, root, table, start.year, start.month, f"SELECT * FROM {stage}")
+    total = 0
+    for first, nextm in months:
+        sql = (f"SELECT * FROM {stage} WHERE {_q(date_col)}::DATE >= DATE '{first}' "
+               f"AND {_q(date_col)}::DATE < DATE '{nextm}'")
+        if duck.execute(f"SELECT count(*) FROM ({sql})").fetchone()[0]:
+            total += write_partition(duck, root, table, first.year, first.month, sql)
+        else:
+            drop_partition(root, table, first.year, first.month)
+    return total
+
+
+def _has_files(root: pathlib.Path, table: str) -> bool:
+    return any((root / table).glob("year=*/month=*/*.parquet"))
+
+
+def _relation_type(duck, table: str) -> str | None:
+    row = duck.execute("""
+        SELECT table_type FROM information_schema.tables
+        WHERE table_schema = 'main' AND table_name = ?
+    """, [table]).fetchone()
+    return row[0] if row else None
+
+
+def attach_table(duck, root: pathlib.Path, table: str, date_col: str) -> None:
+    """
+    מבטיח ש-`table` הוא VIEW מעל המחיצות.
+    אם קיימת טבלה רגילה בשם הזה – מפצל אותה לפי `date_col` ומוחק אותה.
+    קוראים לה לפני הכתיבות (migrate) ואחריהן (VIEW על מחיצות חדשות).
+    """
+    if _relation_type(duck, table) == "BASE TABLE":
+        d = f"TRY_CAST({_q(date_col)} AS DATE)"
+        (root / table).mkdir(parents=True, exist_ok=True)
+        duck.execute(f"""
+            COPY (SELECT *, coalesce(year({d}), 0) AS year, coalesce(month({d}), 0) AS month
+                  FROM {_q(table)})
+            TO {_lit(root / table)} (FORMAT parquet, COMPRESSION zstd,
+                                     PARTITION_BY (year, month), OVERWRITE_OR_IGNORE)
+        """)
+        duck.execute(f"DROP TABLE {_q(table)}")
+        print(f"[OK] {table} migrated → {root / table}")
+
+    if _has_files(root, table):
+        glob = root / table / "year=*" / "month=*" / "*.parquet"
+        duck.execute(f"""
+            CREATE OR REPLACE VIEW {_q(table)} AS
+            SELECT * FROM read_parquet({_lit(glob)}, hive_partitioning = false, union_by_name = true)
+        """)
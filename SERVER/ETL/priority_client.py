@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# etl/priority_client.py
+# ----------------------------------------------------------
+# לקוח HTTP משותף לכל הקריאות ל-Priority OData.
+#
+#   • requests.Session אחד עם pool – keep-alive, בלי TLS handshake לכל בקשה.
+#   • Accept-Encoding: gzip – התשובות (JSON / $metadata) נדחסות בדרך.
+#   • retry אחיד ל-429 / 5xx / ניתוק / timeout עם backoff אקספוננציאלי + jitter
+#     (ומכבד Retry-After).  בתוך single_attempt() (ב-thread הנוכחי) – בלי
+#     retry: עובדי fetch_scheduler מקבלים את השגיאה מיד, והיחידה כולה נשלחת
+#     שוב אחרי ה-Throttle המשותף – שכבת retry אחת, לא 5 × 5 עם השהיות כפולות.
+#   • מונים לכל בקשה: זמן, bytes על הקו, bytes אחרי פריסה – summary() בסוף ריצה.
+#
+import time, random, threading, contextlib, requests
+from requests.adapters import HTTPAdapter
+
+RETRIES      = 5
+BACKOFF_BASE = 1.0       # שניות; 1, 2, 4, 8 … (× jitter)
+BACKOFF_MAX  = 60.0
+TIMEOUT      = 180
+POOL_SIZE    = 16        # >= concurrency של fetch_scheduler
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class PriorityClient:
+    """Session משותף + retry + מונים. בטוח לשימוש מכמה threads."""
+
+    def __init__(self, auth, *, retries: int = RETRIES, timeout: int = TIMEOUT,
+                 pool_size: int = POOL_SIZE):
+        self.retries, self.timeout = retries, timeout
+        self.session = requests.Session()
+        self.session.auth = auth
+        self.session.headers.update({
+            "Accept": "application/json",
+            "Accept-Encoding": "gzip, deflate",
+        })
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._lock = threading.Lock()
+        self._local = threading.local()       # single_attempt – לכל thread בנפרד
+        self.requests = 0
+        self.retried = 0
+        self.seconds = 0.0
+        self.wire_bytes = 0
+        self.body_bytes = 0
+
+    # ------------------------------------------------------------------
+    def _backoff(self, attempt: int, resp: requests.Response | None) -> float:
+        delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1))
+        delay *= random.uniform(0.5, 1.5)
+        if resp is not None and resp.headers.get("Retry-After", "").isdigit():
+            delay = max(delay, float(resp.headers["Retry-After"]))
+        return delay
+
+    @contextlib.contextmanager
+    def single_attempt(self):
+        """בקשות מה-thread הנוכחי בתוך ה-with – ניסיון אחד (ה-retry אצל הקורא)"""
+        prev = getattr(self._local, "retries", None)
+        self._local.retries = 1
+        try:
+            yield self
+        finally:
+            self._local.retries = prev
+
+    def get(self, url: str, **kw) -> requests.Response:
+        """
+        GET עם retry; מחזיר Response אחרי raise_for_status.
+        stream=True – רק ה-headers נקראו; retry חל עד שלב זה בלבד.
+        """
+        kw.setdefault("timeout", self.timeout)
+        retries = getattr(self._local, "retries", None) or self.retries
+        for attempt in range(1, retries + 1):
+            resp = None
+            t0 = time.perf_counter()
+            try:
+                resp = self.session.get(url, **kw)
+                if kw.get("stream"):
+                    # הגוף עוד לא נקרא – הקורא מדווח bytes ב-add_bytes()
+                    self._count(time.perf_counter() - t0, 0, 0)
+                else:
+                    body = len(resp.content)
+                    self._count(time.perf_counter() - t0, resp.raw.tell() or body, body)
+                if resp.status_code in RETRY_STATUS and attempt < retries:
+                    raise requests.exceptions.HTTPError(f"HTTP {resp.status_code}", response=resp)
+                resp.raise_for_status()
+                return resp
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                    requests.exceptions.HTTPError) as exc:
+                status = resp.status_code if resp is not None else None
+                if resp is not None:
+                    resp.close()               # stream=True – משחרר את החיבור ל-pool
+                retriable = status is None or status in RETRY_STATUS
+                if not retriable or attempt >= retries:
+                    raise
+                delay = self._backoff(attempt, resp)
+                with self._lock:
+                    self.retried += 1
+                print(f"[WARN] {exc} – retry {attempt + 1}/{retries} in {delay:.1f}s")
+                time.sleep(delay)
+        raise AssertionError("unreachable")
+
+    def _count(self, seconds: float, wire: int, body: int) -> None:
+        with self._lock:
+            self.requests += 1
+            self.seconds += seconds
+            self.wire_bytes += wire
+            self.body_bytes += body
+
+    def add_bytes(self, wire: int, body: int) -> None:
+        """bytes של תשובה שנקראה כ-stream (get(…, stream=True))"""
+        with self._lock:
+            self.wire_bytes += wire
+            self.body_bytes += body
+
+    def summary(self) -> str:
+        mb = 1024 * 1024
+        return (f"HTTP {self.requests} requests ({self.retried} retried), "
+                f"{self.seconds:.1f}s, {self.wire_bytes / mb:.1f} MB on wire / "
+                f"{self.body_bytes / mb:.1f} MB decoded")
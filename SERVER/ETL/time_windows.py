@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# etl/time_windows.py
+# ----------------------------------------------------------
+# חלונות תאריכים אדפטיביים לשליפות לפי עמודת תאריך – במקום "חודש קלנדרי
+# אחד = בקשה אחת" לכל מסך.
+#
+#   • $count על כל הטווח; עד TARGET_ROWS ⇒ חלון אחד (חודשים שקטים רצופים
+#     מתאחדים לבקשה אחת).
+#   • גדול מזה ⇒ חצייה על גבול חודש; חודש עמוס ⇒ שבועות; שבוע עמוס ⇒ ימים;
+#     בסוף חלונות צמודים קטנים מתאחדים שוב עד TARGET_ROWS.
+#   • לכל חלון נשמר ה-$count שלו – run_units(expected=…) / checked_pages
+#     מוודאים שנמשכו לפחות כמה שורות (IncompleteFetch ⇒ ניסיון חוזר).
+#   • חלון עם $count 0 נשאר בתוכנית: ה-commit שלו מוחק את הטווח ביעד –
+#     חודש שהתרוקן במקור לא משאיר שורות ישנות ב-RAW.
+#   • בלי $count בשרת – חודש לכל יחידה, כמו קודם.
+#   • גבולות החלון = חצות בשעון ישראל, עם ה-offset הנכון לאותו תאריך
+#     (+02:00 בחורף, +03:00 בקיץ). offset קבוע של +02:00 הזיז את חצות
+#     של ה-1 בחודשי הקיץ לחלון של החודש הקודם.
+#
+import datetime as dt
+from typing import Callable, Iterator
+from fetch_scheduler import FetchUnit, IncompleteFetch, month_units
+from key_ranges import count
+
+try:
+    from zoneinfo import ZoneInfo
+    TZ = ZoneInfo("Asia/Jerusalem")          # Windows: pip install tzdata
+except Exception:                            # ZoneInfoNotFoundError / Python ישן
+    TZ = None
+
+TARGET_ROWS = 50_000     # שורות לחלון (כמו key_ranges)
+
+
+def _last_sunday(y: int, m: int) -> dt.date:
+    d = (dt.date(y, m, 1) + dt.timedelta(days=32)).replace(day=1) - dt.timedelta(days=1)
+    return d - dt.timedelta(days=(d.weekday() + 1) % 7)
+
+
+def local_midnight(d: dt.date) -> str:
+    """חצות של d בשעון ישראל כ-literal של OData (עם offset)"""
+    if TZ is not None:
+        return dt.datetime(d.year, d.month, d.day, tzinfo=TZ).isoformat()
+    # חוק השעון מ-2013: שישי שלפני יום א' האחרון במרץ – יום א' האחרון באוקטובר
+    # (המעבר ב-02:00, כך שחצות של יום המעבר באביב עוד חורף, ובסתיו עוד קיץ)
+    summer = _last_sunday(d.year, 3) - dt.timedelta(days=2) < d <= _last_sunday(d.year, 10)
+    return f"{d}T00:00:00{'+03:00' if summer else '+02:00'}"
+
+
+def window_filter(date_col: str, start: dt.date, end: dt.date) -> str:
+    return f"({date_col} ge {local_midnight(start)} and {date_col} lt {local_midnight(end)})"
+
+
+def month_starts(start: dt.date, end: dt.date) -> list[dt.date]:
+    """ה-1 לכל חודש שמתחיל בתוך [start, end)"""
+    cur = start.replace(day=1)
+    if cur < start:
+        cur = (cur + dt.timedelta(days=32)).replace(day=1)
+    out = []
+    while cur < end:
+        out.append(cur)
+        cur = (cur + dt.timedelta(days=32)).replace(day=1)
+    return out
+
+
+def plan_windows(client, prio: str, entity: str, date_col: str,
+                 start: dt.date, end: dt.date, *, where: str | None = None,
+                 target: int = TARGET_ROWS, split_months: bool = True
+                 ) -> dict[FetchUnit, int | None]:
+    """
+    {FetchUnit(entity, a, b): $count} שמכסה את [start, end) – כולל חלונות
+    ריקים ($count 0), כדי שה-commit שלהם ימחק את הטווח ביעד.
+    split_months=False ⇒ לא מתחת לחודש (מחיצות Parquet חודשיות).
+    """
+    url = f"{prio}/{entity}"
+
+    def n(a: dt.date, b: dt.date) -> int | None:
+        f = window_filter(date_col, a, b)
+        return count(client, url, f"({where}) and {f}" if where else f)
+
+    def plan(a: dt.date, b: dt.date, rows: int) -> dict[FetchUnit, int]:
+        if rows <= target:
+            return {FetchUnit(entity, a, b): rows}
+        inner = [m for m in month_starts(a, b) if m > a]
+        if inner:                                        # כמה חודשים – חצייה על גבול חודש
+            cuts = [inner[len(inner) // 2]]
+        elif not split_months or (b - a).days <= 1:
+            return {FetchUnit(entity, a, b): rows}       # יום אחד עמוס – odata_pager ידפדף
+        else:                                            # חודש ⇒ שבועות, שבוע ⇒ ימים
+            step = 7 if (b - a).days > 7 else 1
+            cuts = [a + dt.timedelta(days=i) for i in range(step, (b - a).days, step)]
+        out: dict[FetchUnit, int] = {}
+        for lo, hi in zip([a, *cuts], [*cuts, b]):
+            sub = n(lo, hi)
+            out.update(plan(lo, hi, sub) if sub is not None else {FetchUnit(entity, lo, hi): None})
+        return out
+
+    total = n(start, end)
+    if total is None:
+        months = [(m.year, m.month) for m in month_starts(start, end)]
+        return dict.fromkeys(month_units(entity, months))
+    units = merge(plan(start, end, total), target)
+    got = sum(v or 0 for v in units.values())
+    if got != total:
+        print(f"[WARN] {entity}: window counts {got:,} != $count {total:,} (data changed while probing?)")
+    return units
+
+
+def merge(units: dict[FetchUnit, int | None], target: int) -> dict[FetchUnit, int | None]:
+    """חלונות צמודים שסכומם עד target ⇒ חלון אחד (ימים של שבוע עמוס, חודשים שקטים)"""
+    out: dict[FetchUnit, int | None] = {}
+    prev, prev_n = None, None
+    for unit, n in units.items():
+        if (prev is not None and prev.end == unit.start and n is not None
+                and prev_n is not None and prev_n + n <= target):
+            prev, prev_n = FetchUnit(unit.entity, prev.start, unit.end), prev_n + n
+            continue
+        if prev is not None:
+            out[prev] = prev_n
+        prev, prev_n = unit, n
+    if prev is not None:
+        out[prev] = prev_n
+    return out
+
+
+def checked_pages(units: dict[FetchUnit, int | None],
+                  pages_for: Callable[[FetchUnit], Iterator]) -> Iterator:
+    """
+    העמודים של כל החלונות ברצף (לטעינה אחת ב-load_pages); חלון שהחזיר פחות
+    שורות מה-$count שלו ⇒ IncompleteFetch (load_pages עושה rollback).
+    """
+    for unit, want in units.items():
+        got = 0
+        for tbl in pages_for(unit):
+            got += tbl.num_rows
+            yield tbl
+        if want is not None and got < want:
+            raise IncompleteFetch(f"{unit.label}: {got:,} of {want:,} rows")
@@ -2,19 +2,28 @@
 """
 gen_models.py – יוצר קובצי dim_*.sql + קובצי YAML בסיסיים לכל טבלת stg_*
 דרישות: pip install duckdb ruamel.yaml
+
+אינקרמנטלי: העמודות של כל הטבלאות נקראות בשאילתה אחת (information_schema.columns),
+ולכל מודל נשמרת טביעת אצבע של הסכמה ב-<output>/.gen_models_state.json.
+קובץ נכתב רק כשהסכמה של הטבלה השתנתה וגם התוכן שלו שונה – mtime של מודלים
+שלא השתנו נשאר, ו-dbt partial parsing / build_semantic.py עובדים רק על השינוי.
+בסוף – דו"ח סטייה: עמודות שנוספו / הוסרו / שינו טיפוס, טבלאות חדשות / שנעלמו.
+--force כותב הכל מחדש; --prune מוחק מודלים שטבלת ה-stg שלהם נעלמה.
 הרצה לדוגמה:
     python gen_models.py ^
         --duckdb C:\RIT\AIBI\raw_best.duckdb ^
         --output C:\RIT\AIBI\best_dwh\best_dwh_dbt\models ^
         --schema_raw stg_ ^
-        --materialization table
+        --materialization table ^
+        [--report drift.json] [--force] [--prune]
 """
-import argparse, os, duckdb, io
+import argparse, os, duckdb, io, json, hashlib
 from ruamel.yaml import YAML
 
 # ─────────── helpers ────────────────────────────────────────────
 yaml_engine = YAML()
 yaml_engine.default_flow_style = False
+STATE_FILE = ".gen_models_state.json"
 
 
 def build_sql(table: str, columns: list[str], materialized: str) -> str:
@@ -43,39 +52,125 @@ def build_yaml(model_name: str, columns: list[str]) -> str:
     return buf.getvalue()
 
 
+def read_columns(con, prefix: str) -> dict[str, list[tuple[str, str]]]:
+    """{טבלה: [(עמודה, טיפוס), ...]} – שאילתה אחת לכל הטבלאות"""
+    schema: dict[str, list[tuple[str, str]]] = {}
+    for tbl, col, typ in con.execute(
+        """
+        select table_name, column_name, data_type
+        from information_schema.columns
+        where table_schema = 'main'
+          and table_name like ?
+        order by table_name, ordinal_position
+        """,
+        (f"{prefix}%",),
+    ).fetchall():
+        schema.setdefault(tbl, []).append((col, typ))
+    return schema
+
+
+def fingerprint(columns: list[tuple[str, str]], materialized: str) -> str:
+    parts = [materialized] + [f"{c}:{t}" for c, t in columns]
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+def load_state(output: str) -> dict:
+    try:
+        with open(os.path.join(output, STATE_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(output: str, state: dict) -> None:
+    path = os.path.join(output, STATE_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def write_if_changed(path: str, text: str) -> bool:
+    try:
+        with open(path, encoding="utf-8") as f:
+            if f.read() == text:
+                return False
+    except OSError:
+        pass
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    return True
+
+
+def drift(old: list[list[str]], new: list[tuple[str, str]]) -> dict:
+    before, after = dict(map(tuple, old)), dict(new)
+    return {
+        "added":   [c for c in after if c not in before],
+        "removed": [c for c in before if c not in after],
+        "retyped": {c: [before[c], t] for c, t in after.items() if c in before and before[c] != t},
+    }
+
+
 # ─────────── main ───────────────────────────────────────────────
 def main(args: argparse.Namespace) -> None:
-    con = duckdb.connect(args.duckdb)
-
-    tables = [
-        r[0]
-        for r in con.execute(
-            """
-            select table_name
-            from information_schema.tables
-            where table_schema = 'main'
-              and table_name like ?
-            """,
-            (f"{args.schema_raw}%",),
-        ).fetchall()
-    ]
+    con = duckdb.connect(args.duckdb, read_only=True)
+    schema = read_columns(con, args.schema_raw)
+    con.close()
 
     os.makedirs(args.output, exist_ok=True)
+    state = {} if args.force else load_state(args.output)
+    models = state.get("models", {})
+    report: dict[str, dict] = {}
+    written = 0
 
-    for tbl in tables:
-        cols = [r[1] for r in con.execute(f"pragma table_info('{tbl}')").fetchall()]
+    for tbl, columns in schema.items():
+        cols = [c for c, _ in columns]
         model_name = "dim_" + tbl.removeprefix(args.schema_raw)
+        fp = fingerprint(columns, args.materialization)
+        prev = models.get(model_name)
 
         sql_path = os.path.join(args.output, f"{model_name}.sql")
         yml_path = os.path.join(args.output, f"{model_name}.yml")
 
-        with open(sql_path, "w", encoding="utf-8") as f_sql:
-            f_sql.write(build_sql(tbl, cols, args.materialization))
-
-        with open(yml_path, "w", encoding="utf-8") as f_yml:
-            f_yml.write(build_yaml(model_name, cols))
-
-        print(f"✓ {model_name:<25} ({len(cols)} columns)")
+        if prev and prev["fingerprint"] == fp and os.path.exists(sql_path) and os.path.exists(yml_path):
+            continue
+
+        changed = write_if_changed(sql_path, build_sql(tbl, cols, args.materialization))
+        changed |= write_if_changed(yml_path, build_yaml(model_name, cols))
+        written += changed
+        models[model_name] = {"table": tbl, "fingerprint": fp, "columns": [list(c) for c in columns]}
+
+        if prev is None:
+            report[model_name] = {"status": "new", "columns": cols}
+            print(f"✓ {model_name:<25} ({len(cols)} columns) – new")
+        else:
+            d = drift(prev["columns"], columns)
+            if any(d.values()):
+                report[model_name] = {"status": "changed", **d}
+            print(f"✓ {model_name:<25} ({len(cols)} columns)"
+                  + (f"  +{d['added']}" if d["added"] else "")
+                  + (f"  -{d['removed']}" if d["removed"] else "")
+                  + (f"  ~{list(d['retyped'])}" if d["retyped"] else "")
+                  + ("" if changed else "  (files unchanged)"))
+
+    live = {"dim_" + t.removeprefix(args.schema_raw) for t in schema}
+    for model_name in [m for m in models if m not in live]:
+        report[model_name] = {"status": "dropped", "columns": [c for c, _ in models[model_name]["columns"]]}
+        if args.prune:
+            for ext in (".sql", ".yml"):
+                path = os.path.join(args.output, model_name + ext)
+                if os.path.exists(path):
+                    os.remove(path)
+            del models[model_name]
+            print(f"✗ {model_name:<25} removed (source table gone)")
+        else:
+            print(f"[WARN] {model_name}: source table gone – kept (use --prune)")
+
+    save_state(args.output, {"models": models})
+    print(f"🏁 {len(schema)} tables, {written} models written, {len(report)} with schema drift")
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
 
 
 if __name__ == "__main__":
@@ -84,4 +179,7 @@ if __name__ == "__main__":
     parser.add_argument("--output", required=True)
     parser.add_argument("--schema_raw", default="stg_")
     parser.add_argument("--materialization", default="table")
+    parser.add_argument("--report", help="write the schema-drift report as JSON")
+    parser.add_argument("--force", action="store_true", help="ignore stored fingerprints")
+    parser.add_argument("--prune", action="store_true", help="delete models whose stg table is gone")
     main(parser.parse_args())
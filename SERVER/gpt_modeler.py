@@ -1,19 +1,33 @@
 #!/usr/bin/env python
 """
 gpt_modeler.py – בונה feature_store.duckdb + קובצי dbt + column_aliases +
-                 star_hint.txt  (ללא דברים מעבר לכך)
+                 fact_sales_wide + star_hint.txt  (ללא דברים מעבר לכך)
 
 דרישות:
     pip install duckdb ruamel.yaml openai~=1.14
-    SET OPENAI_API_KEY=•••
+    SET OPENAI_API_KEY=•••        (נדרש רק כשיש טבלה שאינה במטמון GPT_CACHE)
+
+הרצה:
+    python gpt_modeler.py [--reset] [--full]
 """
-import os, json, re, textwrap, pathlib, duckdb, openai
+import os, io, sys, json, re, time, hashlib, argparse, textwrap, pathlib, duckdb, openai
+from concurrent.futures import ThreadPoolExecutor
 from ruamel.yaml import YAML
+from profile_store import narrow_database, widen_to_fit
+from rollups import catalog_hints
+import snapshot
+sys.path.append(str(pathlib.Path(__file__).resolve().parent / "ETL"))   # etl_metrics
+import etl_metrics
+from etl_metrics import span
 
 RAW_DB  = pathlib.Path(r"C:\RIT\AIBI\raw_best.duckdb")
 DWH_DB  = pathlib.Path(r"C:\RIT\AIBI\feature_store.duckdb")
 DBT_DIR = pathlib.Path(r"C:\RIT\AIBI\best_dwh\best_dwh_dbt\models")
 DBT_DIR.mkdir(parents=True, exist_ok=True)
+GPT_CACHE = DBT_DIR.parent / ".gpt_cache"      # תשובות GPT לפי hash(prompt, model)
+
+GPT_MODEL       = "gpt-4o-mini"
+GPT_CONCURRENCY = 4
 
 yaml_engine = YAML()
 yaml_engine.default_flow_style = False
@@ -23,22 +37,24 @@ def reset_workspace():
     for pat in ("*.sql", "*.yml"):
         for p in DBT_DIR.glob(pat):
             p.unlink(missing_ok=True)
-    DWH_DB.unlink(missing_ok=True)
+    # feature_store.duckdb לא נמחק (השרת קורא ממנו) – main בונה גרסה חדשה מקובץ ריק
     pathlib.Path("star_hint.txt").unlink(missing_ok=True)
     print("🧹  workspace cleaned")
 
 def extract_schema(db: pathlib.Path) -> dict:
-    con = duckdb.connect(str(db))
+    con = duckdb.connect(str(db), read_only=True)
     schema = {}
     for (tbl,) in con.execute("SHOW TABLES").fetchall():
+        if tbl.startswith("_") or tbl.startswith("etl_"):
+            continue                          # טבלאות מצב של ה-ETL / ה-manifest
         cols = con.execute(f"PRAGMA table_info('{tbl}')").fetchall()
         schema[tbl] = [{"name": c[1], "type": c[2]} for c in cols]
     con.close()
     return schema
 
-# ── GPT – מייצר קבצי dim/fact/metrics (ללא שינוי) ─────────────────────
-def call_gpt(schema: dict) -> list[dict]:
-    prompt = textwrap.dedent(f"""
+# ── GPT – מייצר קבצי dim/fact/metrics ─────────────────────────────────
+def build_prompt(schema: dict) -> str:
+    return textwrap.dedent(f"""
     אתה ארכיטקט DWH. לפניך סכמת RAW.
 
     משימה:
@@ -59,11 +75,21 @@ def call_gpt(schema: dict) -> list[dict]:
     {json.dumps(schema, indent=2, ensure_ascii=False)}
     ```""")
 
-    raw = openai.OpenAI().chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.1,
-    ).choices[0].message.content.strip()
+def call_gpt(schema: dict, client=None, model: str = GPT_MODEL) -> list[dict]:
+    """
+    קריאה אחת ל-GPT עבור `schema` (טבלה אחת או יותר).
+    client – כל אובייקט עם chat.completions.create (ברירת מחדל openai.OpenAI());
+             מאפשר לחבר stub מקומי בבדיקות.
+    """
+    client = client or openai.OpenAI()
+    with span("gpt_call", entity=",".join(schema)) as sp:
+        prompt = build_prompt(schema)
+        raw = client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.1,
+        ).choices[0].message.content.strip()
+        sp.add(nbytes=len(prompt.encode("utf-8")) + len(raw.encode("utf-8")))
 
     pathlib.Path("gpt_last.txt").write_text(raw, encoding="utf-8")
     m     = re.search(r"```json\s*(\{.*?\})\s*```", raw, re.S)
@@ -73,14 +99,85 @@ def call_gpt(schema: dict) -> list[dict]:
         files.append({"name": "models/metrics.yml", "content": "metrics: []"})
     return files
 
+def _merge_metrics(files: list[dict]) -> list[dict]:
+    """כל קריאה מחזירה metrics.yml משלה – מאחדים לרשימת metrics אחת."""
+    out, metrics, seen = [], [], set()
+    for f in files:
+        if not f["name"].endswith("metrics.yml"):
+            out.append(f)
+            continue
+        try:
+            doc = yaml_engine.load(f["content"]) or {}
+        except Exception:
+            print("⚠️  metrics.yml could not be parsed – skipped")
+            continue
+        for item in doc.get("metrics") or []:
+            key = json.dumps(item, sort_keys=True, default=str)
+            if key not in seen:
+                seen.add(key)
+                metrics.append(item)
+    buf = io.StringIO()
+    yaml_engine.dump({"metrics": metrics}, buf)
+    out.append({"name": "models/metrics.yml", "content": buf.getvalue()})
+    return out
+
+def generate_models(schema: dict, client=None, model: str = GPT_MODEL,
+                    concurrency: int = GPT_CONCURRENCY) -> list[dict]:
+    """
+    קבצי המודלים לכל הטבלאות, עם מטמון לפי תוכן:
+      key = sha256(model + prompt)  – ה-prompt כולל את סכמת הטבלה.
+    טבלה שהסכמה שלה לא השתנתה – נלקחת מ-GPT_CACHE בלי קריאה;
+    השאר נשלחות ל-GPT במקביל (לכל היותר `concurrency` קריאות).
+    """
+    GPT_CACHE.mkdir(parents=True, exist_ok=True)
+    keys = {tbl: hashlib.sha256(f"{model}\x1f{build_prompt({tbl: cols})}".encode("utf-8")).hexdigest()
+            for tbl, cols in schema.items()}
+
+    per_table: dict[str, list[dict]] = {}
+    misses = []
+    for tbl, key in keys.items():
+        entry = GPT_CACHE / f"{key}.json"
+        if entry.exists():
+            per_table[tbl] = json.loads(entry.read_text(encoding="utf-8"))["files"]
+        else:
+            misses.append(tbl)
+    print(f"✓ GPT cache: {len(per_table)} hit, {len(misses)} to generate")
+
+    if misses:
+        if client is None and not os.getenv("OPENAI_API_KEY"):
+            raise EnvironmentError("OPENAI_API_KEY not set")
+        client = client or openai.OpenAI()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            futs = {tbl: pool.submit(call_gpt, {tbl: schema[tbl]}, client, model) for tbl in misses}
+            for tbl, fut in futs.items():
+                per_table[tbl] = fut.result()
+                entry = GPT_CACHE / f"{keys[tbl]}.json"
+                entry.write_text(json.dumps({"table": tbl, "model": model, "files": per_table[tbl]},
+                                            ensure_ascii=False, indent=2), encoding="utf-8")
+                print(f"🤖 {tbl} generated")
+
+    return _merge_metrics([f for tbl in schema for f in per_table[tbl]])
+
 def write_files(files: list[dict]):
+    """כותב רק קבצים שהתוכן שלהם השתנה (mtime נשאר יציב), ומוחק מודלים יתומים."""
+    wanted = set()
+    changed = 0
     for f in files:
         rel  = f["name"].removeprefix("models/").lstrip("/")
         path = DBT_DIR / rel
+        wanted.add(path.resolve())
+        if path.exists() and path.read_text(encoding="utf-8") == f["content"]:
+            continue
         path.parent.mkdir(parents=True, exist_ok=True)
         path.write_text(f["content"], encoding="utf-8")
+        changed += 1
         print("✎", path.relative_to(DBT_DIR.parent))
-    print(f"✓ {len(files)} files written → {DBT_DIR}")
+    for pat in ("*.sql", "*.yml"):
+        for p in DBT_DIR.glob(pat):
+            if p.resolve() not in wanted:
+                p.unlink()
+                print("🗑", p.relative_to(DBT_DIR.parent))
+    print(f"✓ {changed}/{len(files)} files written → {DBT_DIR}")
 
 # ── strip_jinja (ללא שינוי) ──────────────────────────────────────────
 def strip_jinja(sql: str) -> str:
@@ -120,9 +217,12 @@ def build_column_aliases(con):
 
 
 # ── star_hint.txt – הפקה אוטומטית  ───────────────────────────────────
-def build_star_hint(schema):
-    hints = []
-    fact_cols = {c['name'] for c in schema['dim_salesinvoiceitems']}
+FACT_TABLE = "dim_salesinvoiceitems"
+
+def star_relations(schema) -> list[tuple[str, str, str]]:
+    """(עמודת NAME ב-fact, טבלת dim, עמודת DES) – dim עם NAME שקיים ב-fact ו-DES תואם"""
+    rels = []
+    fact_cols = {c['name'] for c in schema[FACT_TABLE]}
     for tbl, cols in schema.items():
         if not tbl.startswith('dim_'):
             continue
@@ -132,23 +232,230 @@ def build_star_hint(schema):
                 base = name[:-4]   # מוריד 'NAME'
                 des_col = f"{base}DES"
                 if any(c['name']==des_col for c in cols):
-                    hints.append(
-                      f"dim_salesinvoiceitems.{name} → {tbl}.{name} ({des_col})")
+                    rels.append((name, tbl, des_col))
+    return rels
+
+def build_star_hint(schema):
+    hints = [f"{FACT_TABLE}.{name} → {tbl}.{name} ({des_col})"
+             for name, tbl, des_col in star_relations(schema)]
+    if WIDE_TABLE in schema:
+        fact_cols = {c['name'] for c in schema[FACT_TABLE]}
+        extra = [c['name'] for c in schema[WIDE_TABLE] if c['name'] not in fact_cols]
+        hints.append(f"{WIDE_TABLE} = {FACT_TABLE} + {', '.join(extra)} (ממוין לפי {WIDE_DATE}) – "
+                     f"לשאלות מכירות לפי לקוח/פריט/משפחה/סוכן/גרייד בתקופה – בלי joins")
+    hints += catalog_hints(set(schema))          # טבלאות מצטברות (rollups.py)
     pathlib.Path("star_hint.txt").write_text("\n".join(hints), encoding="utf-8")
     print(f"✓ star_hint.txt generated  ({len(hints)} lines)")
 
 
+# ── fact רחב – ה-joins של star_hint מראש, ממוין לפי תאריך ──────────────
+WIDE_TABLE = "fact_sales_wide"
+WIDE_DATE  = "IVDATE"
+WIDE_STATE = "_wide_months"
+WIDE_MONTH = f"CAST(date_trunc('month', TRY_CAST({{a}}.{WIDE_DATE} AS DATE)) AS DATE)"
+
+def _month_in(expr: str, months) -> str:
+    lits = ", ".join(f"DATE '{m}'" for m in months if m is not None)
+    cond = [f"{expr} IN ({lits})"] if lits else []
+    if None in months:
+        cond.append(f"{expr} IS NULL")
+    return " OR ".join(cond) or "FALSE"
+
+def wide_sql(schema: dict, where: str = "TRUE") -> tuple[str, list[str]]:
+    """
+    SELECT של ה-fact הרחב: כל עמודות FACT_TABLE + עמודות ‎*NAME / *DES מכל dim
+    שקשור ל-fact (star_relations) – לקוח, פריט + משפחה, גרייד, סוכן …
+    עמודה שכבר קיימת (ב-fact או ב-dim קודם) לא נלקחת שוב.  מחזיר גם את ה-dims.
+    """
+    fact_cols = [c['name'] for c in schema[FACT_TABLE]]
+    taken = set(fact_cols)
+    select = [f'f."{c}"' for c in fact_cols]
+    joins, dims = [], []
+    pairs = dict.fromkeys((name, tbl) for name, tbl, _ in star_relations(schema) if tbl != FACT_TABLE)
+    for i, (key, tbl) in enumerate(pairs):
+        desc = [c['name'] for c in schema[tbl] if c['name'] not in taken
+                and c['name'].lower().endswith(('name', 'des'))]
+        if not desc:
+            continue
+        taken.update(desc)
+        attrs = ", ".join(f'any_value("{c}") AS "{c}"' for c in desc)
+        # profile_store מצמצם כל טבלה לחוד – המפתח יכול להיות ENUM / טקסט בצד אחד
+        # ומספר בצד השני; ההשוואה כטקסט
+        joins.append(f'LEFT JOIN (SELECT CAST("{key}" AS VARCHAR) AS _k, {attrs} FROM {tbl} GROUP BY 1) d{i} '
+                     f'ON d{i}._k = CAST(f."{key}" AS VARCHAR)')
+        select += [f'd{i}."{c}"' for c in desc]
+        dims.append(tbl)
+    sql = (f"SELECT {', '.join(select)}\nFROM {FACT_TABLE} f {' '.join(joins)}\n"
+           f"WHERE {where}\nORDER BY f.{WIDE_DATE}")
+    return sql, dims
+
+def build_wide_fact(duck, schema_raw: dict, sources: dict, deps: dict, version: dict,
+                    full: bool = False):
+    """
+    WIDE_TABLE – נבנה מחדש רק לחודשים שהשתנו (_wide_months):
+      גרסת חודש = hash(SQL, SQL של מודל ה-fact, טביעת החודש ב-stg_* שלו, גרסאות ה-dims)
+    – הטביעה נלקחת מה-RAW (לא מצומצם ע"י profile_store, טיפוסים יציבים).
+    חודש שהשתנה ⇒ DELETE + INSERT ממוין (row groups צמודים לחודש ⇒ zone maps);
+    כל החודשים / שינוי עמודות ⇒ בנייה מלאה, ממוינת כולה לפי תאריך.
+    """
+    if FACT_TABLE not in sources:
+        return
+    schema: dict[str, list[dict]] = {}
+    for tbl, col in duck.execute("""
+            SELECT table_name, column_name FROM information_schema.columns
+            WHERE table_catalog = current_database() AND table_schema = 'main'
+            ORDER BY table_name, ordinal_position""").fetchall():
+        schema.setdefault(tbl, []).append({"name": col})
+    if not any(c['name'] == WIDE_DATE for c in schema.get(FACT_TABLE, [])):
+        print(f"ℹ️  {FACT_TABLE} has no {WIDE_DATE} – {WIDE_TABLE} skipped")
+        return
+
+    sql, dims = wide_sql(schema)
+    src = next((d for d in sorted(deps[FACT_TABLE]) if d in schema_raw
+                and any(c['name'] == WIDE_DATE for c in schema_raw[d])), None)
+    if src is None:
+        full = True                                   # אין מקור RAW לטביעה לפי חודש
+        months = {m: "" for (m,) in duck.execute(
+            f"SELECT DISTINCT {WIDE_MONTH.format(a='f')} FROM {FACT_TABLE} f").fetchall()}
+    else:
+        col_list = ", ".join(f'r."{c["name"]}"' for c in schema_raw[src])
+        months = {m: f"{n}:{h}" for m, n, h in duck.execute(f"""
+            SELECT {WIDE_MONTH.format(a='r')}, count(*), sum(hash({col_list}))
+            FROM raw.main.{src} r GROUP BY 1""").fetchall()}
+    base = _sha(sql, sources[FACT_TABLE], *(f"{d}={version.get(d, '')}" for d in dims))
+    want = {m: _sha(base, v) for m, v in months.items()}
+
+    duck.execute(f"""
+        CREATE TABLE IF NOT EXISTS {WIDE_STATE} (
+            month     DATE,
+            version   VARCHAR,
+            built_at  TIMESTAMP
+        )""")
+    have = dict(duck.execute(f"SELECT month, version FROM {WIDE_STATE}").fetchall())
+    todo = [m for m, v in want.items() if have.get(m) != v]
+    gone = [m for m in have if m not in want]
+    rebuild = full or WIDE_TABLE not in schema or len(todo) == len(want)
+    if not todo and not gone:
+        print(f"✓ {WIDE_TABLE:<30} unchanged ({len(want)} months)")
+        return
+
+    t0 = time.perf_counter()
+    with span("build_model", entity=WIDE_TABLE):
+        if rebuild:
+            duck.begin()
+            try:
+                duck.execute(f"CREATE OR REPLACE TABLE {WIDE_TABLE} AS {sql}")
+                duck.execute(f"DELETE FROM {WIDE_STATE}")
+                duck.executemany(f"INSERT INTO {WIDE_STATE} VALUES (?, ?, now()::TIMESTAMP)",
+                                 [[m, v] for m, v in want.items()])
+                duck.commit()
+            except Exception:
+                duck.rollback()
+                raise
+        else:
+            stage_sql, _ = wide_sql(schema, _month_in(WIDE_MONTH.format(a='f'), todo))
+            duck.execute(f"CREATE OR REPLACE TEMP TABLE _wide_stage AS {stage_sql}")
+            widen_to_fit(duck, WIDE_TABLE, "_wide_stage")    # אחרי narrow_database – לפני ה-INSERT
+            stale = [*todo, *gone]
+            duck.begin()
+            try:
+                duck.execute(f"DELETE FROM {WIDE_TABLE} WHERE {_month_in(WIDE_MONTH.format(a=WIDE_TABLE), stale)}")
+                duck.execute(f"INSERT INTO {WIDE_TABLE} BY NAME SELECT * FROM _wide_stage")
+                duck.execute(f"DELETE FROM {WIDE_STATE} WHERE {_month_in('month', stale)}")
+                duck.executemany(f"INSERT INTO {WIDE_STATE} VALUES (?, ?, now()::TIMESTAMP)",
+                                 [[m, want[m]] for m in todo])
+                duck.commit()
+            except Exception:
+                duck.rollback()
+                raise
+            duck.execute("DROP TABLE _wide_stage")
+    how = "rebuilt" if rebuild else f"{len(todo)} months replaced, {len(gone)} dropped"
+    print(f"✓ {WIDE_TABLE:<30} {time.perf_counter() - t0:6.1f}s  ({how})")
+
+
+# ── model DAG – ref()/FROM/JOIN לפני strip_jinja ──────────────────────
+MANIFEST_TABLE = "_model_manifest"
+MODEL_WORKERS  = 4
+
+_ref_re   = re.compile(r"\{\{\s*ref\(\s*['\"]([^'\"]+)['\"]\s*\)\s*\}\}")
+_table_re = re.compile(r"\b(?:FROM|JOIN)\s+(?:main\.)?\"?([A-Za-z_][\w]*)\"?", re.I)
+
+def model_deps(raw_sql: str, known: set[str]) -> set[str]:
+    """שמות (models / stg_*) שה-SQL קורא מהם – ref('x') ו-FROM/JOIN x."""
+    names = set(_ref_re.findall(raw_sql)) | set(_table_re.findall(raw_sql))
+    return {n for n in names if n in known}
+
+def topo_levels(deps: dict[str, set[str]]) -> list[list[str]]:
+    """Kahn: רשימת שכבות; כל מודל בשכבה תלוי רק בשכבות קודמות."""
+    left  = {m: set(d) & deps.keys() for m, d in deps.items()}
+    levels = []
+    while left:
+        ready = sorted(m for m, d in left.items() if not d)
+        if not ready:
+            raise ValueError(f"dependency cycle between models: {sorted(left)}")
+        levels.append(ready)
+        for m in ready:
+            del left[m]
+        for d in left.values():
+            d.difference_update(ready)
+    return levels
+
+def source_version(duck, tbl: str, cols: list[dict]) -> str:
+    """גרסת נתונים של טבלת RAW: מספר שורות + סכום hash של כל השורות."""
+    col_list = ", ".join(f'"{c["name"]}"' for c in cols)
+    n, h = duck.execute(f"SELECT count(*), sum(hash({col_list})) FROM {tbl}").fetchone()
+    return f"{n}:{h}"
+
+def _sha(*parts: str) -> str:
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+def build_model(cur, model_name: str, raw_sql: str) -> float:
+    """יוצר טבלה אחת (+ CAST ל-…DATE); רץ על cursor נפרד לכל thread."""
+    with cur, span("build_model", entity=model_name):
+        return _build_model(cur, model_name, raw_sql)
+
+def _build_model(cur, model_name: str, raw_sql: str) -> float:
+    t0 = time.perf_counter()
+    plain_sql = strip_jinja(raw_sql)
+
+    # אם הקובץ הוא SELECT בלבד – עטוף ב-CREATE TABLE
+    if not re.match(r"^\s*CREATE\s", plain_sql, re.I):
+        plain_sql = f"CREATE OR REPLACE TABLE {model_name} AS\n{plain_sql}"
+
+    cur.execute(plain_sql)
+
+    # CAST אוטומטי לעמודות שמסתיימות ב-DATE
+    cols = cur.execute(f"PRAGMA table_info('{model_name}')").fetchall()
+    for _, col_name, col_type, *_ in cols:
+        if (col_name.lower().endswith('date') and
+            col_type.upper() not in ('DATE','TIMESTAMP')):
+            cur.execute(f"""
+                ALTER TABLE {model_name}
+                ALTER COLUMN {col_name}
+                SET DATA TYPE DATE
+                USING TRY_CAST({col_name} AS DATE)
+            """)
+    return time.perf_counter() - t0
+
+
 # ── build feature store ───────────────────────────────────────────────
 # ── build feature store  –  כולל CAST אוטומטי לעמודות …DATE ───────────
-def materialize_models(schema_raw: dict):
+def materialize_models(schema_raw: dict, full: bool = False, workers: int = MODEL_WORKERS,
+                       db: pathlib.Path = DWH_DB):
     """
     • יוצר VIEW-ים לטבלאות stg_*  (כמו קודם)
-    • מריץ את קובצי dim_* / fact_*  (כמו קודם)
+    • מריץ את קובצי dim_* / fact_*  לפי סדר התלויות (ref / FROM / JOIN),
+      מודלים בלתי-תלויים במקביל (cursor לכל thread).
+    • מדלג על מודל שגם ה-SQL שלו וגם גרסת הנתונים של ה-upstream לא השתנו
+      (manifest בטבלה _model_manifest בתוך feature_store.duckdb).  full=True ⇒ הכל.
     • מיד לאחר יצירת כל טבלה: אם קיימת עמודה ששמה מסתיים ב-DATE
       והטיפוס שלה עדיין TEXT / VARCHAR / INT – ממיר אותה ל-DATE
       באמצעות TRY_CAST, כך שהשדה יהיה טיפוס תאריך אמיתי.
+      (שדות Edm.DateTimeOffset מגיעים מה-ETL כבר כ-TIMESTAMP – odata_types –
+      ולכן לא נכתבים מחדש; ה-CAST נשאר רק לטבלאות RAW ישנות / עמודות טקסט.)
+    • fact_sales_wide – ה-fact עם תיאורי ה-dims (build_wide_fact), לפי חודשים שהשתנו.
     """
-    duck = duckdb.connect(str(DWH_DB))
+    duck = duckdb.connect(str(db))
     duck.execute(f"ATTACH '{RAW_DB}' AS raw (READ_ONLY)")
 
     # 1. VIEW-ים מה-RAW
@@ -158,59 +465,118 @@ def materialize_models(schema_raw: dict):
             SELECT * FROM raw.main.{tbl}
         """)
 
-    # 2. טבלאות dim_*/fact_*  מקבצי SQL
-    for sql_path in DBT_DIR.glob("*.sql"):
-        model_name = sql_path.stem              # dim_customers / fact_sales …
-        raw_sql    = sql_path.read_text(encoding="utf-8")
-        plain_sql  = strip_jinja(raw_sql)
-
-        # אם הקובץ הוא SELECT בלבד – עטוף ב-CREATE TABLE
-        if not re.match(r"^\s*CREATE\s", plain_sql, re.I):
-            plain_sql = f"CREATE OR REPLACE TABLE {model_name} AS\n{plain_sql}"
-
-        duck.execute(plain_sql)
-
-        # 3. CAST אוטומטי לעמודות שמסתיימות ב-DATE
-        cols = duck.execute(f"PRAGMA table_info('{model_name}')").fetchall()
-        for _, col_name, col_type, *_ in cols:
-            if (col_name.lower().endswith('date') and
-                col_type.upper() not in ('DATE','TIMESTAMP')):
-                duck.execute(f"""
-                    ALTER TABLE {model_name}
-                    ALTER COLUMN {col_name}
-                    SET DATA TYPE DATE
-                    USING TRY_CAST({col_name} AS DATE)
-                """)
+    # 2. DAG של קובצי ה-SQL
+    sources = {p.stem: p.read_text(encoding="utf-8") for p in sorted(DBT_DIR.glob("*.sql"))}
+    known   = set(sources) | set(schema_raw)
+    deps    = {m: model_deps(sql, known) - {m} for m, sql in sources.items()}
+    levels  = topo_levels(deps)
+
+    duck.execute(f"""
+        CREATE TABLE IF NOT EXISTS {MANIFEST_TABLE} (
+            model     VARCHAR PRIMARY KEY,
+            version   VARCHAR,
+            built_at  TIMESTAMP,
+            seconds   DOUBLE
+        )""")
+    manifest = dict(duck.execute(f"SELECT model, version FROM {MANIFEST_TABLE}").fetchall())
+    existing = {r[0] for r in duck.execute(
+        "SELECT table_name FROM information_schema.tables WHERE table_schema = 'main'").fetchall()}
+
+    # גרסה של מודל = hash(SQL, גרסאות ה-upstream); גרסת stg_* = נתוני ה-RAW
+    version: dict[str, str] = {}
+    for src in {d for ds in deps.values() for d in ds if d in schema_raw}:
+        version[src] = source_version(duck, src, schema_raw[src])
+    for level in levels:
+        for m in level:
+            version[m] = _sha(sources[m], *(f"{d}={version[d]}" for d in sorted(deps[m])))
+
+    # 3. בנייה לפי שכבות; בתוך שכבה – במקביל
+    built = skipped = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for level in levels:
+            todo = [m for m in level
+                    if full or m not in existing or manifest.get(m) != version[m]]
+            skipped += len(level) - len(todo)
+            futs = {m: pool.submit(build_model, duck.cursor(), m, sources[m]) for m in todo}
+            for m, fut in futs.items():
+                secs = fut.result()
+                duck.execute(f"INSERT OR REPLACE INTO {MANIFEST_TABLE} VALUES (?, ?, now()::TIMESTAMP, ?)",
+                             [m, version[m], secs])
+                built += 1
+                print(f"✓ {m:<30} {secs:6.1f}s")
+    print(f"✓ models: {built} built, {skipped} unchanged ({len(levels)} levels)")
+
+    # 3b. fact רחב (ה-joins של star_hint מראש), לפי חודשים שהשתנו
+    build_wide_fact(duck, schema_raw, sources, deps, version, full=full)
 
     # 4. column_aliases
     build_column_aliases(duck)
     duck.close()
-    print("🏁  feature_store.duckdb built →", DWH_DB)
+    print("🏁  feature_store.duckdb built →", db)
 
 
-# ── main ──────────────────────────────────────────────────────────────
-def main():
-    if not os.getenv("OPENAI_API_KEY"):
-        raise EnvironmentError("OPENAI_API_KEY not set")
+# ── stages (גם ל-pipeline.py) ─────────────────────────────────────────
+def raw_version() -> str:
+    """טביעת אצבע של נתוני ה-RAW (כל stg_*) – הקלט של build_models."""
+    schema = extract_schema(RAW_DB)
+    con = duckdb.connect(str(RAW_DB), read_only=True)
+    parts = [f"{t}={source_version(con, t, cols)}" for t, cols in sorted(schema.items())]
+    con.close()
+    return _sha(json.dumps(schema, sort_keys=True, ensure_ascii=False), *parts)
+
+def dwh_version() -> str:
+    """טביעת אצבע של סכמת ה-DWH – הקלט של star_hints."""
+    return _sha(json.dumps(extract_schema(snapshot.current(DWH_DB)), sort_keys=True, ensure_ascii=False))
 
-    reset_workspace()
+def build_models(full: bool = False, db: pathlib.Path | None = None):
+    if db is None:                            # שלב עצמאי – עותק משלו, מתפרסם בסוף
+        with snapshot.staging(DWH_DB) as db:
+            return build_models(full, db)
 
     # 1. RAW schema (רק stg_*)
-    schema_raw = extract_schema(RAW_DB)
+    with span("extract_schema"):
+        schema_raw = extract_schema(RAW_DB)
     print(f"✓ schema extracted – {len(schema_raw)} tables")
 
-    # 2. GPT → קבצים
-    files = call_gpt(schema_raw)
-    write_files(files)
+    # 2. GPT → קבצים  (מטמון לפי סכמה+prompt+model; רק טבלאות שהשתנו נשלחות)
+    with span("gpt_generate"):
+        files = generate_models(schema_raw)
+        write_files(files)
 
     # 3. לבנות feature_store
-    materialize_models(schema_raw)
+    with span("materialize"):
+        materialize_models(schema_raw, full=full, db=db)
 
-    # 4. DWH schema (כולל fact_ ו-dim_)
-    schema_dwh = extract_schema(DWH_DB)
+    # 3b. פרופיל עמודות + צמצום טיפוסים (ENUM / INT / DECIMAL / DATE)
+    with span("narrow"):
+        narrow_database(db)
+
+def star_hints(db: pathlib.Path | None = None):
+    # 4. DWH schema (כולל fact_ ו-dim_) – ברירת מחדל: הגרסה שפורסמה
+    schema_dwh = extract_schema(db or snapshot.current(DWH_DB))
 
     # 5. כעת אפשר ליצור star_hint.txt
-    build_star_hint(schema_dwh)
+    with span("star_hint"):
+        build_star_hint(schema_dwh)
+
+
+# ── main ──────────────────────────────────────────────────────────────
+def main():
+    ap = argparse.ArgumentParser(description="RAW → dbt models + feature_store.duckdb")
+    ap.add_argument("--reset", action="store_true",
+                    help="wipe model files, feature_store.duckdb and star_hint.txt first")
+    ap.add_argument("--full", action="store_true", help="rebuild every model table")
+    etl_metrics.add_cli(ap)
+    args = ap.parse_args()
+
+    if args.reset:
+        reset_workspace()
+
+    # כל הבנייה בעותק אחד (snapshot) – מתפרסם רק אם הכל הצליח
+    with snapshot.staging(DWH_DB, fresh=args.reset) as dwh, \
+            etl_metrics.run("gpt_modeler", dwh, profile=args.profile):
+        build_models(full=args.full, db=dwh)
+        star_hints(dwh)
 
 
 if __name__ == "__main__":
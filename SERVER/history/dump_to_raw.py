@@ -1,42 +1,365 @@
 # etl/dump_to_raw.py
 # ==============================================================
 #  Dump ALL MSSQL tables (dbo.*) → DuckDB RAW (1-to-1)
+#
+#  • כל טבלה נקראת ב-chunks (stream_results) ומומרת ל-Arrow לפי טיפוסי
+#    העמודות במקור – הזיכרון תלוי ב---chunk-rows ולא בגודל הטבלה.
+#    הטיפוס של כל עמודה נקבע פעם אחת לטבלה (arrow_type) וכל chunk מומר
+#    אליו; uniqueidentifier / sql_variant / xml – טקסט מראש. ערך שלא מתאים
+#    לטיפוס – NULL + אזהרה (לא החלפת טיפוס באמצע הטבלה).
+#  • כמה טבלאות במקביל (--workers, connection לכל worker);
+#    כותב יחיד ל-DuckDB: כל טבלה נבנית ב-<tbl>__loading ומוחלפת בסוף.
+#  • לכל טבלה מודפס throughput (rows, שניות, rows/s).
+#  • טביעת אצבע לכל טבלה ב-_dump_state (rows, max key/rowversion, checksum,
+#    hash של שמות + טיפוסי העמודות): טבלה שלא השתנתה – מדולגת; PK identity
+#    שרק גדל – append של השורות החדשות (רק אם הסכמה לא השתנתה).
+#
+#  שימוש:  python history/dump_to_raw.py [--workers 4] [--chunk-rows 50000]
+#                                         [--checksum] [--full]
 # ==============================================================
 
-import os, sys, duckdb, sqlalchemy as sa, pandas as pd
+import os, sys, time, queue, hashlib, argparse, duckdb, sqlalchemy as sa, pyarrow as pa
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from dotenv import load_dotenv
 from urllib.parse import quote_plus     # ← NEW
 # ────────────────────────────────────────────────────────────────
 
 ROOT = os.path.dirname(os.path.dirname(__file__))
 load_dotenv(os.path.join(ROOT, ".env"))
+sys.path.append(os.path.join(ROOT, "ETL"))                  # etl_metrics
+import etl_metrics
+from etl_metrics import span
 
 dsn         = os.getenv("PY_MSSQL_DSN")                     # DSN from .env
 duckdb_path = os.path.join(ROOT, os.getenv("DUCKDB_PATH", "raw_best.duckdb"))
 
-if not dsn:
-    sys.exit("❌  PY_MSSQL_DSN missing in .env")
+WORKERS    = 4
+CHUNK_ROWS = 50_000
 
-# ── SQLAlchemy engine (URL-encoded DSN) ────────────────────────
-conn_str = quote_plus(dsn)                                  # ← URL-encode
-mssql = sa.create_engine(f"mssql+pyodbc:///?odbc_connect={conn_str}")
-duck  = duckdb.connect(duckdb_path)
 
-# ── fetch table list (dbo.*) ───────────────────────────────────
-TABLES = pd.read_sql(
-    "SELECT TABLE_NAME FROM INFORMATION_SCHEMA.TABLES WHERE TABLE_SCHEMA='dbo'",
-    mssql
-)["TABLE_NAME"].tolist()
+# ── SQLAlchemy type → Arrow type ───────────────────────────────
+TEXT_TYPES = {"UNIQUEIDENTIFIER", "SQL_VARIANT", "XML", "UUID"}     # ערכים שאינם str – טקסט
 
-print("⬇  copying", len(TABLES), "tables …")
 
-for tbl in TABLES:
-    df = pd.read_sql(f"SELECT * FROM dbo.{tbl}", mssql)
-    duck.execute(f"DROP TABLE IF EXISTS {tbl}")
-    duck.register("tmp_df", df)
-    duck.execute(f"CREATE TABLE {tbl} AS SELECT * FROM tmp_df")
-    duck.unregister("tmp_df")
-    print(f"   • {tbl:30} {len(df):>8} rows")
+def arrow_type(col_type: sa.types.TypeEngine) -> pa.DataType:
+    t = sa.types
+    if type(col_type).__name__.upper() in TEXT_TYPES:
+        return pa.string()
+    if isinstance(col_type, t.Boolean):
+        return pa.bool_()
+    if isinstance(col_type, t.BigInteger):
+        return pa.int64()
+    if isinstance(col_type, t.SmallInteger):
+        return pa.int16()
+    if isinstance(col_type, t.Integer):
+        return pa.int32()
+    if isinstance(col_type, t.Float):
+        return pa.float64()
+    if isinstance(col_type, t.Numeric):
+        p, s = col_type.precision, col_type.scale
+        return pa.decimal128(p, s or 0) if p and p <= 38 else pa.float64()
+    if isinstance(col_type, t.DateTime):
+        return pa.timestamp("us")
+    if isinstance(col_type, t.Date):
+        return pa.date32()
+    if isinstance(col_type, t.Time):
+        return pa.time64("us")
+    if isinstance(col_type, t._Binary):
+        return pa.binary()
+    return pa.string()
 
-print("🏁  DONE  – RAW saved to", duckdb_path)
-duck.close()
+
+_BAD_VALUE = (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError, ValueError, TypeError)
+
+
+def _coerce(v, typ: pa.DataType):
+    try:
+        return pa.scalar(v, type=typ).as_py()
+    except _BAD_VALUE:
+        return None
+
+
+def to_batch(rows, names: list[str], types: list[pa.DataType], tbl: str = "") -> pa.Table:
+    """chunk → Arrow בסכמה הקבועה של הטבלה (types) – כל ה-chunks באותה סכמה"""
+    cols = []
+    for i, typ in enumerate(types):
+        values = [r[i] for r in rows]
+        if pa.types.is_string(typ):
+            values = [v if v is None or isinstance(v, str) else str(v) for v in values]
+        try:
+            cols.append(pa.array(values, type=typ))
+        except _BAD_VALUE:
+            # ערך חריג – רק הוא נפסל; הטיפוס של העמודה לא משתנה בין chunks
+            fixed = [_coerce(v, typ) for v in values]
+            bad = sum(1 for v, f in zip(values, fixed) if v is not None and f is None)
+            if bad:
+                print(f"   ⚠️ {tbl}.{names[i]}: {bad:,} value(s) do not fit {typ} – stored as NULL")
+            cols.append(pa.array(fixed, type=typ))
+    return pa.table(cols, schema=pa.schema(list(zip(names, types))))
+
+
+# ── fingerprint / state ───────────────────────────────────────
+STATE_TABLE = "_dump_state"
+
+
+@dataclass(frozen=True)
+class Fingerprint:
+    rows: int
+    max_key: str | None = None        # rowversion (hex) או מפתח שלם
+    checksum: int | None = None       # CHECKSUM_AGG(BINARY_CHECKSUM(*)) – רק עם --checksum
+    columns: str | None = None        # hash של (שם, טיפוס) לכל עמודה – ALTER במקור ⇒ העתקה מלאה
+
+
+def read_state(duck) -> dict[str, Fingerprint]:
+    duck.execute(f"""
+        CREATE TABLE IF NOT EXISTS {STATE_TABLE} (
+            table_name VARCHAR PRIMARY KEY,
+            row_count  BIGINT,
+            max_key    VARCHAR,
+            checksum   BIGINT,
+            copied_at  TIMESTAMP,
+            columns    VARCHAR
+        )""")
+    return {r[0]: Fingerprint(r[1], r[2], r[3], r[4]) for r in duck.execute(
+        f"SELECT table_name, row_count, max_key, checksum, columns FROM {STATE_TABLE}").fetchall()}
+
+
+def save_state(duck, tbl: str, fp: Fingerprint) -> None:
+    duck.execute(f"""
+        INSERT OR REPLACE INTO {STATE_TABLE} (table_name, row_count, max_key, checksum, copied_at, columns)
+        VALUES (?, ?, ?, ?, now()::TIMESTAMP, ?)""", [tbl, fp.rows, fp.max_key, fp.checksum, fp.columns])
+
+
+def columns_hash(cols: list[dict]) -> str:
+    """שמות + טיפוסים מה-reflection, לפי הסדר (ה-append מוסיף לפי מיקום)"""
+    spec = "\n".join(f"{c['name']}\t{c['type']!r}" for c in cols)
+    return hashlib.sha1(spec.encode("utf-8")).hexdigest()
+
+
+def change_key(cols: list[dict], pk: list[str]) -> tuple[str | None, bool]:
+    """
+    (עמודת מפתח-שינוי, append_only?)
+      • rowversion / timestamp  – משתנה בכל UPDATE ⇒ זיהוי שינוי בלבד.
+      • PK שלם יחיד עם identity  – עולה מונוטונית ⇒ אפשר append-only.
+    """
+    for c in cols:
+        if type(c["type"]).__name__.upper() in ("ROWVERSION", "TIMESTAMP"):
+            return c["name"], False
+    if len(pk) == 1:
+        col = next((c for c in cols if c["name"] == pk[0]), None)
+        if col is not None and isinstance(col["type"], sa.types.Integer):
+            return col["name"], bool(col.get("autoincrement") is True or col.get("identity"))
+    return None, False
+
+
+def fingerprint(conn, table, key: str | None, checksum: bool, columns: str | None = None) -> Fingerprint:
+    cols = [sa.func.count()]
+    if key:
+        cols.append(sa.func.max(table.c[key]))
+    row = conn.execute(sa.select(*cols).select_from(table)).one()
+    max_key = row[1] if key else None
+    if isinstance(max_key, (bytes, bytearray)):
+        max_key = max_key.hex()
+    cs = None
+    if checksum and conn.dialect.name == "mssql":
+        cs = conn.execute(sa.select(sa.text("CHECKSUM_AGG(BINARY_CHECKSUM(*))")).select_from(table)).scalar()
+    return Fingerprint(int(row[0]), None if max_key is None else str(max_key), cs, columns)
+
+
+# ── copy engine ───────────────────────────────────────────────
+def read_table(engine, tbl: str, schema: str | None, chunk_rows: int, out: queue.Queue,
+               prev: Fingerprint | None = None, checksum: bool = False) -> None:
+    """
+    worker: מזרים את הטבלה ל-`out` כ-(kind, tbl, payload).
+    prev – טביעת האצבע מהריצה הקודמת (None ⇒ העתקה מלאה).
+      • זהה לנוכחית             → ("skip", …) בלי לקרוא שורות.
+      • append-only ורק נוספו   → שורות עם key > max_key הקודם בלבד.
+    """
+    try:
+        t0 = time.perf_counter()
+        insp  = sa.inspect(engine)
+        cols  = insp.get_columns(tbl, schema=schema)
+        pk    = (insp.get_pk_constraint(tbl, schema=schema) or {}).get("constrained_columns") or []
+        names = [c["name"] for c in cols]
+        types = [arrow_type(c["type"]) for c in cols]
+        table = sa.table(tbl, *[sa.column(n) for n in names], schema=schema)
+        key, append_only = change_key(cols, pk)
+        stmt  = sa.select(table)
+        mode  = "full"
+        rows = 0
+        with engine.connect() as conn:
+            with span("mssql_fingerprint", entity=tbl):
+                fp = fingerprint(conn, table, key, checksum, columns_hash(cols))
+            if prev is not None and prev == fp:
+                out.put(("skip", tbl, fp))
+                return
+            if (prev is not None and append_only and prev.columns == fp.columns
+                    and prev.max_key is not None and fp.max_key is not None and fp.rows > prev.rows
+                    and int(fp.max_key) > int(prev.max_key)):
+                mode = "append"
+                stmt = stmt.where(table.c[key] > int(prev.max_key))
+            result = conn.execution_options(stream_results=True, yield_per=chunk_rows).execute(stmt)
+            parts = iter(result.partitions(chunk_rows))
+            while True:
+                with span("mssql_read", entity=tbl):
+                    part = next(parts, None)
+                if part is None:
+                    break
+                with span("arrow_build", entity=tbl) as sp:
+                    batch = to_batch(part, names, types, tbl)
+                    sp.add(rows=batch.num_rows, nbytes=batch.nbytes)
+                rows += batch.num_rows
+                with span("queue_wait", entity=tbl):
+                    out.put(("chunk", tbl, batch))
+            if rows == 0:
+                # טבלה ריקה – עדיין יוצרים אותה עם הסכמה
+                out.put(("chunk", tbl, pa.table([pa.array([], type=typ) for typ in types], names=names)))
+        out.put(("done", tbl, (rows, time.perf_counter() - t0, fp, mode)))
+    except BaseException as exc:
+        out.put(("error", tbl, exc))
+
+
+def dump_tables(engine, duck, tables: list[str], *, schema: str | None = "dbo",
+                workers: int = WORKERS, chunk_rows: int = CHUNK_ROWS,
+                incremental: bool = True, checksum: bool = False) -> dict[str, int]:
+    """
+    מעתיק את `tables` מ-`engine` ל-`duck`. מחזיר {table: rows} של מה שהועתק.
+    engine יכול להיות כל SQLAlchemy engine (למשל sqlite לבדיקה, schema=None).
+    incremental=False ⇒ מתעלם מ-_dump_state ומעתיק הכל.
+    """
+    state = read_state(duck)
+    existing = {r[0] for r in duck.execute(
+        "SELECT table_name FROM information_schema.tables WHERE table_schema = 'main'").fetchall()}
+
+    inbox: queue.Queue = queue.Queue(maxsize=workers * 2)     # גבול זיכרון
+    started: set[str] = set()
+    broken:  set[str] = set()
+    copied: dict[str, int] = {}
+    skipped = 0
+    retry_full: list[str] = []
+    failed: list[tuple[str, BaseException]] = []
+
+    def fail(tbl: str, exc: BaseException) -> None:
+        broken.add(tbl)
+        failed.append((tbl, exc))
+        duck.execute(f'DROP TABLE IF EXISTS "{tbl}__loading"')
+        print(f"   ✗ {tbl:30} {exc}")
+
+    def swap(tbl: str, tmp: str, fp: Fingerprint, mode: str) -> bool:
+        """מחליף/מוסיף בטרנזקציה; False ⇒ append לא התיישב עם המקור (צריך full)"""
+        duck.begin()
+        try:
+            if mode == "append":
+                duck.execute(f'INSERT INTO "{tbl}" SELECT * FROM {tmp}')
+                n = duck.execute(f'SELECT count(*) FROM "{tbl}"').fetchone()[0]
+                if n != fp.rows:                  # נמחקו/שונו שורות ישנות
+                    duck.rollback()
+                    duck.execute(f"DROP TABLE IF EXISTS {tmp}")
+                    return False
+                duck.execute(f"DROP TABLE {tmp}")
+            else:
+                duck.execute(f'DROP TABLE IF EXISTS "{tbl}"')
+                duck.execute(f'ALTER TABLE {tmp} RENAME TO "{tbl}"')
+            save_state(duck, tbl, fp)
+            duck.commit()
+            return True
+        except Exception:
+            duck.rollback()
+            raise
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        def submit(tbl: str, prev: Fingerprint | None) -> None:
+            started.discard(tbl)
+            pool.submit(read_table, engine, tbl, schema, chunk_rows, inbox, prev, checksum)
+
+        for tbl in tables:
+            prev = state.get(tbl) if incremental and tbl in existing else None
+            submit(tbl, prev)
+
+        pending = len(tables)
+        while pending:
+            kind, tbl, payload = inbox.get()
+            if kind != "chunk":
+                pending -= 1
+            if tbl in broken:
+                continue      # הכותב כבר נכשל בטבלה הזו – מרוקנים את התור
+            tmp = f'"{tbl}__loading"'
+            try:
+                if kind == "chunk":
+                    batch = payload
+                    with span("duckdb_insert", entity=tbl) as sp:
+                        if tbl not in started:
+                            started.add(tbl)
+                            duck.execute(f"CREATE OR REPLACE TABLE {tmp} AS SELECT * FROM batch")
+                        else:
+                            duck.execute(f"INSERT INTO {tmp} SELECT * FROM batch")
+                        sp.add(rows=batch.num_rows, nbytes=batch.nbytes)
+                elif kind == "skip":
+                    skipped += 1
+                    print(f"   = {tbl:30} unchanged ({payload.rows} rows)")
+                elif kind == "error":
+                    fail(tbl, payload)
+                else:
+                    rows, secs, fp, mode = payload
+                    with span("duckdb_swap", entity=tbl):
+                        swapped = swap(tbl, tmp, fp, mode)
+                    if not swapped:
+                        print(f"   ↻ {tbl:30} append did not match source count – full copy")
+                        pending += 1
+                        submit(tbl, None)
+                        continue
+                    copied[tbl] = rows
+                    print(f"   • {tbl:30} {rows:>8} rows  {secs:6.1f}s  "
+                          f"{rows / max(secs, 1e-6):>9,.0f} rows/s{'  (append)' if mode == 'append' else ''}")
+            except Exception as exc:
+                # לא מעלים כאן – workers אחרים עדיין כותבים לתור
+                fail(tbl, exc)
+
+    if skipped:
+        print(f"   ({skipped} unchanged tables skipped)")
+    if failed:
+        raise failed[0][1]
+    return copied
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="dump MSSQL dbo.* → DuckDB RAW")
+    ap.add_argument("--workers", type=int, default=WORKERS, help="tables copied in parallel")
+    ap.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="rows per Arrow batch")
+    ap.add_argument("--full", action="store_true", help="ignore fingerprints and recopy every table")
+    ap.add_argument("--checksum", action="store_true",
+                    help="add CHECKSUM_AGG(BINARY_CHECKSUM(*)) to the fingerprint (catches in-place updates)")
+    etl_metrics.add_cli(ap)
+    args = ap.parse_args()
+
+    if not dsn:
+        sys.exit("❌  PY_MSSQL_DSN missing in .env")
+
+    # ── SQLAlchemy engine (URL-encoded DSN) ────────────────────────
+    conn_str = quote_plus(dsn)                                  # ← URL-encode
+    mssql = sa.create_engine(f"mssql+pyodbc:///?odbc_connect={conn_str}",
+                             pool_size=args.workers, max_overflow=2)
+    duck  = duckdb.connect(duckdb_path)
+
+    # ── fetch table list (dbo.*) ───────────────────────────────────
+    with mssql.connect() as conn:
+        TABLES = [r[0] for r in conn.execute(sa.text(
+            "SELECT TABLE_NAME FROM INFORMATION_SCHEMA.TABLES WHERE TABLE_SCHEMA='dbo'"))]
+    print("⬇  copying", len(TABLES), "tables …")
+
+    t0 = time.perf_counter()
+    with etl_metrics.run("dump_to_raw", duckdb_path, profile=args.profile):
+        copied = dump_tables(mssql, duck, TABLES, schema="dbo",
+                             workers=args.workers, chunk_rows=args.chunk_rows,
+                             incremental=not args.full, checksum=args.checksum)
+        duck.close()
+    total = sum(copied.values())
+    secs  = time.perf_counter() - t0
+    print(f"   Σ {len(copied)} tables  {total:,} rows  {secs:.1f}s  {total / max(secs, 1e-6):,.0f} rows/s")
+
+    print("🏁  DONE  – RAW saved to", duckdb_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+// קריאה מהגרסה שפורסמה ע"י snapshot.py (ETL)
+//   <name>.current  →  <name>.snapshots/<name>.vNNNNNN.duckdb
+// הגרסה הפעילה נפתחת READ_ONLY – אין נעילה מול הבנייה, שכותבת לעותק משלה.
+// refresh() עובר לגרסה חדשה כשהמצביע משתנה; החיבור הישן נסגר כשהשאילתות
+// שרצות עליו מסתיימות. אין מצביע (לפני הפרסום הראשון) – הקובץ עצמו.
+import fs from 'node:fs';
+import path from 'node:path';
+import duckdb from 'duckdb';
+
+export function currentSnapshot(dbPath) {
+  const pointer = dbPath.replace(/\.duckdb$/, '.current');
+  try {
+    const rel = fs.readFileSync(pointer, 'utf-8').trim();
+    const file = path.resolve(path.dirname(dbPath), rel);
+    if (rel && fs.existsSync(file)) return file;
+  } catch { /* עוד לא פורסמה גרסה */ }
+  return dbPath;
+}
+
+export function openSnapshot(dbPath) {
+  let active = null;
+
+  const open = file => {
+    const db = new duckdb.Database(file, { access_mode: 'READ_ONLY' });
+    return { file, db, conn: db.connect(), busy: 0, retired: false };
+  };
+  const release = h => {
+    if (h.retired && h.busy === 0) h.db.close(() => {});
+  };
+
+  // true ⇒ עברנו לגרסה אחרת
+  function refresh() {
+    const file = currentSnapshot(dbPath);
+    if (active && active.file === file) return false;
+    const prev = active;
+    active = open(file);
+    if (prev) {
+      prev.retired = true;
+      release(prev);
+    }
+    return true;
+  }
+
+  function query(sql, params = []) {
+    const h = active;
+    h.busy++;
+    return new Promise((resolve, reject) => {
+      const cb = (err, rows) => {
+        h.busy--;
+        release(h);
+        err ? reject(err) : resolve(rows);
+      };
+      params.length ? h.conn.all(sql, params, cb) : h.conn.all(sql, cb);
+    });
+  }
+
+  refresh();
+  return { query, refresh, get file() { return active.file; } };
+}
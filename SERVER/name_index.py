@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+"""
+name_index.py – אינדקס trigram/מילים לשמות לקוחות / פריטים / משפחות (עברית)
+
+שאלות מזכירות לקוח או פריט בחלק מהשם ("אלומיניום לבן", "כהן בע״מ").
+במקום LIKE '%…%' על CUSTDES / PARTDES – אינדקס ב-feature_store.duckdb:
+    _name_docs   (kind, code, text, norm, row_hash, ngrams)  – שורה לכל קוד
+    _name_grams  (gram, kind, code)                           – trigrams + מילים
+ו-lookup(text) מחזיר קודים מדורגים (דמיון Jaccard על ה-grams).
+
+נרמול עברי (normalize) – אותו נרמול לאינדקס ולשאילתה:
+    • ניקוד וטעמים נמחקים; מקף עברי (־) → רווח.
+    • אותיות סופיות → רגילות (ך→כ, ם→מ, ן→נ, ף→פ, ץ→צ).
+    • גרש / גרשיים (׳ ״ ' " `) נמחקים – בע"מ = בעמ, ג'ינס = גינס.
+    • NFKC, אותיות לטיניות קטנות, פיסוק → רווח.
+
+מקורות:
+    • RAW – stg_customers / stg_parts (SOURCES).
+    • feature_store_heb – המסכים העבריים (backfill_heb_screens): כל זוג שדות
+      <X>NAME / <X>DES של ישות (CUSTNAME/CUSTDES, ACCNAME/ACCDES …) מתורגם
+      לשמות העמודות העבריים (normalize_desc) דרך מטמון ה-$metadata. קוד שכבר
+      קיים מ-RAW לא נדרס (התיאור של ה-dim קודם).
+
+אינקרמנטלי: לכל (kind, code) נשמר hash של הטקסט; רק קודים שהטקסט שלהם
+השתנה / נוסף / נמחק מאונדקסים מחדש. אין שינוי ⇒ לא נבנית גרסה חדשה של
+feature_store.duckdb (snapshot.py). הכתיבה – טבלאות Arrow ו-INSERT … SELECT
+אחד לכל טבלה (לא שורה-שורה).
+
+שימוש:
+    python name_index.py [--full]
+    python name_index.py lookup "טקסט" [--kind customer|part|family|…] [--limit 10]
+"""
+import re, sys, hashlib, pathlib, argparse, unicodedata, duckdb, pyarrow as pa
+import snapshot
+sys.path.append(str(pathlib.Path(__file__).resolve().parent / "ETL"))   # etl_metrics
+import etl_metrics
+from etl_metrics import span
+from odata_metadata import read_cache
+
+RAW_DB = pathlib.Path(r"C:\RIT\AIBI\raw_best.duckdb")
+DWH_DB = pathlib.Path(r"C:\RIT\AIBI\feature_store.duckdb")
+HEB_DB = pathlib.Path(r"C:\RIT\AIBI\feature_store_heb.duckdb")
+METADATA_CACHE = RAW_DB.with_name("odata_metadata.json")
+DOCS   = "_name_docs"
+GRAMS  = "_name_grams"
+
+# kind → (טבלת RAW, עמודת קוד, עמודות טקסט)
+SOURCES = {
+    "customer": ("stg_customers", "CUSTNAME",   ["CUSTDES"]),
+    "part":     ("stg_parts",     "PARTNAME",   ["PARTDES"]),
+    "family":   ("stg_parts",     "FAMILYNAME", ["FAMILYDES"]),
+}
+# מסכים עבריים: קידומת השדה (<X>NAME / <X>DES) → kind; אחר – הקידומת באותיות קטנות
+HEB_KINDS = {"CUST": "customer", "PART": "part", "FAMILY": "family"}
+MIN_SCORE = 0.1
+
+_FINALS = str.maketrans("ךםןףץ", "כמנפצ")
+_DROP   = re.compile("[\u0591-\u05bd\u05bf\u05c1\u05c2\u05c4\u05c5\u05c7\u05f3\u05f4'\"`\u00b4\u2019]")
+_SPACE  = re.compile(r"[\W_]+")
+
+
+def normalize(text: str | None) -> str:
+    if not text:
+        return ""
+    s = unicodedata.normalize("NFKC", text).replace("\u05be", " ")
+    s = _DROP.sub("", s).translate(_FINALS).lower()
+    return " ".join(_SPACE.sub(" ", s).split())
+
+
+def grams(norm: str) -> set[str]:
+    """trigrams של כל מילה (עם ריפוד רווח) + המילה עצמה (w:…)"""
+    out = set()
+    for tok in norm.split():
+        out.add(f"w:{tok}")
+        padded = f" {tok} "
+        out.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return out
+
+
+def _q(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def heb_sources(con) -> list[tuple[str, str, str, list[str]]]:
+    """
+    [(kind, טבלה, עמודת קוד, [עמודת תיאור])] במסכים העבריים (מחובר כ-heb):
+    זוגות <X>NAME / <X>DES מה-$metadata שמופיעים (בשמם העברי) באותה טבלה.
+    """
+    model = read_cache(METADATA_CACHE)
+    if model is None:
+        print(f"ℹ️  {METADATA_CACHE.name} not found – Hebrew screen names skipped")
+        return []
+    columns: dict[str, set[str]] = {}
+    for tbl, col in con.execute("""
+            SELECT table_name, column_name FROM information_schema.columns
+            WHERE table_catalog = 'heb' AND table_schema = 'main'""").fetchall():
+        columns.setdefault(tbl, set()).add(col)
+    out = {}
+    for heb in model.hebrew.values():
+        for field, desc in heb.items():
+            code = heb.get(field[:-3] + "NAME") if field.endswith("DES") else None
+            if not code:
+                continue
+            prefix = field[:-3]
+            kind = HEB_KINDS.get(prefix, prefix.lower())
+            for tbl, cols in columns.items():
+                if code in cols and desc in cols:
+                    out[(kind, tbl, code)] = [desc]
+    return [(kind, tbl, code, descs) for (kind, tbl, code), descs in sorted(out.items())]
+
+
+def source_docs(con) -> dict[tuple[str, str], str]:
+    """{(kind, code): טקסט} מה-RAW (מחובר כ-raw) ומהמסכים העבריים (heb, אם מחובר)"""
+    catalogs = {r[0] for r in con.execute("SELECT database_name FROM duckdb_databases()").fetchall()}
+    tables = {r[0] for r in con.execute(
+        "SELECT table_name FROM information_schema.tables WHERE table_catalog = 'raw'").fetchall()}
+    sources = []
+    for kind, (tbl, key, cols) in SOURCES.items():
+        if tbl not in tables:
+            print(f"ℹ️  {tbl} not in RAW – {kind} names skipped")
+            continue
+        sources.append((kind, f"raw.main.{tbl}", key, cols))
+    if "heb" in catalogs:
+        sources += [(kind, f"heb.main.{_q(tbl)}", key, cols) for kind, tbl, key, cols in heb_sources(con)]
+
+    docs = {}
+    for kind, rel, key, cols in sources:
+        text = " || ' ' || ".join(f"coalesce(CAST({_q(c)} AS VARCHAR), '')" for c in cols)
+        for code, txt in con.execute(f"""
+                SELECT CAST({_q(key)} AS VARCHAR), any_value({text})
+                FROM {rel} WHERE {_q(key)} IS NOT NULL GROUP BY 1""").fetchall():
+            if txt.strip():
+                docs.setdefault((kind, code), txt.strip())     # RAW קודם למסכים
+    return docs
+
+
+def _attach(con, raw: pathlib.Path) -> None:
+    con.execute(f"ATTACH '{raw}' AS raw (READ_ONLY)")
+    heb = snapshot.current(HEB_DB)
+    if heb.exists():
+        con.execute(f"ATTACH '{heb}' AS heb (READ_ONLY)")
+
+
+def _detach(con) -> None:
+    for db in ("raw", "heb"):
+        con.execute(f"DETACH DATABASE IF EXISTS {db}")
+
+
+def _hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _create(con) -> None:
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {DOCS} (
+            kind      VARCHAR,
+            code      VARCHAR,
+            text      VARCHAR,
+            norm      VARCHAR,
+            row_hash  VARCHAR,
+            ngrams    INTEGER
+        )""")
+    con.execute(f"CREATE TABLE IF NOT EXISTS {GRAMS} (gram VARCHAR, kind VARCHAR, code VARCHAR)")
+
+
+def diff(con, full: bool = False) -> tuple[dict, list]:
+    """(לאינדקס מחדש {(kind, code): text}, למחיקה [(kind, code)])"""
+    docs = source_docs(con)
+    have = {}
+    if not full and con.execute(
+            f"SELECT 1 FROM information_schema.tables WHERE table_catalog = current_database() "
+            f"AND table_name = '{DOCS}'").fetchone():
+        have = {(k, c): h for k, c, h in con.execute(f"SELECT kind, code, row_hash FROM {DOCS}").fetchall()}
+    todo = {key: txt for key, txt in docs.items() if have.get(key) != _hash(txt)}
+    gone = [key for key in have if key not in docs]
+    return todo, gone
+
+
+def _tables(todo: dict, gone: list) -> tuple[pa.Table, pa.Table, pa.Table]:
+    """(docs, grams, stale) כטבלאות Arrow – INSERT … SELECT אחד לכל אחת"""
+    docs = {k: [] for k in ("kind", "code", "text", "norm", "row_hash", "ngrams")}
+    g_gram, g_kind, g_code = [], [], []
+    for (kind, code), txt in todo.items():
+        norm = normalize(txt)
+        g = grams(norm)
+        for k, v in zip(docs, (kind, code, txt, norm, _hash(txt), len(g))):
+            docs[k].append(v)
+        g_gram += g
+        g_kind += [kind] * len(g)
+        g_code += [code] * len(g)
+    stale = [*todo, *gone]
+    return (pa.table(docs),
+            pa.table({"gram": g_gram, "kind": g_kind, "code": g_code}),
+            pa.table({"kind": [k for k, _ in stale], "code": [c for _, c in stale]},
+                     schema=pa.schema([("kind", pa.string()), ("code", pa.string())])))
+
+
+def apply(con, todo: dict, gone: list, full: bool = False) -> None:
+    _create(con)
+    docs, rows, stale = _tables(todo, gone)
+    con.register("_name_docs_new", docs)
+    con.register("_name_grams_new", rows)
+    con.register("_name_stale", stale)
+    con.begin()
+    try:
+        if full:
+            con.execute(f"DELETE FROM {DOCS}")
+            con.execute(f"DELETE FROM {GRAMS}")
+        elif stale.num_rows:
+            for tbl in (DOCS, GRAMS):
+                con.execute(f"DELETE FROM {tbl} WHERE (kind, code) IN (SELECT kind, code FROM _name_stale)")
+        if docs.num_rows:
+            con.execute(f"INSERT INTO {DOCS} BY NAME SELECT * FROM _name_docs_new")
+            con.execute(f"INSERT INTO {GRAMS} BY NAME SELECT * FROM _name_grams_new")
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
+    finally:
+        for name in ("_name_docs_new", "_name_grams_new", "_name_stale"):
+            con.unregister(name)
+
+
+def build_index(full: bool = False, dwh: pathlib.Path | None = None, raw: pathlib.Path = RAW_DB) -> None:
+    if dwh is None:
+        # בדיקה על הגרסה שפורסמה (read-only) – אין שינוי ⇒ אין snapshot חדש
+        published = snapshot.current(DWH_DB)
+        if published.exists() and not full:
+            con = duckdb.connect(str(published), read_only=True)
+            _attach(con, raw)
+            todo, gone = diff(con)
+            con.close()
+            if not todo and not gone:
+                print("✓ name index unchanged")
+                return
+        with snapshot.staging(DWH_DB) as dwh:
+            return build_index(full, dwh, raw)
+
+    con = duckdb.connect(str(dwh))
+    _attach(con, raw)
+    with span("name_index") as sp:
+        todo, gone = diff(con, full)
+        apply(con, todo, gone, full)
+        sp.add(rows=len(todo))
+    n = con.execute(f"SELECT count(*) FROM {DOCS}").fetchone()[0]
+    _detach(con)
+    con.close()
+    print(f"✓ name index: {len(todo):,} names (re)indexed, {len(gone):,} removed, {n:,} total")
+
+
+def lookup(con, text: str, kind: str | None = None, limit: int = 10,
+           min_score: float = MIN_SCORE) -> list[tuple[str, str, str, float]]:
+    """(kind, code, text, score) לפי דמיון יורד – con: חיבור ל-feature_store.duckdb"""
+    q = sorted(grams(normalize(text)))
+    if not q:
+        return []
+    return con.execute(f"""
+        SELECT d.kind, d.code, d.text, h.hits / (? + d.ngrams - h.hits) AS score
+        FROM (SELECT kind, code, count(*) AS hits
+              FROM {GRAMS}
+              WHERE gram IN (SELECT unnest(?::VARCHAR[])) AND (? IS NULL OR kind = ?)
+              GROUP BY kind, code) h
+        JOIN {DOCS} d USING (kind, code)
+        WHERE h.hits / (? + d.ngrams - h.hits) >= ?
+        ORDER BY score DESC, d.code
+        LIMIT ?""", [len(q), q, kind, kind, len(q), min_score, limit]).fetchall()
+
+
+def main(argv: list[str] | None = None):
+    ap = argparse.ArgumentParser(description="Hebrew name index over customers / parts")
+    sub = ap.add_subparsers(dest="cmd")
+    lk = sub.add_parser("lookup", help="ranked candidate codes for a (partial) name")
+    lk.add_argument("text")
+    lk.add_argument("--kind", help="customer / part / family / … (default: all)")
+    lk.add_argument("--limit", type=int, default=10)
+    ap.add_argument("--full", action="store_true", help="re-index every name")
+    etl_metrics.add_cli(ap)
+    args = ap.parse_args(argv)
+
+    if args.cmd == "lookup":
+        con = duckdb.connect(str(snapshot.current(DWH_DB)), read_only=True)
+        for kind, code, text, score in lookup(con, args.text, args.kind, args.limit):
+            print(f"{score:5.2f}  {kind:<8} {code:<16} {text}")
+        con.close()
+        return
+    # מדדים ל-RAW (כמו odata_to_raw): feature_store.duckdb הוא hard link לגרסה
+    # שפורסמה – כתיבה אליו עוקפת את snapshot.staging
+    with etl_metrics.run("name_index", RAW_DB, profile=args.profile):
+        build_index(full=args.full)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,21 @@
 // File: openaiController.js
 import fs from 'fs';
 import path from 'path';
-import duckdb from 'duckdb';
 import OpenAI from 'openai';
+import { openSnapshot } from './lib/snapshot.js';
 
 const DUCKDB_PATH = path.resolve('feature_store_heb.duckdb');
-const db = new duckdb.Database(DUCKDB_PATH);
-const conn = db.connect();
-const query = (sql, params = []) =>
-  new Promise((resolve, reject) => {
-    const cb = (err, rows) => err ? reject(err) : resolve(rows);
-    params.length ? conn.all(sql, params, cb) : conn.all(sql, cb);
-  });
+const duck = openSnapshot(DUCKDB_PATH);          // READ_ONLY, הגרסה שפורסמה אחרונה
+const query = (sql, params = []) => duck.query(sql, params);
 
 let schemaTxt = '';
 let lastMtime = 0;
 const openai = new OpenAI({ apiKey: process.env.OPENAI_API_KEY });
 
 export async function refreshSchema() {
-  const mtime = fs.statSync(DUCKDB_PATH).mtimeMs;
-  if (mtime === lastMtime) return;
+  const switched = duck.refresh();
+  const mtime = fs.statSync(duck.file).mtimeMs;
+  if (!switched && mtime === lastMtime) return;
   lastMtime = mtime;
   const rows = await query(
     `SELECT table_name, string_agg(column_name||' '||data_type, ', ' ORDER BY ordinal_position) cols
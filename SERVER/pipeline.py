@@ -1,14 +1,180 @@
 # pipeline.py
 # ----------------------------------------
 # 1) מושך נתונים ל-RAW   2) בונה feature_store + קבצי dbt
+#
+# הכל בתהליך אחד (pandas / duckdb נטענים פעם אחת). כל שלב מוצהר עם התלויות שלו:
+#
+#   static_dims ─┐
+#   sales ───────┴─► modeling ─► rollups ─┬─► star_hints
+#                                          └─► name_index
+#   heb_screens (feature_store_heb) ──────────────┘
+#
+#   • שלבים בלתי-תלויים רצים במקביל (static_dims ו-sales כותבים לטבלאות
+#     שונות באותו RAW – אותו מופע DuckDB בתוך התהליך).
+#   • שלב עם inputs (טביעת אצבע) שלא השתנתה מאז ההצלחה האחרונה – מדולג.
+#     שלבי שליפה מ-Priority (inputs=None) רצים תמיד.
+#   • המצב נשמר ב-pipeline_state.json אחרי כל שלב; --resume ממשיך מהשלב
+#     שנכשל (שלבים שהצליחו בריצה הקודמת לא רצים שוב).
+#   • בסוף – דו"ח זמנים.
+#   • --from-landing – שלבי השליפה נבנים מאזור הנחיתה, בלי Priority
+#     (אחרי שינוי מיפוי / מודל).
+#
+# python pipeline.py [--resume] [--force] [--full] [--from-landing]
 
-import subprocess, sys, pathlib
+import os, sys, json, time, pathlib, argparse, datetime as dt, traceback
+from dataclasses import dataclass, field
+from typing import Callable
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 
 ROOT = pathlib.Path(__file__).parent
+sys.path.insert(0, str(ROOT / "ETL"))            # מודולי ה-ETL מייבאים זה את זה בשם פשוט
 
-def run(cmd: list[str]):
-    subprocess.check_call([sys.executable, *cmd], cwd=ROOT)
+import odata_to_raw, backfill_heb_screens, gpt_modeler, rollups, name_index, etl_metrics
 
-run(["etl/odata_to_raw.py"])
-run(["gpt_modeler.py"])
-print("✅  full pipeline finished")
+STATE_FILE = pathlib.Path(r"C:\RIT\AIBI\pipeline_state.json")
+
+
+@dataclass
+class Stage:
+    name:    str
+    run:     Callable[[], None]
+    after:   tuple[str, ...] = ()
+    inputs:  Callable[[], str] | None = None      # None ⇒ מקור חיצוני, תמיד רץ
+    outputs: tuple[pathlib.Path, ...] = field(default_factory=tuple)
+
+
+def stages(full: bool, from_landing: bool = False) -> list[Stage]:
+    ym = dt.date.today().strftime("%Y-%m")
+    landing = "replay" if from_landing else "save"
+    heb_args = [ym, ym, "--from-landing"] if from_landing else [ym, ym]
+    return [
+        Stage("static_dims", lambda: odata_to_raw.load_static(landing=landing),
+              outputs=(odata_to_raw.RAW_DB,)),
+        Stage("sales",       lambda: odata_to_raw.load_sales(landing=landing),
+              outputs=(odata_to_raw.RAW_DB,)),
+        Stage("heb_screens", lambda: backfill_heb_screens.main(heb_args),
+              outputs=(backfill_heb_screens.FEATURE_DB,)),
+        Stage("modeling",    lambda: gpt_modeler.build_models(full=full),
+              after=("static_dims", "sales"), inputs=None if full else gpt_modeler.raw_version,
+              outputs=(gpt_modeler.DWH_DB,)),
+        Stage("rollups",     lambda: rollups.build_rollups(full=full),
+              after=("modeling",), inputs=None if full else gpt_modeler.raw_version,
+              outputs=(gpt_modeler.DWH_DB,)),
+        # inputs=None – קורא גם מ-feature_store_heb; build_index עצמו מדלג כשאין שינוי
+        Stage("name_index",  lambda: name_index.build_index(full=full),
+              after=("rollups", "heb_screens"),
+              outputs=(gpt_modeler.DWH_DB,)),
+        Stage("star_hints",  gpt_modeler.star_hints,
+              after=("rollups",), inputs=gpt_modeler.dwh_version,
+              outputs=(ROOT / "star_hint.txt",)),
+    ]
+
+
+def load_state() -> dict:
+    try:
+        return json.loads(STATE_FILE.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state: dict) -> None:
+    tmp = STATE_FILE.with_suffix(".tmp")
+    tmp.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
+    tmp.replace(STATE_FILE)
+
+
+def run_stage(stage: Stage, prev: dict, force: bool) -> dict:
+    """מריץ שלב אחד (ב-thread); מחזיר את רשומת המצב שלו."""
+    t0 = time.perf_counter()
+    fp = stage.inputs() if stage.inputs else None
+    if (fp is not None and not force and prev.get("status") in ("ok", "unchanged", "resumed")
+            and prev.get("inputs") == fp and all(p.exists() for p in stage.outputs)):
+        return {"status": "unchanged", "inputs": fp, "seconds": time.perf_counter() - t0}
+    with etl_metrics.span(f"stage:{stage.name}"):
+        stage.run()
+    return {"status": "ok", "inputs": fp, "seconds": time.perf_counter() - t0,
+            "finished_at": dt.datetime.now().isoformat(timespec="seconds")}
+
+
+def run_pipeline(plan: list[Stage], *, resume: bool = False, force: bool = False) -> bool:
+    prev  = load_state().get("stages", {})
+    state = {"started_at": dt.datetime.now().isoformat(timespec="seconds"), "stages": {}}
+    done: set[str] = set()
+    if resume:
+        for s in plan:
+            if prev.get(s.name, {}).get("status") in ("ok", "unchanged", "resumed"):
+                state["stages"][s.name] = {**prev[s.name], "status": "resumed", "seconds": 0.0}
+                done.add(s.name)
+
+    failed: set[str] = set()
+    pending = {s.name: s for s in plan if s.name not in done}
+    running = {}
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(plan)) as pool:
+        while pending or running:
+            for name, s in list(pending.items()):
+                if any(d in failed for d in s.after):
+                    state["stages"][name] = {"status": "blocked", "seconds": 0.0}
+                    failed.add(name)
+                    del pending[name]
+                elif all(d in done for d in s.after):
+                    print(f"▶ {name}")
+                    running[pool.submit(run_stage, s, prev.get(name, {}), force)] = name
+                    del pending[name]
+            if not running:
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                name = running.pop(fut)
+                try:
+                    state["stages"][name] = fut.result()
+                    done.add(name)
+                except Exception as exc:
+                    traceback.print_exc()
+                    state["stages"][name] = {"status": "failed", "error": repr(exc),
+                                             "seconds": None}
+                    failed.add(name)
+                save_state(state)
+
+    state["seconds"] = time.perf_counter() - t0
+    save_state(state)
+    report(plan, state)
+    return not failed
+
+
+def report(plan: list[Stage], state: dict) -> None:
+    print("\n── timing ───────────────────────────────")
+    busy = 0.0
+    for s in plan:
+        rec = state["stages"].get(s.name, {})
+        secs = rec.get("seconds")
+        busy += secs or 0.0
+        shown = f"{secs:8.1f}s" if secs is not None else "       – "
+        print(f"  {s.name:<14} {rec.get('status', '?'):<10} {shown}")
+    print(f"  {'wall':<14} {'':<10} {state['seconds']:8.1f}s   (stages total {busy:.1f}s)")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Priority → RAW → feature_store (+ heb screens)")
+    ap.add_argument("--resume", action="store_true",
+                    help="skip stages that succeeded in the previous run")
+    ap.add_argument("--force", action="store_true", help="ignore input fingerprints")
+    ap.add_argument("--full", action="store_true", help="rebuild every model table")
+    ap.add_argument("--from-landing", action="store_true",
+                    help="rebuild RAW / heb screens from the landing zone (no Priority calls)")
+    etl_metrics.add_cli(ap)
+    args = ap.parse_args()
+
+    os.chdir(ROOT)                                  # star_hint.txt וכו' – יחסית ל-SERVER
+    # ריצה אחת ל-etl_runs ב-RAW; השלבים (כולל backfill_heb_screens) – spans בתוכה
+    with etl_metrics.run("pipeline", odata_to_raw.RAW_DB, profile=args.profile):
+        ok = run_pipeline(stages(args.full, args.from_landing), resume=args.resume, force=args.force)
+    print("ℹ️ ", odata_to_raw.PRIO_CLIENT.summary())
+    if not ok:
+        print("❌  pipeline failed – fix and rerun with --resume")
+        sys.exit(1)
+    print("✅  full pipeline finished")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+"""
+profile_store.py – פרופיילינג עמודות + צמצום טיפוסים ב-feature store
+
+לכל טבלה: סריקה אחת שמודדת לכל עמודה cardinality, nulls, והאם כל הערכים
+ניתנים לפענוח כמספר שלם / עשרוני / תאריך. לפי זה הטבלה נכתבת מחדש *פעם אחת*:
+    • טקסט מספרי (round-trip מדויק, בלי אפסים מובילים כמו '05') → INT / DECIMAL
+    • טקסט תאריך                                                → DATE / TIMESTAMP
+    • טקסט בעל cardinality נמוכה (CTYPECODE, FAMILYNAME …)       → ENUM
+    • מספר שלם                                                   → הרוחב הקטן שמספיק
+הפרופיל נשמר בטבלה _column_profile. טבלה שלא נבנתה מחדש מאז הפרופיל האחרון
+(אותם טיפוסים ואותו מספר שורות) – לא נסרקת ולא נכתבת שוב.
+
+עמודות מפתח / קוד (…NAME, …NUM, …CODE, או שם עמודה שמופיע ביותר מטבלה אחת)
+לא הופכות למספר – אחרת אותו קוד מקבל טיפוסים שונים בטבלאות שונות
+(CUSTNAME SMALLINT ב-fact מול VARCHAR ב-dim) וה-JOIN נכשל בהמרה. ENUM מותר –
+השוואה ל-VARCHAR עוברת דרך טקסט.
+עמודה שהורחבה ע"י widen_to_fit (ערך שלא נכנס) מסומנת pinned ונשארת רחבה –
+בלי מחזור צמצום/הרחבה שכותב את כל הטבלה מחדש בכל ריצה.
+
+שימוש:
+    python profile_store.py [DB ...]      (ברירת מחדל: שני ה-feature stores)
+"""
+import re, sys, time, hashlib, pathlib, duckdb
+import snapshot
+
+FEATURE_DBS = [
+    pathlib.Path(r"C:\RIT\AIBI\feature_store.duckdb"),
+    pathlib.Path(r"C:\RIT\AIBI\feature_store_heb.duckdb"),
+]
+PROFILE_TABLE = "_column_profile"
+
+ENUM_MAX_VALUES = 1000     # יותר ערכים שונים מזה – נשאר VARCHAR
+ENUM_MIN_REPEAT = 10       # כל ערך מופיע בממוצע לפחות פי 10
+DECIMAL_MAX_SCALE = 6
+KEY_COLUMN = re.compile(r"(NAME|NUM|CODE)$", re.IGNORECASE)   # קודים – לא למספר
+
+_INT_WIDTHS = [("TINYINT", 2**7), ("SMALLINT", 2**15), ("INTEGER", 2**31), ("BIGINT", 2**63)]
+_INT_TYPES  = {"TINYINT", "SMALLINT", "INTEGER", "BIGINT", "HUGEINT",
+               "UTINYINT", "USMALLINT", "UINTEGER", "UBIGINT"}
+
+
+def q(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _int_width(lo, hi) -> str:
+    for name, lim in _INT_WIDTHS:
+        if lo is not None and hi is not None and -lim <= lo and hi < lim:
+            return name
+    return "BIGINT"
+
+
+def profile_table(con, tbl: str) -> list[dict]:
+    """סריקה אחת של הטבלה; מחזיר dict לכל עמודה."""
+    cols = con.execute(f"PRAGMA table_info({q(tbl)})").fetchall()
+    exprs, layout = ["count(*)"], []
+    for _, name, typ, *_ in cols:
+        c, t = q(name), typ.upper()
+        base = [f"count({c})", f"approx_count_distinct({c})"]
+        if t == "VARCHAR":
+            base += [
+                f"count(*) FILTER (WHERE CAST(TRY_CAST({c} AS BIGINT) AS VARCHAR) = {c})",
+                f"min(TRY_CAST({c} AS BIGINT))", f"max(TRY_CAST({c} AS BIGINT))",
+                f"count(*) FILTER (WHERE regexp_matches({c}, '^-?(0|[1-9][0-9]*)(\\.[0-9]+)?$'))",
+                f"max(length(split_part({c}, '.', 2)))",
+                f"max(length(split_part(ltrim({c}, '-'), '.', 1)))",
+                f"count(*) FILTER (WHERE regexp_matches({c}, '^\\d{{4}}-\\d{{2}}-\\d{{2}}$') AND TRY_CAST({c} AS DATE) IS NOT NULL)",
+                f"count(*) FILTER (WHERE regexp_matches({c}, '^\\d{{4}}-\\d{{2}}-\\d{{2}}[ T]') AND TRY_CAST({c} AS TIMESTAMP) IS NOT NULL)",
+            ]
+        elif t in _INT_TYPES:
+            base += [f"min({c})", f"max({c})"]
+        layout.append((name, typ, len(exprs), len(base)))
+        exprs += base
+
+    row = con.execute(f"SELECT {', '.join(exprs)} FROM {q(tbl)}").fetchone()
+    total = row[0]
+    out = []
+    for name, typ, at, n in layout:
+        v = row[at:at + n]
+        p = {"column": name, "type": typ, "rows": total, "non_null": v[0], "distinct": v[1]}
+        if typ.upper() == "VARCHAR":
+            p.update(int_exact=v[2], int_min=v[3], int_max=v[4], dec_ok=v[5],
+                     dec_scale=v[6] or 0, dec_int_digits=v[7] or 0, date_ok=v[8], ts_ok=v[9])
+        elif typ.upper() in _INT_TYPES:
+            p.update(int_min=v[2], int_max=v[3])
+        out.append(p)
+    return out
+
+
+def _is_numeric(typ: str) -> bool:
+    return typ.upper() in _INT_TYPES or typ.upper().startswith("DECIMAL")
+
+
+def narrowed_type(p: dict, key: bool = False) -> str:
+    """הטיפוס המצומצם לעמודה (או הטיפוס הנוכחי אם אין מה לצמצם).
+    key – עמודת מפתח / קוד: טקסט לא הופך למספר."""
+    typ, nn = p["type"].upper(), p["non_null"]
+    if typ in _INT_TYPES and not typ.startswith("U") and typ != "HUGEINT":
+        return _int_width(p["int_min"], p["int_max"]) if nn else typ
+    if typ != "VARCHAR" or nn == 0:
+        return p["type"]
+    if not key and p["int_exact"] == nn:
+        return _int_width(p["int_min"], p["int_max"])
+    if not key and p["dec_ok"] == nn and p["dec_scale"] <= DECIMAL_MAX_SCALE \
+            and p["dec_int_digits"] + p["dec_scale"] <= 18:
+        return f"DECIMAL(18,{p['dec_scale']})"
+    if p["date_ok"] == nn:
+        return "DATE"
+    if p["ts_ok"] == nn:
+        return "TIMESTAMP"
+    if p["distinct"] <= ENUM_MAX_VALUES and nn >= ENUM_MIN_REPEAT * max(p["distinct"], 1):
+        return "ENUM"
+    return p["type"]
+
+
+def _enum_type(con, tbl: str, col: str) -> str:
+    """יוצר (או ממחזר) ENUM עם ערכי העמודה; השם כולל hash של הערכים."""
+    values = [r[0] for r in con.execute(
+        f"SELECT DISTINCT {q(col)} FROM {q(tbl)} WHERE {q(col)} IS NOT NULL ORDER BY 1").fetchall()]
+    digest = hashlib.sha1("\x1f".join(values).encode("utf-8")).hexdigest()[:10]
+    name = f"enum__{tbl}__{col}__{digest}"
+    exists = con.execute("SELECT 1 FROM duckdb_types() WHERE type_name = ?", [name]).fetchone()
+    if not exists:
+        lits = ", ".join("'" + v.replace("'", "''") + "'" for v in values)
+        con.execute(f"CREATE TYPE {q(name)} AS ENUM ({lits})")
+    return q(name)
+
+
+def narrow_table(con, tbl: str, shared: set[str] = frozenset()) -> int:
+    """
+    מפרופל וכותב מחדש אם צריך; מחזיר מספר עמודות שצומצמו.
+    shared – שמות עמודות שמופיעים ביותר מטבלה אחת (מפתחות JOIN).
+    """
+    before = {col: (orig, narrowed, bool(pin)) for col, orig, narrowed, pin in con.execute(f"""
+        SELECT column_name, original_type, narrowed_type, pinned FROM {PROFILE_TABLE}
+        WHERE table_name = ?""", [tbl]).fetchall()}
+    profile = profile_table(con, tbl)
+    plan = []
+    for p in profile:
+        orig, narrowed, p["pinned"] = before.get(p["column"], (None, None, False))
+        # הטיפוס לפני הצמצום: מהפרופיל הקודם, אלא אם הטבלה נבנתה מחדש מאז
+        p["original"] = orig if orig and narrowed == p["type"] else p["type"]
+        key = p["column"] in shared or bool(KEY_COLUMN.search(p["column"]))
+        if p["pinned"]:                           # הורחבה ע"י widen_to_fit – נשארת רחבה
+            p["narrowed"] = p["type"]
+            continue
+        if key and p["original"] == "VARCHAR" and _is_numeric(p["type"]):
+            p["narrowed"] = "VARCHAR"             # צומצם לפני שהשם הופיע בטבלה נוספת – חוזר לטקסט
+        else:
+            p["narrowed"] = narrowed_type(p, key=key)
+        cur = p["type"].upper()
+        if p["narrowed"] == "ENUM" and cur.startswith("ENUM"):
+            p["narrowed"] = p["type"]
+        if p["narrowed"].upper() != cur:
+            plan.append(p)
+
+    if plan:
+        select = []
+        for p in profile:
+            c = q(p["column"])
+            if p in plan:
+                target = _enum_type(con, tbl, p["column"]) if p["narrowed"] == "ENUM" else p["narrowed"]
+                select.append(f"CAST({c} AS {target}) AS {c}")
+            else:
+                select.append(c)
+        tmp = q(f"{tbl}__narrow")
+        con.begin()
+        try:
+            con.execute(f"CREATE OR REPLACE TABLE {tmp} AS SELECT {', '.join(select)} FROM {q(tbl)}")
+            con.execute(f"DROP TABLE {q(tbl)}")
+            con.execute(f"ALTER TABLE {tmp} RENAME TO {q(tbl)}")
+            con.commit()
+        except Exception:
+            con.rollback()
+            raise
+        actual = {c[1]: c[2] for c in con.execute(f"PRAGMA table_info({q(tbl)})").fetchall()}
+        for p in profile:
+            p["narrowed"] = actual[p["column"]]      # שם ה-ENUM בפועל
+
+    con.execute(f"DELETE FROM {PROFILE_TABLE} WHERE table_name = ?", [tbl])
+    con.executemany(f"INSERT INTO {PROFILE_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?, now()::TIMESTAMP, ?)", [
+        [tbl, p["column"], p["original"], p["narrowed"],
+         p["rows"], p["distinct"], p["rows"] - p["non_null"], p["pinned"]]
+        for p in profile])
+    return len(plan)
+
+
+def widen_to_fit(con, tbl: str, source: str) -> None:
+    """
+    לפני INSERT לטבלה מצומצמת: כל עמודה שערך ב-`source` לא נכנס בטיפוס שלה
+    (ערך ENUM חדש, מספר גדול יותר …) חוזרת לטיפוס של `source`, ומסומנת
+    pinned ב-_column_profile – הפרופיל הבא לא מצמצם אותה שוב.
+    (DDL – לפני ה-begin() של הקורא.)
+    """
+    target = {c[1]: c[2] for c in con.execute(f"PRAGMA table_info({q(tbl)})").fetchall()}
+    src    = {c[1]: c[2] for c in con.execute(f"PRAGMA table_info({q(source)})").fetchall()}
+    cols = [c for c in src if c in target and src[c] != target[c]]
+    if not cols:
+        return
+    def typ(t):                                   # שמות ENUM שלנו דורשים ציטוט
+        return q(t) if t.startswith("enum__") else t
+    checks = ", ".join(f"count({q(c)}) - count(TRY_CAST({q(c)} AS {typ(target[c])}))" for c in cols)
+    misfit = con.execute(f"SELECT {checks} FROM {q(source)}").fetchone()
+    widened = [c for c, bad in zip(cols, misfit) if bad]
+    for c in widened:
+        con.execute(f"ALTER TABLE {q(tbl)} ALTER {q(c)} TYPE {src[c]}")
+    if widened and con.execute(
+            "SELECT 1 FROM information_schema.tables WHERE table_catalog = current_database() "
+            "AND table_name = ?", [PROFILE_TABLE]).fetchone():
+        con.executemany(f"""
+            UPDATE {PROFILE_TABLE} SET narrowed_type = ?, pinned = true
+            WHERE table_name = ? AND column_name = ?""", [[src[c], tbl, c] for c in widened])
+
+
+def _ensure_profile_table(con) -> None:
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {PROFILE_TABLE} (
+            table_name     VARCHAR,
+            column_name    VARCHAR,
+            original_type  VARCHAR,
+            narrowed_type  VARCHAR,
+            row_count      BIGINT,
+            distinct_count BIGINT,       -- approx_count_distinct
+            null_count     BIGINT,
+            profiled_at    TIMESTAMP,
+            pinned         BOOLEAN       -- הורחבה ע"י widen_to_fit – לא לצמצם שוב
+        )""")
+
+
+def narrow_database(db: pathlib.Path) -> None:
+    """מפרופל ומצמצם כל טבלה רגילה ב-`db` (VIEW-ים וטבלאות _* / etl_* – לא)."""
+    con = duckdb.connect(str(db))
+    _ensure_profile_table(con)
+    tables = [r[0] for r in con.execute("""
+        SELECT table_name FROM information_schema.tables
+        WHERE table_schema = 'main' AND table_type = 'BASE TABLE'
+    """).fetchall() if not r[0].startswith(("_", "etl_"))]
+    # שם עמודה ביותר מטבלה/VIEW אחת ⇒ מפתח JOIN אפשרי
+    shared = {r[0] for r in con.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_catalog = current_database() AND table_schema = 'main'
+          AND table_name NOT LIKE '\\_%' ESCAPE '\\' AND table_name NOT LIKE 'etl\\_%' ESCAPE '\\'
+        GROUP BY column_name HAVING count(DISTINCT table_name) > 1
+    """).fetchall()}
+
+    profiled: dict[str, tuple] = {}
+    for tbl, col, typ, rows in con.execute(
+            f"SELECT table_name, column_name, narrowed_type, row_count FROM {PROFILE_TABLE}").fetchall():
+        cols, _ = profiled.get(tbl, ({}, rows))
+        cols[col] = typ
+        profiled[tbl] = (cols, rows)
+
+    size0 = db.stat().st_size
+    for tbl in tables:
+        if tbl in profiled:
+            cols = {c[1]: c[2] for c in con.execute(f"PRAGMA table_info({q(tbl)})").fetchall()}
+            rows = con.execute(f"SELECT count(*) FROM {q(tbl)}").fetchone()[0]
+            if (cols, rows) == profiled[tbl]:
+                continue                          # לא השתנתה מאז הפרופיל האחרון
+        t0 = time.perf_counter()
+        n = narrow_table(con, tbl, shared)
+        if n:
+            print(f"✓ {tbl:<30} {n:3d} columns narrowed  {time.perf_counter() - t0:5.1f}s")
+    con.execute("CHECKPOINT")
+    con.close()
+    mb = 1024 * 1024
+    print(f"🏁 {db.name}: {size0 / mb:,.1f} MB → {db.stat().st_size / mb:,.1f} MB")
+
+
+def main(argv: list[str]) -> None:
+    dbs = [pathlib.Path(a) for a in argv] or FEATURE_DBS
+    for db in dbs:
+        if snapshot.current(db).exists():
+            with snapshot.staging(db) as stage:      # לא כותבים לגרסה שפורסמה
+                narrow_database(stage)
+        else:
+            print(f"ℹ️  {db} not found – skipped")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+"""
+rollups.py – טבלאות מכירות מצטברות (חודשיות) ב-feature_store.duckdb
+
+שאלות נפוצות (מכירות לפי חודש / לקוח / סוכן / משפחה / גרייד) לא צריכות
+לסכם מיליוני שורות מכירה בכל פעם. אחרי ה-modeling נבנות טבלאות agg_sales_month_*:
+    (sales_month, מפתח + תיאור)  →  qty, revenue, cost, margin, lines
+(כמות = TQUANT, הכנסה = QPRICE, עלות = COST, רווח = הכנסה - עלות).
+
+אינקרמנטלי – רק חודשים שהשתנו מחושבים מחדש:
+    • לכל חודש: count + sum(hash) של עמודות שורת המכירה שהטבלאות קוראות
+      (סריקה אחת, בלי joins וקיבוצים).
+    • לכל טבלת עזר (stg_parts / stg_partarc / stg_customers): אותה טביעה על
+      המפתח + העמודות שלה ב-LOOKUPS – שינוי משפחה / גרייד / תיאור ⇒ כל החודשים
+      של ה-rollups שתלויים בה.
+    • גרסת (rollup, חודש) = hash(SQL, טביעת החודש, טביעות העזר) – נשמרת
+      ב-_rollup_months; חודש שגרסתו לא השתנתה – לא נוגעים בו.
+    • חודש שנעלם מה-RAW – נמחק מה-rollups.
+החלפת החודשים נעשית בטרנזקציה אחת לכל rollup (DELETE + INSERT); הטבלאות
+מצומצמות ע"י profile_store, לכן widen_to_fit קודם (ALTER לא באותה טרנזקציה).
+
+ה-rollups מופיעים ב-star_hint.txt (catalog_hints) כדי שהשאלות יגיעו אליהם.
+
+שימוש:
+    python rollups.py [--full]
+"""
+import re, sys, hashlib, pathlib, argparse, duckdb
+from profile_store import q, widen_to_fit, narrow_database
+import snapshot
+sys.path.append(str(pathlib.Path(__file__).resolve().parent / "ETL"))   # etl_metrics
+import etl_metrics
+from etl_metrics import span
+
+RAW_DB = pathlib.Path(r"C:\RIT\AIBI\raw_best.duckdb")
+DWH_DB = pathlib.Path(r"C:\RIT\AIBI\feature_store.duckdb")
+STATE_TABLE = "_rollup_months"
+
+# ── הגדרות ───────────────────────────────────────────────────────────
+FACT     = "stg_salesinvoiceitems"
+DATE_COL = "IVDATE"
+MONTH    = f"CAST(date_trunc('month', TRY_CAST(s.{DATE_COL} AS DATE)) AS DATE)"
+
+MEASURES = {
+    "qty":     "sum(s.TQUANT)",
+    "revenue": "sum(s.QPRICE)",
+    "cost":    "sum(s.COST)",
+    "margin":  "sum(coalesce(s.QPRICE, 0) - coalesce(s.COST, 0))",
+    "lines":   "count(*)",
+}
+
+# alias → (טבלת RAW, מפתח ל-join משורת המכירה, עמודות)
+LOOKUPS = {
+    "c": ("stg_customers", "CUSTNAME", ["CUSTDES"]),
+    "p": ("stg_parts",     "PARTNAME", ["PARTDES", "FAMILYNAME", "FAMILYDES"]),
+    "g": ("stg_partarc",   "PARTNAME", ["GPARTNAME"]),
+}
+
+# rollup → (עמודות קיבוץ, תיאור ל-catalog)
+ROLLUPS: dict[str, tuple[list[str], str]] = {
+    "agg_sales_month_customer": (["s.CUSTNAME", "c.CUSTDES"],     "מכירות חודשיות לפי לקוח"),
+    "agg_sales_month_part":     (["s.PARTNAME", "p.PARTDES"],     "מכירות חודשיות לפי פריט"),
+    "agg_sales_month_family":   (["p.FAMILYNAME", "p.FAMILYDES"], "מכירות חודשיות לפי משפחת פריט"),
+    "agg_sales_month_agent":    (["s.AGENTNAME"],                 "מכירות חודשיות לפי סוכן"),
+    "agg_sales_month_grade":    (["g.GPARTNAME"],                 "מכירות חודשיות לפי גרייד (GPARTNAME)"),
+}
+
+_alias_re = re.compile(r"\b([a-z])\.")
+
+
+def _sha(*parts: str) -> str:
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+def lookups_of(rollup: str) -> list[str]:
+    """אילו טבלאות עזר ה-rollup צריך (לפי ה-alias בעמודות הקיבוץ)"""
+    return sorted({a for c in ROLLUPS[rollup][0] for a in _alias_re.findall(c)} & LOOKUPS.keys())
+
+
+def fact_columns() -> list[str]:
+    """עמודות שורת המכירה שה-rollups קוראים (לטביעת החודש)"""
+    used = " ".join([*MEASURES.values(), *(c for cols, _ in ROLLUPS.values() for c in cols)])
+    keys = [k for _, k, _ in LOOKUPS.values()]
+    return sorted({DATE_COL, *keys, *re.findall(r"\bs\.(\w+)", used)})
+
+
+def rollup_sql(rollup: str, where: str = "TRUE") -> str:
+    group = ROLLUPS[rollup][0]
+    joins = []
+    for a in lookups_of(rollup):
+        tbl, key, cols = LOOKUPS[a]
+        attrs = ", ".join(f"any_value({c}) AS {c}" for c in cols)
+        joins.append(f"LEFT JOIN (SELECT {key}, {attrs} FROM raw.main.{tbl} GROUP BY {key}) {a}"
+                     f" ON {a}.{key} = s.{key}")
+    select = [f"{MONTH} AS sales_month", *(f"{c} AS {c.split('.', 1)[1]}" for c in group),
+              *(f"{expr} AS {name}" for name, expr in MEASURES.items())]
+    return (f"SELECT {', '.join(select)}\n"
+            f"FROM raw.main.{FACT} s {' '.join(joins)}\n"
+            f"WHERE {MONTH} IS NOT NULL AND ({where})\n"
+            f"GROUP BY ALL ORDER BY sales_month")
+
+
+def month_versions(con) -> dict:
+    """{חודש: 'rows:hash'} על עמודות fact_columns()"""
+    cols = ", ".join(f"s.{c}" for c in fact_columns())
+    return {m: f"{n}:{h}" for m, n, h in con.execute(f"""
+        SELECT {MONTH} AS m, count(*), sum(hash({cols}))
+        FROM raw.main.{FACT} s
+        WHERE {MONTH} IS NOT NULL
+        GROUP BY 1""").fetchall()}
+
+
+def lookup_version(con, alias: str) -> str:
+    tbl, key, cols = LOOKUPS[alias]
+    n, h = con.execute(f"SELECT count(*), sum(hash({', '.join([key, *cols])})) FROM raw.main.{tbl}").fetchone()
+    return f"{n}:{h}"
+
+
+def raw_tables(con) -> dict[str, set[str]]:
+    out: dict[str, set[str]] = {}
+    for tbl, col in con.execute("""
+            SELECT table_name, column_name FROM information_schema.columns
+            WHERE table_catalog = 'raw' AND table_schema = 'main'""").fetchall():
+        out.setdefault(tbl, set()).add(col)
+    return out
+
+
+def build_rollups(full: bool = False, dwh: pathlib.Path | None = None,
+                  raw: pathlib.Path = RAW_DB) -> None:
+    if dwh is None:                           # שלב עצמאי – עותק של DWH_DB, מתפרסם בסוף
+        with snapshot.staging(DWH_DB) as dwh:
+            return build_rollups(full, dwh, raw)
+    con = duckdb.connect(str(dwh))
+    con.execute(f"ATTACH '{raw}' AS raw (READ_ONLY)")
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {STATE_TABLE} (
+            rollup    VARCHAR,
+            month     DATE,
+            version   VARCHAR,
+            rows      BIGINT,
+            built_at  TIMESTAMP
+        )""")
+
+    schema = raw_tables(con)
+    if FACT not in schema:
+        print(f"ℹ️  {FACT} not in RAW – rollups skipped")
+        con.close()
+        return
+    missing = [c for c in fact_columns() if c not in schema[FACT]]
+    if missing:
+        raise RuntimeError(f"{FACT} lacks {missing} – adjust MEASURES / LOOKUPS in rollups.py")
+
+    with span("rollup_fingerprint"):
+        months = month_versions(con)
+        lookups = {a: lookup_version(con, a) for a, (tbl, *_) in LOOKUPS.items() if tbl in schema}
+    existing = {r[0] for r in con.execute(
+        "SELECT table_name FROM information_schema.tables "
+        "WHERE table_catalog = current_database() AND table_schema = 'main'").fetchall()}
+
+    for rollup in ROLLUPS:
+        need = lookups_of(rollup)
+        if any(a not in lookups for a in need):
+            print(f"⚠️  {rollup}: {', '.join(LOOKUPS[a][0] for a in need if a not in lookups)}"
+                  f" not in RAW – skipped")
+            continue
+        base = _sha(rollup_sql(rollup), *(f"{a}={lookups[a]}" for a in need))
+        want = {m: _sha(base, v) for m, v in months.items()}
+        have = dict(con.execute(f"SELECT month, version FROM {STATE_TABLE} WHERE rollup = ?",
+                                [rollup]).fetchall())
+        if full or rollup not in existing:
+            have = {}
+        todo = sorted(m for m, v in want.items() if have.get(m) != v)
+        gone = sorted(m for m in have if m not in want)
+        if not todo and not gone:
+            print(f"✓ {rollup:<28} unchanged ({len(want)} months)")
+            continue
+        with span("rollup", entity=rollup) as sp:
+            n = refresh_months(con, rollup, todo, gone, want, full or rollup not in existing)
+            sp.add(rows=n)
+        print(f"✓ {rollup:<28} {len(todo):3d} months recomputed, {len(gone)} dropped ({n:,} rows)")
+
+    con.execute("DETACH raw")
+    con.close()
+    with span("narrow"):
+        narrow_database(dwh)
+
+
+def refresh_months(con, rollup: str, todo: list, gone: list, want: dict, rebuild: bool) -> int:
+    """מחליף את החודשים todo (ומוחק את gone) ב-rollup, בטרנזקציה אחת"""
+    lits = ", ".join(f"DATE '{m}'" for m in todo) or "NULL"
+    con.execute(f"CREATE OR REPLACE TEMP TABLE _rollup_stage AS {rollup_sql(rollup, f'{MONTH} IN ({lits})')}")
+    n = con.execute("SELECT count(*) FROM _rollup_stage").fetchone()[0]
+    if not rebuild:
+        widen_to_fit(con, rollup, "_rollup_stage")     # הטבלה אולי צומצמה ע"י profile_store
+    con.begin()
+    try:
+        if rebuild:
+            con.execute(f"CREATE OR REPLACE TABLE {q(rollup)} AS SELECT * FROM _rollup_stage")
+            con.execute(f"DELETE FROM {STATE_TABLE} WHERE rollup = ?", [rollup])
+        else:
+            stale = ", ".join(f"DATE '{m}'" for m in [*todo, *gone])
+            con.execute(f"DELETE FROM {q(rollup)} WHERE sales_month IN ({stale})")
+            con.execute(f"INSERT INTO {q(rollup)} BY NAME SELECT * FROM _rollup_stage")
+            con.execute(f"DELETE FROM {STATE_TABLE} WHERE rollup = ? AND month IN ({stale})", [rollup])
+        counts = dict(con.execute("SELECT sales_month, count(*) FROM _rollup_stage GROUP BY 1").fetchall())
+        con.executemany(f"INSERT INTO {STATE_TABLE} VALUES (?, ?, ?, ?, now()::TIMESTAMP)",
+                        [[rollup, m, want[m], counts.get(m, 0)] for m in todo])
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
+    con.execute("DROP TABLE _rollup_stage")
+    return n
+
+
+def catalog_hints(tables: set[str]) -> list[str]:
+    """שורות ל-star_hint.txt עבור ה-rollups שקיימים ב-DWH"""
+    hints = []
+    for rollup, (group, desc) in ROLLUPS.items():
+        if rollup not in tables:
+            continue
+        cols = ", ".join(["sales_month", *(c.split(".", 1)[1] for c in group), *MEASURES])
+        hints.append(f"{rollup}({cols}) – {desc}; "
+                     f"לשאלות ברמת חודש ומעלה העדף על פני dim_salesinvoiceitems")
+    return hints
+
+
+def main():
+    ap = argparse.ArgumentParser(description="monthly sales rollups in feature_store.duckdb")
+    ap.add_argument("--full", action="store_true", help="recompute every month")
+    etl_metrics.add_cli(ap)
+    args = ap.parse_args()
+
+    with snapshot.staging(DWH_DB) as dwh, etl_metrics.run("rollups", dwh, profile=args.profile):
+        build_rollups(full=args.full, dwh=dwh)
+
+
+if __name__ == "__main__":
+    main()
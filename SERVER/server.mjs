@@ -5,7 +5,6 @@ import path from 'node:path';
 import crypto from 'node:crypto';
 import express from 'express';
 import cors from 'cors';
-import duckdb from 'duckdb';
 import OpenAI from 'openai';
 import Anthropic from '@anthropic-ai/sdk';
 import { performance } from 'perf_hooks';
@@ -18,6 +17,7 @@ import {
 import https from 'https';
 import { WebSocketServer } from 'ws';
 import { calcCost } from './costUtils.js';
+import { openSnapshot } from './lib/snapshot.js';
 import multer from 'multer';
 import { fileURLToPath } from 'url';
 import { dirname } from 'path';
@@ -97,21 +97,18 @@ function logQuerySummary(summary) {
 }
 
 /*━━━━━━━━ DUCKDB CONNECTION ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━*/
-const db = new duckdb.Database(DUCKDB_PATH);
-const conn = db.connect();
-const query = (sql, params = []) =>
-  new Promise((resolve, reject) => {
-    const callback = (err, rows) => (err ? reject(err) : resolve(rows));
-    params.length ? conn.all(sql, params, callback) : conn.all(sql, callback);
-  });
+// הגרסה שפורסמה אחרונה (snapshot.py), READ_ONLY – מתחלפת ב-refreshSchema
+const duck = openSnapshot(DUCKDB_PATH);
+const query = (sql, params = []) => duck.query(sql, params);
 
  
 /*━━━━━━━━ ENHANCED SCHEMA CACHE ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━*/
 let schemaTxt = '', lastMtime = 0;
 
 async function refreshSchema() {
-  const mtime = fs.statSync(DUCKDB_PATH).mtimeMs;
-  if (mtime === lastMtime) {
+  const switched = duck.refresh();
+  const mtime = fs.statSync(duck.file).mtimeMs;
+  if (!switched && mtime === lastMtime) {
     // log('[SCHEMA] refreshSchema skipped (no change in DB file)'); // Removed noisy log
     return;
   }
@@ -1839,7 +1836,7 @@ app.get('/health', async (req, res) => {
         connected: true,
         tables: tablesCount,
         schema_loaded: schemaTxt.length > 0,
-        db_file: DUCKDB_PATH
+        db_file: duck.file
       },
       sessions: {
         active: sessions.size,
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+"""
+snapshot.py – פרסום אטומי של קובצי ה-DuckDB (feature_store / feature_store_heb)
+
+השרת (server.mjs, openaiController.js) מחזיק את הקובץ פתוח; כתיבה ישירה אליו
+מה-ETL = נעילות ועיכובים. במקום זה כל שלב בנייה כותב לעותק:
+
+    with snapshot.staging(FEATURE_DB) as db:     # עותק של הגרסה הפעילה
+        con = duckdb.connect(str(db)) ...
+
+ביציאה מה-with (בלי חריגה):
+    • בדיקה – כל טבלה נקראת (count); טבלה שהייתה בגרסה הקודמת לא נעלמה,
+      וטבלה שהיו בה שורות לא התרוקנה.  כשל ⇒ SnapshotError, העותק נמחק.
+    • CHECKPOINT (אין WAL בגרסה שמתפרסמת).
+    • פרסום:
+        <name>.snapshots/<name>.v000042.duckdb   – הגרסה (לא נכתבת יותר)
+        <name>.current                            – הגרסה הפעילה (os.replace – אטומי)
+        <name>.duckdb                             – hard link לגרסה, אם אין מי שמחזיק
+                                                    אותו פתוח (כלים ישנים / DBeaver)
+    • נשמרות KEEP_VERSIONS הגרסאות האחרונות; rollback = הצבעה לגרסה קודמת.
+כשל באמצע הבנייה ⇒ העותק נמחק והגרסה הפעילה לא השתנתה. בנייה אחת לכל קובץ
+בכל רגע (<name>.building.lock).
+הקוראים (lib/snapshot.js) פותחים את הגרסה שב-.current ב-READ_ONLY ועוברים
+לחדשה כשהמצביע משתנה.
+
+שימוש:
+    python snapshot.py list [DB ...]
+    python snapshot.py rollback DB [--to N]
+"""
+import os, re, sys, time, shutil, pathlib, argparse, contextlib, datetime as dt, duckdb
+sys.path.append(str(pathlib.Path(__file__).resolve().parent / "ETL"))   # etl_metrics
+from etl_metrics import span
+
+FEATURE_DBS = [
+    pathlib.Path(r"C:\RIT\AIBI\feature_store.duckdb"),
+    pathlib.Path(r"C:\RIT\AIBI\feature_store_heb.duckdb"),
+]
+KEEP_VERSIONS    = 5        # גרסאות לשמירה (rollback)
+LOCK_STALE_HOURS = 12       # lock ישן מזה – שארית מתהליך שקרס
+
+
+class SnapshotError(RuntimeError):
+    """הגרסה החדשה לא עברה בדיקה / בנייה אחרת רצה"""
+
+
+def _q(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def versions_dir(db: pathlib.Path) -> pathlib.Path:
+    return db.with_name(f"{db.stem}.snapshots")
+
+
+def pointer(db: pathlib.Path) -> pathlib.Path:
+    return db.with_name(f"{db.stem}.current")
+
+
+def versions(db: pathlib.Path) -> dict[int, pathlib.Path]:
+    """{מספר גרסה: קובץ}"""
+    pat = re.compile(rf"{re.escape(db.stem)}\.v(\d+)\.duckdb$")
+    vdir = versions_dir(db)
+    if not vdir.exists():
+        return {}
+    return {int(m.group(1)): p for p in vdir.iterdir() if (m := pat.match(p.name))}
+
+
+def current(db: pathlib.Path) -> pathlib.Path:
+    """הקובץ הפעיל לפי <name>.current; לפני הפרסום הראשון – db עצמו"""
+    try:
+        rel = pointer(db).read_text(encoding="utf-8").strip()
+    except OSError:
+        return db
+    path = db.parent / rel
+    return path if rel and path.exists() else db
+
+
+def _wal(path: pathlib.Path) -> pathlib.Path:
+    return path.with_name(path.name + ".wal")
+
+
+@contextlib.contextmanager
+def _build_lock(db: pathlib.Path):
+    lock = db.with_name(f"{db.stem}.building.lock")
+    try:
+        fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        if time.time() - lock.stat().st_mtime < LOCK_STALE_HOURS * 3600:
+            raise SnapshotError(f"{db.name}: another build holds {lock.name} "
+                                f"({lock.read_text(encoding='utf-8').strip()})") from None
+        lock.unlink()
+        fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(f"pid {os.getpid()} since {dt.datetime.now():%Y-%m-%d %H:%M:%S}")
+    try:
+        yield
+    finally:
+        lock.unlink(missing_ok=True)
+
+
+def table_counts(con) -> dict[str, int]:
+    tables = [r[0] for r in con.execute("""
+        SELECT table_name FROM information_schema.tables
+        WHERE table_catalog = current_database() AND table_schema = 'main'
+          AND table_type = 'BASE TABLE'""").fetchall()]
+    return {t: con.execute(f"SELECT count(*) FROM {_q(t)}").fetchone()[0] for t in tables}
+
+
+def validate(path: pathlib.Path, before: dict[str, int]) -> dict[str, int]:
+    """בדיקת העותק מול מצב הגרסה שממנה הועתק + CHECKPOINT"""
+    con = duckdb.connect(str(path))
+    try:
+        after = table_counts(con)
+        # טבלאות עבודה (_stage, __loading …) באות והולכות
+        lost = [t for t in before if t not in after and not t.startswith("_") and "__" not in t]
+        emptied = [t for t, n in before.items() if n and after.get(t) == 0]
+        if lost or emptied:
+            raise SnapshotError(f"{path.name}: tables lost {lost}, emptied {emptied} – not published")
+        con.execute("CHECKPOINT")
+    finally:
+        con.close()
+    return after
+
+
+@contextlib.contextmanager
+def staging(db: pathlib.Path, *, fresh: bool = False):
+    """
+    עותק לכתיבה של db; מתפרסם ביציאה מה-with.
+    fresh=True – מתחילים מקובץ ריק (gpt_modeler --reset), בלי השוואה לקודמת.
+    """
+    db = pathlib.Path(db)
+    with _build_lock(db):
+        vdir = versions_dir(db)
+        vdir.mkdir(parents=True, exist_ok=True)
+        for p in vdir.glob("*.building.duckdb*"):
+            p.unlink()                                # שארית מבנייה שקרסה
+        n = max(versions(db), default=0) + 1
+        stage = vdir / f"{db.stem}.v{n:06d}.building.duckdb"
+        src = current(db)
+        before: dict[str, int] = {}
+        if not fresh and src.exists():
+            with span("snapshot_copy") as sp:
+                shutil.copyfile(src, stage)
+                if _wal(src).exists():                # db ישן שלא עבר CHECKPOINT
+                    shutil.copyfile(_wal(src), _wal(stage))
+                sp.add(nbytes=stage.stat().st_size)
+            con = duckdb.connect(str(stage))
+            before = table_counts(con)
+            con.close()
+        try:
+            yield stage
+            with span("snapshot_validate"):
+                validate(stage, before)
+        except BaseException:
+            stage.unlink(missing_ok=True)
+            _wal(stage).unlink(missing_ok=True)
+            raise
+        final = vdir / f"{db.stem}.v{n:06d}.duckdb"
+        os.replace(stage, final)
+        publish(db, final)
+        prune(db)
+        print(f"📦 {db.name}: v{n} published ({final.stat().st_size / 2**20:,.1f} MB)")
+
+
+def publish(db: pathlib.Path, version: pathlib.Path) -> None:
+    """מצביע → version (אטומי), ו-db עצמו כ-hard link אליה אם אפשר"""
+    tmp = pointer(db).with_suffix(".current.tmp")
+    tmp.write_text(version.relative_to(db.parent).as_posix(), encoding="utf-8")
+    os.replace(tmp, pointer(db))
+
+    link = db.with_name(db.name + ".link")
+    link.unlink(missing_ok=True)
+    try:
+        os.link(version, link)
+        _wal(db).unlink(missing_ok=True)              # WAL ישן לא ייושם על הגרסה החדשה
+        os.replace(link, db)
+    except OSError as exc:                            # קורא ישן מחזיק את db / אין hard links
+        link.unlink(missing_ok=True)
+        print(f"[WARN] {db.name} not replaced ({exc.__class__.__name__}) – "
+              f"readers follow {pointer(db).name}")
+
+
+def prune(db: pathlib.Path, keep: int = KEEP_VERSIONS) -> None:
+    active = current(db)
+    vs = versions(db)
+    for n in sorted(vs)[:-keep]:
+        if vs[n] == active:
+            continue
+        try:
+            vs[n].unlink()
+        except PermissionError:                       # קורא עדיין פתוח עליה – בפעם הבאה
+            continue
+        _wal(vs[n]).unlink(missing_ok=True)
+
+
+def rollback(db: pathlib.Path, to: int | None = None) -> pathlib.Path:
+    vs = versions(db)
+    active = current(db)
+    cur = next((n for n, p in vs.items() if p == active), None)
+    if to is None:
+        older = [n for n in vs if cur is None or n < cur]
+        if not older:
+            raise SnapshotError(f"{db.name}: no older version to roll back to")
+        to = max(older)
+    if to not in vs:
+        raise SnapshotError(f"{db.name}: version {to} not found (have {sorted(vs)})")
+    publish(db, vs[to])
+    print(f"↩ {db.name}: v{cur} → v{to}")
+    return vs[to]
+
+
+def main(argv: list[str] | None = None):
+    ap = argparse.ArgumentParser(description="published DuckDB snapshots")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    ls = sub.add_parser("list", help="show versions")
+    ls.add_argument("dbs", nargs="*", type=pathlib.Path)
+    rb = sub.add_parser("rollback", help="point readers at an older version")
+    rb.add_argument("db", type=pathlib.Path)
+    rb.add_argument("--to", type=int, help="version number (default: the previous one)")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "rollback":
+        rollback(args.db, args.to)
+        return
+    for db in args.dbs or FEATURE_DBS:
+        active = current(db)
+        print(f"{db.name}:")
+        for n, p in sorted(versions(db).items()):
+            mark = "*" if p == active else " "
+            stamp = dt.datetime.fromtimestamp(p.stat().st_mtime)
+            print(f"  {mark} v{n:<6d} {stamp:%Y-%m-%d %H:%M}  {p.stat().st_size / 2**20:10,.1f} MB")
+
+
+if __name__ == "__main__":
+    main()